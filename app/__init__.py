@@ -1,5 +1,7 @@
 import atexit
+import multiprocessing
 import os
+from datetime import datetime
 import pytz
 import logging
 from logging.handlers import RotatingFileHandler
@@ -91,6 +93,9 @@ def create_app(config_name='default'):
     # 创建数据库表（推送上下文）
     with app.app_context():
         db.create_all()
+        # 全文检索虚拟表不在 ORM 元数据中，需单独创建
+        from app.search import ensure_search_index
+        ensure_search_index()
 
     # ===================== APScheduler 核心逻辑 =====================
     app.logger.info("="*50)
@@ -108,6 +113,14 @@ def create_app(config_name='default'):
     if app.debug and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
         start_scheduler = False
         app.logger.warning("调试：开发环境debug模式（非主进程），跳过调度器启动")
+    elif app.testing:
+        # 测试环境不启动后台任务（事件到期即触发，会改动测试数据），测试中直接调用任务函数
+        start_scheduler = False
+        app.logger.info("调试：测试环境，跳过调度器启动")
+    elif multiprocessing.parent_process() is not None:
+        # 进程池子进程（spawn 启动时会重新导入主模块）只做计算，不运行后台任务
+        start_scheduler = False
+        app.logger.info("调试：进程池子进程，跳过调度器启动")
     else:
         app.logger.info(f"调试：调度器启动条件 → start_scheduler = {start_scheduler}")
 
@@ -115,7 +128,9 @@ def create_app(config_name='default'):
     if start_scheduler and scheduler is None:
         app.logger.info("调试：进入调度器初始化逻辑")
         try:
-            from app.tasks import update_reservation_status, check_overdue_records
+            from app.tasks import (update_reservation_status, check_overdue_records, archive_history_task,
+                                   retry_notifications_task)
+            from app.reservation_timeline import timeline
             app.logger.info("调试：任务函数导入成功")
 
             # 初始化调度器（指定时区）
@@ -135,24 +150,82 @@ def create_app(config_name='default'):
                     check_overdue_records()
                 app.logger.info("调试：check_overdue_records 任务执行完成")
 
+            def wrapped_archive_history():
+                app.logger.info("调试：archive_history_task 任务执行开始")
+                with app.app_context():
+                    archive_history_task()
+                app.logger.info("调试：archive_history_task 任务执行完成")
+
+            def wrapped_retry_notifications():
+                app.logger.info("调试：retry_notifications_task 任务执行开始")
+                with app.app_context():
+                    retry_notifications_task()
+                app.logger.info("调试：retry_notifications_task 任务执行完成")
+
+            def wrapped_resync_reservation_timeline():
+                app.logger.info("调试：update_reservation_status（重建事件堆）任务执行开始")
+                with app.app_context():
+                    update_reservation_status(rebuild=True)
+                app.logger.info("调试：update_reservation_status（重建事件堆）任务执行完成")
+
+            # 预约状态：事件驱动，只保留一个 date 任务，触发时间为事件堆中最早的到期时间
+            def arm_reservation_timeline(next_due):
+                if next_due is None:
+                    if scheduler.get_job('update_reservation_status_task'):
+                        scheduler.remove_job('update_reservation_status_task')
+                    return
+                run_date = max(pytz.utc.localize(next_due), datetime.now(pytz.utc))
+                scheduler.add_job(
+                    func=wrapped_update_reservation_status,
+                    trigger='date',
+                    run_date=run_date,
+                    id='update_reservation_status_task',
+                    misfire_grace_time=None,
+                    replace_existing=True
+                )
+
             # 添加任务
+            timeline.on_change = arm_reservation_timeline
+            timeline.enabled = True
+            with app.app_context():
+                count = timeline.rebuild()
+            app.logger.info(f"已添加任务：update_reservation_status_task（事件驱动，未结束预约 {count} 个）")
+
             scheduler.add_job(
-                func=wrapped_update_reservation_status,
+                func=wrapped_resync_reservation_timeline,
                 trigger='interval',
-                seconds=30,
-                id='update_reservation_status_task',
+                minutes=app.config['RESERVATION_RESYNC_MINUTES'],
+                id='resync_reservation_timeline_task',
                 replace_existing=True
             )
-            app.logger.info("已添加任务：update_reservation_status_task（每30秒）")
+            app.logger.info(f"已添加任务：resync_reservation_timeline_task（每{app.config['RESERVATION_RESYNC_MINUTES']}分钟）")
 
             scheduler.add_job(
                 func=wrapped_check_overdue_records,
                 trigger='interval',
-                hours=1,
+                hours=app.config['OVERDUE_CHECK_INTERVAL_HOURS'],
                 id='check_overdue_records_task',
                 replace_existing=True
             )
-            app.logger.info("已添加任务：check_overdue_records_task（每1小时）")
+            app.logger.info(f"已添加任务：check_overdue_records_task（每{app.config['OVERDUE_CHECK_INTERVAL_HOURS']}小时）")
+
+            scheduler.add_job(
+                func=wrapped_archive_history,
+                trigger='interval',
+                hours=app.config['ARCHIVE_INTERVAL_HOURS'],
+                id='archive_history_task',
+                replace_existing=True
+            )
+            app.logger.info(f"已添加任务：archive_history_task（每{app.config['ARCHIVE_INTERVAL_HOURS']}小时）")
+
+            scheduler.add_job(
+                func=wrapped_retry_notifications,
+                trigger='interval',
+                minutes=app.config['NOTIFICATION_RETRY_INTERVAL_MINUTES'],
+                id='retry_notifications_task',
+                replace_existing=True
+            )
+            app.logger.info(f"已添加任务：retry_notifications_task（每{app.config['NOTIFICATION_RETRY_INTERVAL_MINUTES']}分钟）")
 
             # 启动调度器
             scheduler.start()
@@ -0,0 +1,73 @@
+"""
+冷数据归档
+- 已归还的使用记录、已结束（expired / cancelled / used）的预约，结束时间早于 ARCHIVE_AFTER_DAYS 天前的，
+  按批（ARCHIVE_BATCH_SIZE）从热表移入 record_archive / reservation_archive，每批一次提交
+- 热表只保留进行中的数据（using / scheduled / active / conflicted 及近期历史），
+  其大小取决于同时进行的业务量，而不是历史年限
+- 历史列表页通过 RecordHistory / ReservationHistory 视图同时读取热表和归档表
+- 归档使用批量 SQL，不触发 ORM 事件：物品快照在此同步失效；归档行沿用原主键，
+  全文检索文档保持不变，全局搜索通过 RecordHistory 继续命中归档记录
+"""
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, literal
+
+from app import db
+from app.item_snapshot import invalidate_item_snapshots
+
+ARCHIVED_RESERVATION_STATUSES = ('expired', 'cancelled', 'used')
+
+
+def _move_batches(hot, archive, condition, batch_size, now):
+    """按主键顺序分批执行 INSERT ... SELECT + DELETE，返回移动的行数"""
+    hot_table, archive_table = hot.__table__, archive.__table__
+    columns = [column.name for column in hot_table.columns]
+    total = 0
+    while True:
+        rows = db.session.execute(
+            select(hot_table.c.id, hot_table.c.item_id).where(condition).order_by(hot_table.c.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        ids = [row.id for row in rows]
+        db.session.execute(archive_table.insert().from_select(
+            columns + ['archived_at'],
+            select(*(hot_table.c[column] for column in columns), literal(now)).where(hot_table.c.id.in_(ids))
+        ))
+        db.session.execute(hot_table.delete().where(hot_table.c.id.in_(ids)))
+        db.session.commit()
+        invalidate_item_snapshots({row.item_id for row in rows})
+        total += len(ids)
+        if len(ids) < batch_size:
+            break
+    return total
+
+
+def archive_history(older_than_days=None, batch_size=None):
+    """
+    执行一次归档
+    :param older_than_days: 结束超过多少天的数据移入归档表，默认 ARCHIVE_AFTER_DAYS
+    :param batch_size: 每批行数，默认 ARCHIVE_BATCH_SIZE
+    :return: {'records': 归档记录数, 'reservations': 归档预约数}
+    """
+    from app.models import Record, RecordArchive, Reservation, ReservationArchive
+
+    older_than_days = older_than_days if older_than_days is not None else current_app.config['ARCHIVE_AFTER_DAYS']
+    batch_size = batch_size or current_app.config['ARCHIVE_BATCH_SIZE']
+    now = datetime.utcnow()
+    cutoff = now - timedelta(days=older_than_days)
+
+    # 开始时间条件是冗余的（结束早于 cutoff 则开始必然更早），用于命中 (status, 开始时间) 索引
+    records = _move_batches(
+        Record, RecordArchive,
+        (Record.status == 'returned') & (Record._utc_start_time < cutoff) & (Record._utc_return_time < cutoff),
+        batch_size, now
+    )
+    reservations = _move_batches(
+        Reservation, ReservationArchive,
+        Reservation.status.in_(ARCHIVED_RESERVATION_STATUSES) & (Reservation._utc_reservation_start < cutoff)
+        & (Reservation._utc_reservation_end < cutoff),
+        batch_size, now
+    )
+    return {'records': records, 'reservations': reservations}
@@ -0,0 +1,177 @@
+"""
+物品可预约时段（预约日历）
+- 占用区间：scheduled / active / conflicted 预约的预约时段，以及未归还（using）记录从借出时间起的全部时间
+- 按 (物品, 本地日期) 缓存当天的占用区间（AVAILABILITY_CACHE_TTL 秒），缺失的天一次查询补齐：
+  预约按 (物品, 状态, 开始, 结束) 复合索引、记录按使用中部分索引做区间查询
+- 任意使用记录 / 预约 / 物品变更提交后，通过会话事件使对应物品的缓存失效（批量 SQL 路径需调用 invalidate_availability）
+注意：缓存为进程内缓存，多进程部署时其他 worker 最多在 TTL 内读到旧状态；创建预约时仍以数据库重叠检查为准
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytz
+from flask import current_app
+from sqlalchemy import event, select
+
+from app import db
+
+LOCAL_TIMEZONE = pytz.timezone('Asia/Shanghai')
+BUSY_RESERVATION_STATUSES = ('scheduled', 'active', 'conflicted')
+CACHE_MAX_ITEMS = 5000
+
+_lock = threading.Lock()
+_day_cache = {}  # item_id -> {本地日期: (过期时间, [(开始UTC, 结束UTC, 类型, 状态)])}
+
+
+class BusyInterval:
+    """占用区间（UTC），kind 为 reservation / record"""
+    __slots__ = ('start', 'end', 'kind', 'status')
+
+    def __init__(self, start, end, kind, status):
+        self.start = start
+        self.end = end
+        self.kind = kind
+        self.status = status
+
+
+def local_day_bounds(day):
+    """本地日期 -> 当天 [开始, 结束) 的 UTC 时间（naive）"""
+    start = LOCAL_TIMEZONE.localize(datetime.combine(day, datetime.min.time()))
+    end = LOCAL_TIMEZONE.localize(datetime.combine(day + timedelta(days=1), datetime.min.time()))
+    return start.astimezone(pytz.utc).replace(tzinfo=None), end.astimezone(pytz.utc).replace(tzinfo=None)
+
+
+def _load_days(item_ids, days):
+    """一次查询读取多个物品在若干天内的占用区间，返回 {(item_id, day): [区间]}（包括空列表）"""
+    from app.models import Record, Reservation
+
+    range_start, _ = local_day_bounds(days[0])
+    _, range_end = local_day_bounds(days[-1])
+    intervals = {item_id: [] for item_id in item_ids}
+
+    reservations = db.session.execute(
+        select(Reservation.item_id, Reservation._utc_reservation_start, Reservation._utc_reservation_end,
+               Reservation.status).where(
+            Reservation.item_id.in_(item_ids),
+            Reservation.status.in_(BUSY_RESERVATION_STATUSES),
+            Reservation._utc_reservation_start < range_end,
+            Reservation._utc_reservation_end > range_start
+        )
+    )
+    for item_id, start, end, status in reservations:
+        intervals[item_id].append((start, end, 'reservation', status))
+
+    # 未归还的记录没有结束时间：从借出起一直占用，直到归还
+    records = db.session.execute(
+        select(Record.item_id, Record._utc_start_time).where(
+            Record.item_id.in_(item_ids),
+            Record.status == 'using',
+            Record._utc_start_time < range_end
+        )
+    )
+    for item_id, start in records:
+        intervals[item_id].append((start or range_start, range_end, 'record', 'using'))
+
+    result = {}
+    for day in days:
+        day_start, day_end = local_day_bounds(day)
+        for item_id, rows in intervals.items():
+            result[(item_id, day)] = sorted(
+                (max(start, day_start), min(end, day_end), kind, status)
+                for start, end, kind, status in rows if start < day_end and end > day_start
+            )
+    return result
+
+
+def busy_intervals(item_ids, first_day, days):
+    """
+    多个物品从 first_day 起 days 天内的占用区间（按天缓存）
+    :return: {item_id: [BusyInterval]}，跨天的区间已合并，按开始时间排序
+    """
+    ttl = current_app.config.get('AVAILABILITY_CACHE_TTL', 60)
+    day_list = [first_day + timedelta(days=offset) for offset in range(days)]
+    now = time.monotonic()
+
+    cached, missing_items = {}, set()
+    with _lock:
+        for item_id in item_ids:
+            item_days = _day_cache.get(item_id, {}) if ttl else {}
+            for day in day_list:
+                hit = item_days.get(day)
+                if hit and hit[0] > now:
+                    cached[(item_id, day)] = hit[1]
+                else:
+                    missing_items.add(item_id)
+
+    if missing_items:
+        # 缺失的物品整段重新读取（一次查询），同时刷新这些物品所有天的缓存
+        loaded = _load_days(sorted(missing_items), day_list)
+        cached.update(loaded)
+        if ttl:
+            with _lock:
+                if len(_day_cache) + len(missing_items) > CACHE_MAX_ITEMS:
+                    _day_cache.clear()
+                for (item_id, day), rows in loaded.items():
+                    _day_cache.setdefault(item_id, {})[day] = (now + ttl, rows)
+
+    result = {}
+    for item_id in item_ids:
+        merged = []
+        for day in day_list:
+            for start, end, kind, status in cached[(item_id, day)]:
+                last = merged[-1] if merged else None
+                # 同一预约 / 记录被按天切开的部分重新拼接
+                if last and last.end == start and (last.kind, last.status) == (kind, status):
+                    last.end = end
+                else:
+                    merged.append(BusyInterval(start, end, kind, status))
+        result[item_id] = merged
+    return result
+
+
+def free_intervals(busy, range_start, range_end):
+    """[range_start, range_end) 中除去占用区间后的空闲区间 [(开始UTC, 结束UTC)]"""
+    free, cursor = [], range_start
+    for interval in sorted(busy, key=lambda b: b.start):
+        if interval.start > cursor:
+            free.append((cursor, min(interval.start, range_end)))
+        cursor = max(cursor, interval.end)
+        if cursor >= range_end:
+            break
+    if cursor < range_end:
+        free.append((cursor, range_end))
+    return [(start, end) for start, end in free if end > start]
+
+
+def invalidate_availability(item_ids):
+    with _lock:
+        for item_id in item_ids:
+            _day_cache.pop(item_id, None)
+
+
+# --- 失效：提交后清除受影响物品的缓存 ---
+def _collect_availability_item_ids(session, flush_context):
+    from app.models import Item, Record, Reservation
+
+    touched = session.info.setdefault('availability_item_ids', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Item):
+            touched.add(obj.id)
+        elif isinstance(obj, (Record, Reservation)):
+            touched.add(obj.item_id)
+
+
+def _invalidate_after_commit(session):
+    item_ids = session.info.pop('availability_item_ids', None)
+    if item_ids:
+        invalidate_availability(item_ids)
+
+
+def _discard_availability_item_ids(session):
+    session.info.pop('availability_item_ids', None)
+
+
+event.listen(db.session, 'after_flush', _collect_availability_item_ids)
+event.listen(db.session, 'after_commit', _invalidate_after_commit)
+event.listen(db.session, 'after_rollback', _discard_availability_item_ids)
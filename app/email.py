@@ -10,15 +10,46 @@ def send_async_email(app, msg):
         mail.send(msg)
 
 
-def send_email(to, subject, template, **kwargs):
-    """发送邮件的通用函数"""
+def send_bulk_async_email(app, messages, on_result=None):
+    """
+    异步批量发送邮件（共用一个 SMTP 连接）
+    on_result(errors)：发送结束后在应用上下文中回调，errors 与 messages 一一对应，成功为 None
+    """
+    with app.app_context():
+        errors = [None] * len(messages)
+        attempted = 0
+        try:
+            with mail.connect() as conn:
+                for index, msg in enumerate(messages):
+                    attempted = index + 1
+                    try:
+                        conn.send(msg)
+                    except Exception as e:
+                        errors[index] = str(e)
+        except Exception as e:
+            # 连接失败：尚未尝试发送的邮件全部记为失败
+            errors[attempted:] = [str(e)] * (len(messages) - attempted)
+            if not on_result:
+                raise
+        if on_result:
+            on_result(errors)
+
+
+def build_message(to, subject, template, **kwargs):
+    """渲染邮件（to 可以是单个地址或地址列表）"""
     # 使用current_app获取配置，避免直接引用app实例
     msg = Message(
         subject=current_app.config['MAIL_SUBJECT_PREFIX'] + subject,
         sender=current_app.config['MAIL_SENDER'],
-        recipients=[to]
+        recipients=[to] if isinstance(to, str) else list(to)
     )
     msg.html = render_template(template, **kwargs)
+    return msg
+
+
+def send_email(to, subject, template, **kwargs):
+    """发送邮件的通用函数"""
+    msg = build_message(to, subject, template, **kwargs)
 
     # 获取当前应用实例
     app = current_app._get_current_object()
@@ -27,6 +58,16 @@ def send_email(to, subject, template, **kwargs):
     return thr
 
 
+def send_messages(messages, on_result=None):
+    """在一个后台线程中通过同一个 SMTP 连接发送多封已渲染的邮件"""
+    if not messages:
+        return None
+    app = current_app._get_current_object()
+    thr = Thread(target=send_bulk_async_email, args=[app, list(messages), on_result])
+    thr.start()
+    return thr
+
+
 def send_password_reset_email(user):
     """发送密码重置邮件"""
     token = user.get_reset_password_token()
@@ -37,28 +78,3 @@ def send_password_reset_email(user):
         user=user,
         token=token
     )
-
-
-def send_overdue_reminder(record, recipient_type='user'):
-    """发送逾期提醒邮件"""
-    from app.models import User
-    from datetime import datetime
-
-    if recipient_type == 'user':
-        recipient = record.user.email
-        subject = '物品逾期提醒'
-    else:
-        admin = User.query.filter_by(is_admin=True).first()
-        if not admin:
-            return
-        recipient = admin.email
-        subject = f'用户 {record.user.username} 的物品已逾期'
-
-    send_email(
-        recipient,
-        subject,
-        'records/email/overdue_reminder.html',
-        record=record,
-        recipient_type=recipient_type,
-        datetime=datetime
-    )
@@ -0,0 +1,194 @@
+"""
+数据导出（CSV / JSONL，可选 gzip）
+- 筛选条件与 items.all_items / records.all_records / reservations.all_reservations 列表一致；
+  使用记录和预约与列表页一样读取热表 + 归档表（RecordHistory / reservation_history_full），归档后的数据同样导出
+- 只查询导出所需的列（不构造 ORM 对象），通过 yield_per 分批读取游标，按块生成输出：
+  内存占用与导出行数无关，第一块数据读取后即可开始发送
+- 时间列按本地时区（Asia/Shanghai）输出
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+import pytz
+from flask import Response, stream_with_context
+from sqlalchemy import select
+
+from app import db
+from app.search import filter_by_search
+
+LOCAL_TIMEZONE = pytz.timezone('Asia/Shanghai')
+
+EXPORT_KINDS = ('items', 'records', 'reservations')
+EXPORT_FORMATS = ('csv', 'jsonl')
+EXPORT_MIMETYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+# 每次从游标读取的行数 / 输出块大小（字节）
+YIELD_PER = 1000
+CHUNK_SIZE = 64 * 1024
+
+RESERVATION_STATUSES = ['scheduled', 'active', 'expired', 'cancelled', 'used', 'conflicted']
+
+
+def _local_time(utc_time):
+    if not utc_time:
+        return None
+    return pytz.utc.localize(utc_time).astimezone(LOCAL_TIMEZONE).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _items_statement(filters):
+    from app.models import Item, Space
+
+    stmt = select(
+        Item.id, Item.name, Item.serial_number, Item.function, Item.status,
+        Space.full_path.label('space_path'),
+        Item._utc_created_at.label('created_at'), Item._utc_updated_at.label('updated_at')
+    ).outerjoin(Space, Item.space_id == Space.id)
+
+    query = filters.get('query', '').strip()
+    if query:
+        stmt = filter_by_search(stmt, 'item', query)
+    if filters.get('status'):
+        stmt = stmt.where(Item.status == filters['status'])
+    return stmt.order_by(Item.id)
+
+
+def _records_statement(filters):
+    from app.models import Item, RecordHistory as Record, User
+
+    stmt = select(
+        Record.id, Record.item_id, Item.name.label('item_name'), Item.serial_number, User.username,
+        Record.space_path, Record.usage_location, Record.status,
+        Record._utc_start_time.label('start_time'), Record._utc_return_time.label('return_time')
+    ).outerjoin(Item, Record.item_id == Item.id).outerjoin(User, Record.user_id == User.id)
+
+    if filters.get('username', '').strip():
+        stmt = stmt.where(User.username.ilike(f"%{filters['username'].strip()}%"))
+    if filters.get('item_name', '').strip():
+        stmt = stmt.where(Item.name.ilike(f"%{filters['item_name'].strip()}%"))
+    if filters.get('status'):
+        stmt = stmt.where(Record.status == filters['status'])
+    return stmt.order_by(Record._utc_start_time.desc(), Record.id.desc())
+
+
+def _reservations_statement(filters):
+    from app.models import Item, User, reservation_history_full
+
+    # 列表页的 ReservationHistory 只带备注摘要，导出需要完整备注
+    reservation = reservation_history_full.c
+    stmt = select(
+        reservation.id, reservation.item_id, Item.name.label('item_name'), Item.serial_number, User.username,
+        reservation.status, reservation.reservation_start, reservation.reservation_end, reservation.created_at,
+        reservation.notes
+    ).outerjoin(Item, reservation.item_id == Item.id).outerjoin(User, reservation.user_id == User.id)
+
+    if filters.get('status') in RESERVATION_STATUSES:
+        stmt = stmt.where(reservation.status == filters['status'])
+    if filters.get('item_name', '').strip():
+        stmt = stmt.where(Item.name.ilike(f"%{filters['item_name'].strip()}%"))
+    if filters.get('username', '').strip():
+        stmt = stmt.where(User.username.ilike(f"%{filters['username'].strip()}%"))
+    return stmt.order_by(reservation.reservation_start.desc(), reservation.id.desc())
+
+
+_STATEMENTS = {
+    'items': (_items_statement, ('created_at', 'updated_at')),
+    'records': (_records_statement, ('start_time', 'return_time')),
+    'reservations': (_reservations_statement, ('reservation_start', 'reservation_end', 'created_at')),
+}
+
+
+def export_statement(kind, filters=None):
+    """构造导出查询（列表页相同的筛选条件），返回 (select, 时间列名集合)"""
+    build, time_columns = _STATEMENTS[kind]
+    return build(filters or {}), set(time_columns)
+
+
+def _iter_rows(stmt, time_columns):
+    result = db.session.execute(stmt.execution_options(yield_per=YIELD_PER))
+    keys = list(result.keys())
+    for row in result:
+        record = dict(zip(keys, row))
+        for key in time_columns:
+            record[key] = _local_time(record[key])
+        yield record
+
+
+def iter_export_rows(kind, filters=None):
+    """逐行返回导出数据（dict），底层按 YIELD_PER 行分批读取游标"""
+    return _iter_rows(*export_statement(kind, filters))
+
+
+def _iter_csv_chunks(kind, filters):
+    stmt, time_columns = export_statement(kind, filters)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # 表头立即输出（没有数据时也是合法的 CSV），之后按块输出
+    writer.writerow(column.key for column in stmt.selected_columns)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    for record in _iter_rows(stmt, time_columns):
+        writer.writerow(['' if value is None else value for value in record.values()])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _iter_jsonl_chunks(kind, filters):
+    lines, size = [], 0
+    for record in iter_export_rows(kind, filters):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        lines.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield ''.join(lines)
+            lines, size = [], 0
+    yield ''.join(lines)
+
+
+def _gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=31)  # 31：gzip 文件头
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def iter_export(kind, fmt='csv', filters=None, gzip=False):
+    """
+    按块生成导出文件内容（bytes）
+    :param kind: 'items' / 'records' / 'reservations'
+    :param fmt: 'csv' / 'jsonl'；CSV 带 UTF-8 BOM，便于 Excel 直接打开
+    :param filters: 列表页同名的筛选参数
+    :param gzip: 是否输出 gzip 压缩流
+    """
+    if fmt == 'csv':
+        chunks = _iter_csv_chunks(kind, filters)
+        encoded = ('\ufeff' + chunk if i == 0 else chunk for i, chunk in enumerate(chunks))
+    else:
+        encoded = _iter_jsonl_chunks(kind, filters)
+    encoded = (chunk.encode('utf-8') for chunk in encoded)
+    return _gzip_chunks(encoded) if gzip else encoded
+
+
+def export_response(kind, args):
+    """
+    根据请求参数生成流式下载响应
+    format=csv|jsonl（默认 csv），gzip=1 时压缩；其余参数作为列表筛选条件
+    """
+    fmt = args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        fmt = 'csv'
+    gzip = args.get('gzip', '') in ('1', 'true', 'on')
+    filename = f'{kind}_{datetime.now().strftime("%Y%m%d%H%M")}.{fmt}' + ('.gz' if gzip else '')
+    return Response(
+        stream_with_context(iter_export(kind, fmt, args.to_dict(), gzip=gzip)),
+        mimetype='application/gzip' if gzip else f'{EXPORT_MIMETYPES[fmt]}; charset=utf-8',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
@@ -1,7 +1,33 @@
+from flask import current_app
 from flask_wtf import FlaskForm
-from wtforms import StringField, TextAreaField, SelectField, SubmitField
+from flask_wtf.file import FileField, FileRequired, FileAllowed
+from wtforms import StringField, TextAreaField, SelectField, SubmitField, BooleanField
 from wtforms.validators import DataRequired, Length, ValidationError, Optional
 from app.models import Item, Space
+from app.space_tree import get_cached_space_choices, get_cached_node
+
+
+class SpaceSelectField(SelectField):
+    """
+    所属空间下拉框
+    typeahead 模式下只保留当前选中的空间作为合法选项，
+    在渲染/校验时才根据 data 计算（路由可能在构造表单之后才设置 space_id.data）
+    """
+    typeahead = False
+
+    def iter_choices(self):
+        if self.typeahead:
+            self.choices = self._selected_choice()
+        return super().iter_choices()
+
+    def _selected_choice(self):
+        if not self.data:
+            return []
+        node = get_cached_node(self.data)
+        if node is not None:
+            return [(node.id, node.get_path())]
+        space = Space.query.get(self.data)
+        return [(space.id, space.get_path())] if space else []
 
 
 class ItemForm(FlaskForm):
@@ -20,15 +46,29 @@ class ItemForm(FlaskForm):
         ('borrowed', '已借出'),
         ('reserved', '已预约')
     ], validators=[Optional()])
-    space_id = SelectField('所属空间', coerce=int, validators=[DataRequired()])
+    space_id = SpaceSelectField('所属空间', coerce=int, validators=[DataRequired()])
     submit = SubmitField('保存')
 
     def __init__(self, item_id=None, *args, **kwargs):
         super(ItemForm, self).__init__(*args, **kwargs)
-        self.space_id.choices = [(space.id, space.get_path()) for space in Space.query.all()]
+        choices = get_cached_space_choices()
+        # 空间数量超过阈值时不再内嵌全部选项，改由前端调用路径搜索接口（typeahead）
+        self.use_typeahead = len(choices) > current_app.config.get('SPACE_CHOICES_MAX', 500)
+        self.space_id.typeahead = self.use_typeahead
+        self.space_id.choices = [] if self.use_typeahead else choices
         self.item_id = item_id
 
     def validate_serial_number(self, serial_number):
         item = Item.query.filter_by(serial_number=serial_number.data).first()
         if item is not None and item.id != self.item_id:
             raise ValidationError('该编号已被使用，请使用其他编号')
+
+
+class ItemImportForm(FlaskForm):
+    """物品批量导入（CSV / XLSX）"""
+    file = FileField('导入文件', validators=[
+        FileRequired('请选择要导入的文件'), FileAllowed(['csv', 'xlsx'], '仅支持 CSV 或 XLSX 文件')
+    ])
+    dry_run = BooleanField('仅预检查（不写入数据）', default=True)
+    create_spaces = BooleanField('自动创建不存在的空间', default=True)
+    submit = SubmitField('导入')
@@ -0,0 +1,290 @@
+"""
+物品批量导入（CSV / XLSX）
+- 先整体校验（必填项、长度、状态值、文件内及数据库中的重复编号、空间路径），有错误时不写入任何数据
+- 空间路径形如 "A栋/3楼/301"，不存在的空间可按路径逐级自动创建
+- 已有空间按路径直接查询数据库（不使用进程内空间树缓存，避免多进程部署时读到其他进程已改动的旧树）；
+  路径对应多个同名空间时报告为该行错误，不任意选择其一
+- 物品按批插入，每批一次提交；某一批写入失败时只回滚该批，报告中记录已写入和未写入的行
+- 二维码不在导入过程中生成，导入完成后统一排队生成
+- dry_run=True 时只返回校验报告
+XLSX 需要安装 openpyxl（可选依赖），CSV 无额外依赖
+"""
+import csv
+import io
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db
+from app.space_tree import bump_space_version
+
+# 表头别名 -> 字段名
+COLUMN_ALIASES = {
+    'name': 'name', '名称': 'name', '物品名称': 'name',
+    'serial_number': 'serial_number', 'serial': 'serial_number', '编号': 'serial_number', '物品编号': 'serial_number',
+    'function': 'function', '功能': 'function', '功能描述': 'function', '描述': 'function',
+    'space_path': 'space_path', 'space': 'space_path', '空间': 'space_path', '所属空间': 'space_path',
+    '空间路径': 'space_path',
+    'status': 'status', '状态': 'status',
+}
+
+ITEM_STATUSES = ('available', 'borrowed', 'reserved')
+
+
+class ItemImportError(Exception):
+    """导入文件无法读取（格式不支持、缺少依赖或缺少必需列）"""
+
+
+class ImportReport:
+    """导入报告：校验错误、待创建空间以及实际写入结果"""
+
+    def __init__(self):
+        self.total = 0
+        self.rows = []
+        self.errors = []
+        self.new_space_paths = []
+        self.created_spaces = 0
+        self.created_items = 0
+        self.item_ids = []
+        self.committed_lines = []
+        self.failed = []
+        self.dry_run = True
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def add_error(self, line, message):
+        self.errors.append((line, message))
+
+    def add_failure(self, rows, message):
+        """写入阶段失败：这些行未导入"""
+        self.failed.extend((row['line'], message) for row in rows)
+
+    def summary(self):
+        if self.errors:
+            return f'共 {self.total} 行，发现 {len(self.errors)} 处错误，未导入任何数据'
+        if self.dry_run:
+            return (f'校验通过：共 {self.total} 行，可导入 {len(self.rows)} 个物品，'
+                    f'需新建 {len(self.new_space_paths)} 个空间（预检查，未写入）')
+        if self.failed:
+            return (f'部分导入：新建 {self.created_items} 个物品、{self.created_spaces} 个空间，'
+                    f'{len(self.failed)} 行写入失败未导入')
+        return f'导入完成：新建 {self.created_items} 个物品、{self.created_spaces} 个空间'
+
+
+def normalize_space_path(value):
+    """统一路径分隔符并去掉多余空白，如 " A栋 / 3楼\\301 " -> "A栋/3楼/301" """
+    parts = [part.strip() for part in str(value or '').replace('\\', '/').split('/')]
+    return '/'.join(part for part in parts if part)
+
+
+def _path_prefixes(path):
+    parts = path.split('/')
+    return ['/'.join(parts[:depth]) for depth in range(1, len(parts))]
+
+
+def resolve_space_paths(paths):
+    """
+    按物化路径查询已存在的空间（分批 IN 查询）
+    full_path 不唯一：同一上级下的同名空间会得到相同路径，这样的路径无法确定指向哪个空间
+    :return: ({路径: 空间ID}, 对应多个空间的路径集合)；歧义路径不出现在映射中
+    """
+    from app.models import Space
+
+    paths = sorted(set(paths))
+    matches = {}
+    for start in range(0, len(paths), 500):
+        for space_id, path in db.session.query(Space.id, Space.full_path).filter(
+                Space.full_path.in_(paths[start:start + 500])):
+            matches.setdefault(path, []).append(space_id)
+    ambiguous = {path for path, ids in matches.items() if len(ids) > 1}
+    return {path: ids[0] for path, ids in matches.items() if path not in ambiguous}, ambiguous
+
+
+def _normalize_header(header):
+    return COLUMN_ALIASES.get(str(header or '').strip().lower(), COLUMN_ALIASES.get(str(header or '').strip()))
+
+
+def read_rows(stream, filename):
+    """
+    读取上传文件，逐行返回 (行号, {字段: 值})；行号从表头下一行的 2 开始
+    :param stream: 二进制文件对象
+    """
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension == 'csv':
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+        reader = csv.reader(text)
+    elif extension == 'xlsx':
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ItemImportError('读取 XLSX 需要安装 openpyxl，或将表格另存为 CSV 后导入')
+        sheet = load_workbook(stream, read_only=True, data_only=True).active
+        reader = (['' if cell is None else str(cell) for cell in row] for row in sheet.iter_rows(values_only=True))
+    else:
+        raise ItemImportError('仅支持 .csv 或 .xlsx 文件')
+
+    try:
+        headers = next(reader, None)
+        if not headers:
+            raise ItemImportError('文件为空')
+        fields = [_normalize_header(header) for header in headers]
+        missing = {'name', 'serial_number', 'space_path'} - set(fields)
+        if missing:
+            raise ItemImportError(f'缺少必需列：{", ".join(sorted(missing))}')
+
+        for line, values in enumerate(reader, 2):
+            if not any(str(value).strip() for value in values):
+                continue
+            yield line, {field: str(value).strip() for field, value in zip(fields, values) if field}
+    except UnicodeDecodeError:
+        raise ItemImportError('CSV 文件需使用 UTF-8 编码保存')
+
+
+def validate_rows(rows, create_spaces=True):
+    """
+    整体校验导入数据，返回 ImportReport（rows 为通过校验的物品数据）
+    :param create_spaces: 为 False 时不存在的空间路径视为错误
+    """
+    from app.models import Item
+
+    report = ImportReport()
+    rows = [(line, row, normalize_space_path(row.get('space_path'))) for line, row in rows]
+    row_paths = {space_path for _, _, space_path in rows if space_path}
+    existing_paths, ambiguous_paths = resolve_space_paths(
+        row_paths.union(*(_path_prefixes(path) for path in row_paths)))
+    seen_serials = {}
+    new_paths = set()
+
+    for line, row, space_path in rows:
+        report.total += 1
+        name = row.get('name', '')
+        serial = row.get('serial_number', '')
+        status = row.get('status') or 'available'
+
+        if not name or len(name) > 100:
+            report.add_error(line, '物品名称为空或超过 100 个字符')
+        if not serial or len(serial) > 50:
+            report.add_error(line, '物品编号为空或超过 50 个字符')
+        elif serial in seen_serials:
+            report.add_error(line, f'物品编号 {serial} 与第 {seen_serials[serial]} 行重复')
+        else:
+            seen_serials[serial] = line
+        if status not in ITEM_STATUSES:
+            report.add_error(line, f'状态 {status} 无效（可选：{", ".join(ITEM_STATUSES)}）')
+        ambiguous = [path for path in _path_prefixes(space_path) + [space_path] if path in ambiguous_paths]
+        if not space_path:
+            report.add_error(line, '所属空间为空')
+        elif ambiguous:
+            report.add_error(line, f'空间路径 {ambiguous[0]} 对应多个同名空间，无法确定归属，请先重命名其中之一')
+        elif space_path not in existing_paths:
+            if create_spaces:
+                new_paths.add(space_path)
+            else:
+                report.add_error(line, f'空间 {space_path} 不存在')
+
+        report.rows.append({
+            'line': line, 'name': name, 'serial_number': serial, 'function': row.get('function') or None,
+            'space_path': space_path, 'status': status,
+        })
+
+    # 数据库中已存在的编号（分批查询）
+    serials = list(seen_serials)
+    for start in range(0, len(serials), 500):
+        for (serial,) in db.session.query(Item.serial_number).filter(
+                Item.serial_number.in_(serials[start:start + 500])):
+            report.add_error(seen_serials[serial], f'物品编号 {serial} 已存在')
+
+    # 自动创建的空间包含所有缺失的上级路径
+    for path in list(new_paths):
+        new_paths.update(prefix for prefix in _path_prefixes(path) if prefix not in existing_paths)
+    report.new_space_paths = sorted(new_paths, key=lambda p: (p.count('/'), p))
+    report.errors.sort()
+    if report.errors:
+        report.rows = []
+    return report
+
+
+def _create_spaces(paths, created_by):
+    """
+    按层级创建空间：每层 flush 一次以取得父空间 ID（物化路径由 before_flush 事件维护）
+    创建前重新查询数据库：校验之后已被其他请求创建的空间直接复用，被删除的上级空间重新创建
+    :return: 实际新建的空间数
+    """
+    from app.models import Space
+
+    wanted = set(paths).union(*(_path_prefixes(path) for path in paths))
+    path_ids, ambiguous = resolve_space_paths(wanted)
+    by_depth = {}
+    for path in sorted(wanted - set(path_ids) - ambiguous):
+        # 校验之后出现同名空间的上级路径：不在其下创建，相关行在导入时记为失败
+        if not any(prefix in ambiguous for prefix in _path_prefixes(path)):
+            by_depth.setdefault(path.count('/'), []).append(path)
+
+    for depth in sorted(by_depth):
+        created = []
+        for path in by_depth[depth]:
+            parent_path, _, name = path.rpartition('/')
+            space = Space(name=name, parent_id=path_ids[parent_path] if parent_path else None, created_by=created_by)
+            db.session.add(space)
+            created.append((path, space))
+        db.session.flush()
+        path_ids.update((path, space.id) for path, space in created)
+    db.session.commit()
+    bump_space_version()
+    return sum(len(created) for created in by_depth.values())
+
+
+def import_items(rows, created_by=None, dry_run=False, create_spaces=True, batch_size=500):
+    """
+    校验并导入物品
+    :param rows: read_rows() 的结果
+    :return: ImportReport；item_ids 为新建物品ID，可用于随后排队生成二维码；
+             写入失败的行记录在 failed 中，已提交的行记录在 committed_lines 中
+    """
+    from app.models import Item
+
+    report = validate_rows(rows, create_spaces=create_spaces)
+    report.dry_run = dry_run
+    if dry_run or not report.ok:
+        return report
+
+    try:
+        if report.new_space_paths:
+            report.created_spaces = _create_spaces(report.new_space_paths, created_by)
+        path_ids, _ = resolve_space_paths(row['space_path'] for row in report.rows)
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        report.add_failure(report.rows, f'创建空间失败：{e.__class__.__name__}')
+        return report
+
+    for start in range(0, len(report.rows), batch_size):
+        batch = report.rows[start:start + batch_size]
+        # 校验之后被其他请求删除的空间
+        missing = [row for row in batch if row['space_path'] not in path_ids]
+        if missing:
+            report.add_failure(missing, '所属空间不存在或对应多个同名空间（可能已被其他请求修改）')
+            batch = [row for row in batch if row['space_path'] in path_ids]
+        if not batch:
+            continue
+
+        items = [
+            Item(name=row['name'], serial_number=row['serial_number'], function=row['function'],
+                 status=row['status'], space_id=path_ids[row['space_path']], created_by=created_by)
+            for row in batch
+        ]
+        try:
+            db.session.add_all(items)
+            # 先 flush 取得 ID，避免提交后逐个刷新过期对象
+            db.session.flush()
+            item_ids = [item.id for item in items]
+            db.session.commit()
+        except SQLAlchemyError as e:
+            # 只回滚本批（如并发写入了相同编号），之前已提交的批次保留
+            db.session.rollback()
+            report.add_failure(batch, f'写入失败，本批未导入：{e.__class__.__name__}')
+            continue
+        report.item_ids.extend(item_ids)
+        report.committed_lines.extend(row['line'] for row in batch)
+        report.created_items += len(items)
+    return report
@@ -0,0 +1,189 @@
+"""
+物品详情快照（items.view 使用）
+- 当前借用记录、最近 5 条记录、全部 active 预约合并为一条 UNION ALL 查询读取，结果为轻量只读对象
+- 按物品缓存几秒（ITEM_SNAPSHOT_TTL），与具体用户无关；“当前时段”和“是否为本人预约”在读取后按需计算
+- 任意使用记录 / 预约 / 物品状态变更提交后，通过会话事件使对应物品的快照失效
+注意：缓存为进程内缓存，多进程部署时其他 worker 最多在 TTL 内读到旧状态
+"""
+import threading
+import time
+from datetime import datetime
+
+import pytz
+from flask import current_app
+from sqlalchemy import event, select, union_all, literal, null
+
+from app import db
+
+LOCAL_TIMEZONE = pytz.timezone('Asia/Shanghai')
+
+_lock = threading.Lock()
+_snapshot_cache = {}
+
+RECENT_RECORDS_LIMIT = 5
+
+
+def _to_local(utc_time):
+    if not utc_time:
+        return None
+    return pytz.utc.localize(utc_time).astimezone(LOCAL_TIMEZONE)
+
+
+class RecordSnapshot:
+    """使用记录快照行，提供模板需要的属性"""
+    __slots__ = ('id', 'user_id', 'username', 'status', 'usage_location', '_utc_start_time', '_utc_return_time')
+
+    def __init__(self, row):
+        self.id = row.id
+        self.user_id = row.user_id
+        self.username = row.username
+        self.status = row.status
+        self.usage_location = row.usage_location
+        self._utc_start_time = row.start
+        self._utc_return_time = row.end
+
+    @property
+    def start_time(self):
+        return _to_local(self._utc_start_time)
+
+    @property
+    def return_time(self):
+        return _to_local(self._utc_return_time)
+
+
+class ReservationSnapshot:
+    """预约快照行，提供模板需要的属性"""
+    __slots__ = ('id', 'user_id', 'username', 'status', '_utc_reservation_start', '_utc_reservation_end')
+
+    def __init__(self, row):
+        self.id = row.id
+        self.user_id = row.user_id
+        self.username = row.username
+        self.status = row.status
+        self._utc_reservation_start = row.start
+        self._utc_reservation_end = row.end
+
+    @property
+    def reservation_start(self):
+        return _to_local(self._utc_reservation_start)
+
+    @property
+    def reservation_end(self):
+        return _to_local(self._utc_reservation_end)
+
+
+class ItemSnapshot:
+    """
+    单个物品的借用 / 预约状态
+    :ivar current_record: 当前借用记录（无则为 None）
+    :ivar recent_records: 最近的使用记录（按开始时间倒序）
+    :ivar reservations: 全部 active 预约（按开始时间排序）
+    """
+
+    def __init__(self, current_record, recent_records, reservations):
+        self.current_record = current_record
+        self.recent_records = recent_records
+        self.reservations = reservations
+
+    def active_reservations(self, now_utc=None):
+        """当前时段内生效的预约"""
+        now_utc = now_utc or datetime.utcnow()
+        return [res for res in self.reservations
+                if res._utc_reservation_start <= now_utc <= res._utc_reservation_end]
+
+    def has_active_reservation(self, user_id):
+        """指定用户是否持有该物品的 active 预约"""
+        return any(res.user_id == user_id for res in self.reservations)
+
+
+def _load_snapshot(item_id):
+    from app.models import Record, Reservation, User
+
+    # 最近记录需要先排序截取，再参与 UNION（SQLite 不允许复合查询的成员单独 ORDER BY）
+    recent_ids = select(Record.id).where(Record.item_id == item_id).order_by(
+        Record._utc_start_time.desc(), Record.id.desc()
+    ).limit(RECENT_RECORDS_LIMIT).scalar_subquery()
+
+    records = select(
+        literal('record').label('kind'), Record.id, Record.user_id, User.username, Record.status,
+        Record.usage_location, Record._utc_start_time.label('start'), Record._utc_return_time.label('end')
+    ).outerjoin(User, Record.user_id == User.id).where(
+        Record.item_id == item_id,
+        (Record.status == 'using') | Record.id.in_(recent_ids)
+    )
+    reservations = select(
+        literal('reservation').label('kind'), Reservation.id, Reservation.user_id, User.username, Reservation.status,
+        null().label('usage_location'), Reservation._utc_reservation_start.label('start'),
+        Reservation._utc_reservation_end.label('end')
+    ).outerjoin(User, Reservation.user_id == User.id).where(
+        Reservation.item_id == item_id,
+        Reservation.status == 'active'
+    )
+
+    current_record, recent_records, active = None, [], []
+    for row in db.session.execute(union_all(records, reservations)):
+        if row.kind == 'reservation':
+            active.append(ReservationSnapshot(row))
+            continue
+        record = RecordSnapshot(row)
+        if record.status == 'using' and current_record is None:
+            current_record = record
+        recent_records.append(record)
+
+    recent_records.sort(key=lambda r: (r._utc_start_time or datetime.min, r.id), reverse=True)
+    # “using” 记录可能不在最近 5 条内，只用于 current_record
+    recent_records = recent_records[:RECENT_RECORDS_LIMIT]
+    active.sort(key=lambda r: r._utc_reservation_start)
+    return ItemSnapshot(current_record, recent_records, active)
+
+
+def get_item_snapshot(item_id):
+    """读取物品快照（带短时缓存）"""
+    ttl = current_app.config.get('ITEM_SNAPSHOT_TTL', 5)
+    now = time.monotonic()
+    if ttl:
+        with _lock:
+            hit = _snapshot_cache.get(item_id)
+        if hit and hit[0] > now:
+            return hit[1]
+
+    snapshot = _load_snapshot(item_id)
+    if ttl:
+        with _lock:
+            if len(_snapshot_cache) > 1000:
+                _snapshot_cache.clear()
+            _snapshot_cache[item_id] = (now + ttl, snapshot)
+    return snapshot
+
+
+def invalidate_item_snapshots(item_ids):
+    with _lock:
+        for item_id in item_ids:
+            _snapshot_cache.pop(item_id, None)
+
+
+# --- 失效：提交后清除受影响物品的快照 ---
+def _collect_snapshot_item_ids(session, flush_context):
+    from app.models import Item, Record, Reservation
+
+    touched = session.info.setdefault('snapshot_item_ids', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Item):
+            touched.add(obj.id)
+        elif isinstance(obj, (Record, Reservation)):
+            touched.add(obj.item_id)
+
+
+def _invalidate_after_commit(session):
+    item_ids = session.info.pop('snapshot_item_ids', None)
+    if item_ids:
+        invalidate_item_snapshots(item_ids)
+
+
+def _discard_snapshot_item_ids(session):
+    session.info.pop('snapshot_item_ids', None)
+
+
+event.listen(db.session, 'after_flush', _collect_snapshot_item_ids)
+event.listen(db.session, 'after_commit', _invalidate_after_commit)
+event.listen(db.session, 'after_rollback', _discard_snapshot_item_ids)
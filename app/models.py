@@ -1,6 +1,8 @@
 from datetime import datetime, timedelta
 import pytz
 from flask import current_app
+from sqlalchemy import event, inspect, case, func, text
+from sqlalchemy.orm import defer, with_expression
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import db, login_manager
@@ -11,6 +13,14 @@ from itsdangerous import URLSafeTimedSerializer as Serializer
 LOCAL_TIMEZONE = pytz.timezone('Asia/Shanghai')
 
 
+def text_snippet(column, length):
+    """在 SQL 中截取长文本摘要：超过 length 个字符时截断并追加省略号，只传输摘要本身"""
+    return case(
+        (func.length(column) > length, func.substr(column, 1, length).concat('...')),
+        else_=column
+    )
+
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), unique=True, nullable=False)
@@ -96,11 +106,35 @@ def load_user(id):
 
 
 class Space(db.Model):
+    __table_args__ = (
+        db.Index('ix_space_parent_id', 'parent_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     parent_id = db.Column(db.Integer, db.ForeignKey('space.id'))
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
 
+    # 物化路径（由 before_flush 事件自动维护，禁止手动修改）
+    # full_path: 名称路径，如 "A栋/3楼/301"
+    # level: 层级深度，顶级空间为 0
+    # ancestry: 祖先ID路径（不含自身），如 "/1/5/"；顶级空间为 "/"
+    full_path = db.Column(db.String(1024))
+    level = db.Column(db.Integer, default=0)
+    ancestry = db.Column(db.String(255), index=True)
+
+    # 物品计数器（由 after_flush 事件增量维护，可用 rebuild_item_counts() 全量修复）
+    # 直属计数：仅统计 space_id 等于本空间的物品
+    item_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    available_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    borrowed_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    reserved_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    # 子树计数：本空间及全部子孙空间中的物品
+    subtree_item_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    subtree_available_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    subtree_borrowed_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    subtree_reserved_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+
     _utc_created_at = db.Column('created_at', db.DateTime, default=datetime.utcnow)
 
     @property
@@ -111,6 +145,9 @@ class Space(db.Model):
         return utc_aware.astimezone(LOCAL_TIMEZONE)
 
     def get_path(self):
+        # 优先读取物化路径；旧数据未回填时回退到逐级向上遍历
+        if self.full_path:
+            return self.full_path
         path = [self.name]
         current = self.parent
         while current:
@@ -119,6 +156,8 @@ class Space(db.Model):
         return '/'.join(path)
 
     def get_level(self):
+        if self.full_path:
+            return self.level or 0
         level = 0
         current = self.parent
         while current:
@@ -126,18 +165,134 @@ class Space(db.Model):
             current = current.parent
         return level
 
+    @property
+    def subtree_prefix(self):
+        """子孙空间 ancestry 的公共前缀，如 "/1/5/" """
+        return f'{self.ancestry or "/"}{self.id}/'
+
+    def get_ancestor_ids(self):
+        """祖先空间ID列表（从顶级到直接父级），无需查询数据库"""
+        return [int(x) for x in (self.ancestry or '').split('/') if x]
+
+    def descendants_filter(self):
+        """
+        子孙空间过滤条件（不含自身）
+        使用区间比较代替 LIKE，保证可以命中 ancestry 索引：
+        以 "/1/5/" 开头的字符串恰好落在 ["/1/5/", "/1/50") 区间内（'/' 的下一个字符是 '0'）
+        """
+        prefix = self.subtree_prefix
+        return db.and_(Space.ancestry >= prefix, Space.ancestry < prefix[:-1] + '0')
+
+    def get_descendants(self):
+        return Space.query.filter(self.descendants_filter()).all()
+
+    def get_subtree_ids(self):
+        """自身及全部子孙空间ID（单次索引查询）"""
+        rows = db.session.query(Space.id).filter(self.descendants_filter()).all()
+        return [self.id] + [row[0] for row in rows]
+
+    def _apply_parent(self, parent):
+        """根据父空间计算自身的物化路径字段"""
+        if parent is None:
+            self.full_path = self.name
+            self.level = 0
+            self.ancestry = '/'
+        else:
+            self.full_path = f'{parent.get_path()}/{self.name}'
+            self.level = parent.get_level() + 1
+            self.ancestry = f'{parent.ancestry or "/"}{parent.id}/'
+
+    @classmethod
+    def rebuild_paths(cls):
+        """
+        全量重建物化路径（用于迁移回填或修复数据漂移）
+        一次查询加载全部空间，在内存中按父子关系计算
+        """
+        spaces = cls.query.order_by(cls.id).all()
+        by_parent = {}
+        for space in spaces:
+            by_parent.setdefault(space.parent_id, []).append(space)
+
+        count = 0
+        stack = [(space, None) for space in by_parent.get(None, [])]
+        while stack:
+            space, parent = stack.pop()
+            if parent is None:
+                space.full_path, space.level, space.ancestry = space.name, 0, '/'
+            else:
+                space.full_path = f'{parent.full_path}/{space.name}'
+                space.level = parent.level + 1
+                space.ancestry = f'{parent.ancestry}{parent.id}/'
+            count += 1
+            stack.extend((child, space) for child in by_parent.get(space.id, []))
+        return count
+
+    @classmethod
+    def rebuild_item_counts(cls):
+        """
+        全量重建物品计数器（修复增量维护产生的漂移）
+        一次 GROUP BY 统计直属数量，再按 ancestry 在内存中向上汇总
+        """
+        spaces = cls.query.all()
+        by_id = {space.id: space for space in spaces}
+        totals = {space.id: dict.fromkeys(SPACE_COUNTER_COLUMNS, 0) for space in spaces}
+
+        rows = db.session.query(Item.space_id, Item.status, db.func.count(Item.id)) \
+            .group_by(Item.space_id, Item.status).all()
+        for space_id, status, count in rows:
+            space = by_id.get(space_id)
+            if space is None:
+                continue
+            targets = [space_id] + [sid for sid in space.get_ancestor_ids() if sid in totals]
+            for column, delta in _status_counter_deltas(status, count).items():
+                if not column.startswith('subtree_'):
+                    totals[space_id][column] += delta
+                else:
+                    for target in targets:
+                        totals[target][column] += delta
+
+        for space in spaces:
+            for column, value in totals[space.id].items():
+                setattr(space, column, value)
+        return len(spaces)
+
     children = db.relationship('Space', backref=db.backref('parent', remote_side=[id]), lazy='dynamic')
     items = db.relationship('Item', backref='space', lazy='dynamic', cascade="all, delete-orphan")
 
 
+# 物品状态 -> 计数列后缀
+ITEM_STATUS_COUNTERS = ('available', 'borrowed', 'reserved')
+SPACE_COUNTER_COLUMNS = (
+    'item_count', 'available_count', 'borrowed_count', 'reserved_count',
+    'subtree_item_count', 'subtree_available_count', 'subtree_borrowed_count', 'subtree_reserved_count',
+)
+
+
+def _status_counter_deltas(status, delta):
+    """某状态的物品数量变化 delta 对应的计数列增量"""
+    deltas = {'item_count': delta, 'subtree_item_count': delta}
+    if status in ITEM_STATUS_COUNTERS:
+        deltas[f'{status}_count'] = delta
+        deltas[f'subtree_{status}_count'] = delta
+    return deltas
+
+
 class Item(db.Model):
+    __table_args__ = (
+        db.Index('ix_item_status', 'status'),
+        db.Index('ix_item_space_id', 'space_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     function = db.Column(db.Text)
     serial_number = db.Column(db.String(50), unique=True)
-    status = db.Column(db.String(20), default='available')  # available, borrowed, reserved
+    # status / space_id 开启 active_history：赋值时先加载旧值，供空间物品计数器计算增量
+    status = db.column_property(db.Column(db.String(20), default='available'),
+                                active_history=True)  # available, borrowed, reserved
     barcode_path = db.Column(db.String(255))
-    space_id = db.Column(db.Integer, db.ForeignKey('space.id'), nullable=False)
+    space_id = db.column_property(db.Column(db.Integer, db.ForeignKey('space.id'), nullable=False),
+                                  active_history=True)
     # 【允许创建者为空（用户删除后保留物品）】
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
 
@@ -145,6 +300,20 @@ class Item(db.Model):
     _utc_created_at = db.Column('created_at', db.DateTime, default=datetime.utcnow)
     _utc_updated_at = db.Column('updated_at', db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # 列表页使用的功能描述摘要（由 list_options 在查询中填充，未填充时为 None）
+    function_snippet = db.query_expression()
+
+    @classmethod
+    def list_options(cls, snippet_length=None):
+        """
+        列表页加载选项：不读取完整的 function 文本（仅详情页需要）
+        :param snippet_length: 传入时在 SQL 中截取摘要到 function_snippet
+        """
+        options = [defer(cls.function)]
+        if snippet_length:
+            options.append(with_expression(cls.function_snippet, text_snippet(cls.function, snippet_length)))
+        return options
+
     # 前端调用item.created_at / item.updated_at时返回本地时间
     @property
     def created_at(self):
@@ -165,19 +334,8 @@ class Item(db.Model):
     reservations = db.relationship('Reservation', backref='item', lazy='dynamic', cascade="all, delete-orphan")
 
 
-class Record(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    item_id = db.Column(db.Integer, db.ForeignKey('item.id'), nullable=False)
-    # 【允许用户ID为空（用户删除后保留记录）】
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
-    space_path = db.Column(db.String(255))
-    usage_location = db.Column(db.String(255))
-
-    # 数据库存储UTC时间
-    _utc_start_time = db.Column('start_time', db.DateTime, default=datetime.utcnow)
-    _utc_return_time = db.Column('return_time', db.DateTime)
-    _utc_created_at = db.Column('created_at', db.DateTime, default=datetime.utcnow)
-    status = db.Column(db.String(20), default='using')  # using, returned
+class RecordViewMixin:
+    """使用记录的展示属性（热表、归档表和历史视图共用，要求映射 _utc_* 时间列与 status）"""
 
     # 前端调用record.start_time / return_time / created_at时返回本地时间
     @property
@@ -201,26 +359,48 @@ class Record(db.Model):
         utc_aware = pytz.utc.localize(self._utc_created_at)
         return utc_aware.astimezone(LOCAL_TIMEZONE)
 
-    # 逾期判断基于UTC时间
+    # 逾期判断基于UTC时间，阈值为配置 OVERDUE_DAYS
     def is_overdue(self):
         if self.status == 'using' and self._utc_start_time:  # 使用数据库原始UTC时间判断
-            return datetime.utcnow() - self._utc_start_time > timedelta(days=10)
+            return datetime.utcnow() - self._utc_start_time > timedelta(days=current_app.config['OVERDUE_DAYS'])
         return False
 
 
-class Reservation(db.Model):
+class Record(RecordViewMixin, db.Model):
+    # 热点查询索引：全部记录（不筛选 / 按状态）、物品 / 用户的记录列表均按 (开始时间, ID) 键集分页；
+    # 逾期检查只扫描使用中的记录，用部分索引（SQLite / PostgreSQL）
+    __table_args__ = (
+        db.Index('ix_record_start_time_id', 'start_time', 'id'),
+        db.Index('ix_record_status_start_time', 'status', 'start_time'),
+        db.Index('ix_record_item_id_start_time', 'item_id', 'start_time'),
+        db.Index('ix_record_user_id_start_time', 'user_id', 'start_time'),
+        db.Index('ix_record_using_start_time', 'start_time',
+                 sqlite_where=text("status = 'using'"), postgresql_where=text("status = 'using'")),
+        # 主键不复用：归档后的记录保留原ID，热表新记录不能与之冲突
+        {'sqlite_autoincrement': True},
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     item_id = db.Column(db.Integer, db.ForeignKey('item.id'), nullable=False)
-    # 【允许用户ID为空（用户删除后保留预约）】
+    # 【允许用户ID为空（用户删除后保留记录）】
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    space_path = db.Column(db.String(255))
+    usage_location = db.Column(db.String(255))
 
     # 数据库存储UTC时间
-    _utc_reservation_start = db.Column('reservation_start', db.DateTime, nullable=False)
-    _utc_reservation_end = db.Column('reservation_end', db.DateTime, nullable=False)
+    _utc_start_time = db.Column('start_time', db.DateTime, default=datetime.utcnow)
+    _utc_return_time = db.Column('return_time', db.DateTime)
     _utc_created_at = db.Column('created_at', db.DateTime, default=datetime.utcnow)
-    # scheduled/active/expired/cancelled/used/conflicted
-    status = db.Column(db.String(20), default='scheduled')
-    notes = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(20), default='using')  # using, returned
+
+
+class ReservationViewMixin:
+    """预约的展示属性与状态判断（热表、归档表和历史视图共用）"""
+
+    @classmethod
+    def list_options(cls, snippet_length=50):
+        """列表页加载选项：不读取完整备注，只在 SQL 中截取摘要到 notes_snippet"""
+        return [defer(cls.notes), with_expression(cls.notes_snippet, text_snippet(cls.notes, snippet_length))]
 
     # 前端调用时返回东八区本地时间
     @property
@@ -263,4 +443,343 @@ class Reservation(db.Model):
 
     def is_conflicted(self):
         """判断是否因物品未归还导致冲突"""
-        return self.status == 'conflicted'
\ No newline at end of file
+        return self.status == 'conflicted'
+
+
+class Reservation(ReservationViewMixin, db.Model):
+    # 热点查询索引：全部预约列表按 (开始时间, ID) 键集分页；定时任务按状态 + 开始时间扫描；
+    # 创建预约时按物品 + 状态 + 时段检查重叠
+    __table_args__ = (
+        db.Index('ix_reservation_start_id', 'reservation_start', 'id'),
+        db.Index('ix_reservation_status_start', 'status', 'reservation_start'),
+        db.Index('ix_reservation_item_status_period', 'item_id', 'status', 'reservation_start', 'reservation_end'),
+        {'sqlite_autoincrement': True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    item_id = db.Column(db.Integer, db.ForeignKey('item.id'), nullable=False)
+    # 【允许用户ID为空（用户删除后保留预约）】
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+
+    # 数据库存储UTC时间
+    _utc_reservation_start = db.Column('reservation_start', db.DateTime, nullable=False)
+    _utc_reservation_end = db.Column('reservation_end', db.DateTime, nullable=False)
+    _utc_created_at = db.Column('created_at', db.DateTime, default=datetime.utcnow)
+    # scheduled/active/expired/cancelled/used/conflicted
+    status = db.Column(db.String(20), default='scheduled')
+    notes = db.Column(db.Text, nullable=True)
+
+    # 列表页使用的备注摘要（由 list_options 在查询中填充，未填充时为 None）
+    notes_snippet = db.query_expression()
+
+
+# --- 冷数据归档 ---
+# 已归还的记录、已结束（expired / cancelled / used）的预约超过一定时间后由 app/archive.py 移入归档表，
+# 热表只保留进行中的数据；归档行保留原ID，不设外键（物品删除时由事件一并清理）
+class RecordArchive(RecordViewMixin, db.Model):
+    __tablename__ = 'record_archive'
+    __table_args__ = (
+        db.Index('ix_record_archive_item_id_start_time', 'item_id', 'start_time'),
+        db.Index('ix_record_archive_user_id_start_time', 'user_id', 'start_time'),
+        db.Index('ix_record_archive_start_time', 'start_time'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    item_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=True)
+    space_path = db.Column(db.String(255))
+    usage_location = db.Column(db.String(255))
+    _utc_start_time = db.Column('start_time', db.DateTime)
+    _utc_return_time = db.Column('return_time', db.DateTime)
+    _utc_created_at = db.Column('created_at', db.DateTime)
+    status = db.Column(db.String(20))
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    item = db.relationship('Item', primaryjoin='foreign(RecordArchive.item_id) == Item.id', viewonly=True)
+    user = db.relationship('User', primaryjoin='foreign(RecordArchive.user_id) == User.id', viewonly=True)
+
+
+class ReservationArchive(ReservationViewMixin, db.Model):
+    __tablename__ = 'reservation_archive'
+    __table_args__ = (
+        db.Index('ix_reservation_archive_item_id_start', 'item_id', 'reservation_start'),
+        db.Index('ix_reservation_archive_user_id_start', 'user_id', 'reservation_start'),
+        db.Index('ix_reservation_archive_start', 'reservation_start'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    item_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=True)
+    _utc_reservation_start = db.Column('reservation_start', db.DateTime, nullable=False)
+    _utc_reservation_end = db.Column('reservation_end', db.DateTime, nullable=False)
+    _utc_created_at = db.Column('created_at', db.DateTime)
+    status = db.Column(db.String(20))
+    notes = db.Column(db.Text, nullable=True)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    notes_snippet = db.query_expression()
+
+    item = db.relationship('Item', primaryjoin='foreign(ReservationArchive.item_id) == Item.id', viewonly=True)
+    user = db.relationship('User', primaryjoin='foreign(ReservationArchive.user_id) == User.id', viewonly=True)
+
+
+def _history_selectable(hot, archive, name, snippets=None):
+    """
+    热表与归档表按相同列 UNION ALL，作为只读历史视图的映射目标
+    :param snippets: {长文本列: 摘要长度}；视图中只带 "<列>_snippet" 摘要列，不读取完整文本
+    """
+    snippets = snippets or {}
+    columns = [column.name for column in hot.__table__.columns if column.name not in snippets]
+
+    def arm(table):
+        return db.select(*(table.c[column] for column in columns),
+                         *(text_snippet(table.c[column], length).label(f'{column}_snippet')
+                           for column, length in snippets.items()))
+
+    return db.union_all(arm(hot.__table__), arm(archive.__table__)).subquery(name)
+
+
+class RecordHistory(RecordViewMixin, db.Model):
+    """
+    使用记录历史（热表 + 归档表的只读视图），供历史列表页使用
+    筛选条件会被 SQLite 下推到 UNION 的两个分支，各自走索引
+    """
+    __table__ = _history_selectable(Record, RecordArchive, 'record_history')
+
+    _utc_start_time = __table__.c.start_time
+    _utc_return_time = __table__.c.return_time
+    _utc_created_at = __table__.c.created_at
+
+    item = db.relationship('Item', primaryjoin='foreign(RecordHistory.item_id) == Item.id', viewonly=True)
+    user = db.relationship('User', primaryjoin='foreign(RecordHistory.user_id) == User.id', viewonly=True)
+
+
+class ReservationHistory(ReservationViewMixin, db.Model):
+    """预约历史（热表 + 归档表的只读视图），供历史列表页使用；备注只提供摘要列 notes_snippet"""
+    __table__ = _history_selectable(Reservation, ReservationArchive, 'reservation_history', snippets={'notes': 50})
+
+    _utc_reservation_start = __table__.c.reservation_start
+    _utc_reservation_end = __table__.c.reservation_end
+    _utc_created_at = __table__.c.created_at
+
+    @classmethod
+    def list_options(cls, snippet_length=50):
+        # 视图中已是摘要列，无需额外的加载选项
+        return []
+
+    item = db.relationship('Item', primaryjoin='foreign(ReservationHistory.item_id) == Item.id', viewonly=True)
+    user = db.relationship('User', primaryjoin='foreign(ReservationHistory.user_id) == User.id', viewonly=True)
+
+
+# 包含完整备注的预约历史（热表 + 归档表），供导出使用；列表页使用只带摘要的 ReservationHistory
+reservation_history_full = _history_selectable(Reservation, ReservationArchive, 'reservation_history_full')
+
+
+# --- 通知台账 ---
+# 每条逻辑通知以 (对象类型, 对象ID, 通知类型, 状态版本) 唯一登记，登记成功的进程才发送（见 app/notifications.py）
+class NotificationLog(db.Model):
+    __tablename__ = 'notification_log'
+    __table_args__ = (
+        db.UniqueConstraint('subject_type', 'subject_id', 'notification_type', 'state_version',
+                            name='uq_notification_log_key'),
+        db.Index('ix_notification_log_type_created', 'notification_type', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    subject_type = db.Column(db.String(20), nullable=False)  # reservation / record / system
+    subject_id = db.Column(db.Integer, nullable=False)
+    notification_type = db.Column(db.String(30), nullable=False)
+    state_version = db.Column(db.String(64), nullable=False)
+    recipient = db.Column(db.String(255))
+    status = db.Column(db.String(10), default='pending')  # pending / sent / failed
+    attempts = db.Column(db.Integer, default=1, server_default='1', nullable=False)
+    error = db.Column(db.Text)
+    _utc_created_at = db.Column('created_at', db.DateTime, default=datetime.utcnow)
+    _utc_claimed_at = db.Column('claimed_at', db.DateTime, default=datetime.utcnow)  # 最近一次领取发送的时间
+    _utc_sent_at = db.Column('sent_at', db.DateTime)
+
+
+def _delete_archived_history(mapper, connection, item):
+    # 物品删除时热表记录由 ORM 级联删除，归档表没有外键，需要同步清理
+    # 批量删除不经过 ORM 事件：归档记录的全文检索文档在删除归档行之前一并清理
+    from app.search import fts_available, search_fts
+
+    archived_ids = db.select(RecordArchive.__table__.c.id).where(RecordArchive.__table__.c.item_id == item.id)
+    if fts_available():
+        connection.execute(search_fts.delete().where(search_fts.c.kind == 'record',
+                                                     search_fts.c.ref_id.in_(archived_ids)))
+    connection.execute(RecordArchive.__table__.delete().where(RecordArchive.__table__.c.item_id == item.id))
+    connection.execute(
+        ReservationArchive.__table__.delete().where(ReservationArchive.__table__.c.item_id == item.id))
+
+
+event.listen(Item, 'after_delete', _delete_archived_history)
+
+
+# --- 空间物化路径维护 ---
+def _maintain_space_paths(session, flush_context, instances):
+    """
+    flush 前维护 Space 的 full_path / level / ancestry
+    - 新建空间：根据父空间计算
+    - 重命名或移动：重新计算自身，并批量修正全部子孙空间（一次区间查询）
+    - 移动：记录被移动子树的物品合计，after_flush 时从旧祖先链减去、加到新祖先链
+    """
+    spaces = [obj for obj in list(session.new) + list(session.dirty) if isinstance(obj, Space)]
+    if not spaces:
+        return
+
+    with session.no_autoflush:
+        for space in spaces:
+            state = inspect(space)
+            is_new = state.key is None
+            name_changed = state.attrs.name.history.has_changes()
+            parent_changed = (state.attrs.parent_id.history.has_changes()
+                              or state.attrs.parent.history.has_changes())
+
+            if not is_new and not name_changed and not parent_changed and space.full_path:
+                continue
+
+            parent = space.parent
+            if parent is None and space.parent_id is not None:
+                parent = session.get(Space, space.parent_id)
+
+            old_full_path = space.full_path
+            old_level = space.level or 0
+            old_prefix = space.subtree_prefix if not is_new else None
+            old_ancestor_ids = space.get_ancestor_ids() if not is_new else None
+
+            space._apply_parent(parent)
+
+            if parent_changed and not is_new and old_ancestor_ids != space.get_ancestor_ids():
+                totals = {column: getattr(space, column) or 0
+                          for column in SPACE_COUNTER_COLUMNS if column.startswith('subtree_')}
+                session.info.setdefault('space_moves', []).append(
+                    (old_ancestor_ids, space.get_ancestor_ids(), totals))
+
+            # 新建空间没有子孙；路径未实际变化也无需级联
+            if is_new or old_full_path is None or old_full_path == space.full_path:
+                continue
+
+            new_prefix = space.subtree_prefix
+            level_delta = space.level - old_level
+            descendants = Space.query.filter(
+                Space.ancestry >= old_prefix,
+                Space.ancestry < old_prefix[:-1] + '0'
+            ).all()
+            for desc in descendants:
+                desc.full_path = space.full_path + desc.full_path[len(old_full_path):]
+                desc.ancestry = new_prefix + desc.ancestry[len(old_prefix):]
+                desc.level = (desc.level or 0) + level_delta
+
+
+event.listen(db.session, 'before_flush', _maintain_space_paths)
+
+
+# --- 空间物品计数器维护 ---
+def _collect_item_count_deltas(session, flush_context, instances):
+    """
+    flush 前收集物品新增 / 删除 / 移动 / 状态变化引起的 (space_id, status) 数量变化
+    实际的 UPDATE 在 after_flush 中执行，保证与物品变更处于同一事务
+    """
+    deltas = session.info.setdefault('item_count_deltas', {})
+
+    def add(space_id, status, delta):
+        if space_id is not None:
+            key = (space_id, status)
+            deltas[key] = deltas.get(key, 0) + delta
+
+    for obj in session.new:
+        if isinstance(obj, Item):
+            add(obj.space_id if obj.space_id is not None else getattr(obj.space, 'id', None),
+                obj.status or 'available', 1)
+
+    for obj in session.deleted:
+        if isinstance(obj, Item):
+            state = inspect(obj)
+            space_hist = state.attrs.space_id.history
+            status_hist = state.attrs.status.history
+            old_space = space_hist.deleted[0] if space_hist.deleted else obj.space_id
+            old_status = status_hist.deleted[0] if status_hist.deleted else obj.status
+            add(old_space, old_status, -1)
+
+    for obj in session.dirty:
+        if isinstance(obj, Item) and obj not in session.deleted:
+            state = inspect(obj)
+            space_hist = state.attrs.space_id.history
+            status_hist = state.attrs.status.history
+            if not space_hist.has_changes() and not status_hist.has_changes():
+                continue
+            old_space = space_hist.deleted[0] if space_hist.deleted else obj.space_id
+            old_status = status_hist.deleted[0] if status_hist.deleted else obj.status
+            if (old_space, old_status) != (obj.space_id, obj.status):
+                add(old_space, old_status, -1)
+                add(obj.space_id, obj.status, 1)
+
+
+def _apply_item_count_deltas(session, flush_context):
+    moves = session.info.pop('space_moves', None)
+    if moves:
+        apply_space_move_deltas(session.connection(), moves)
+    deltas = session.info.pop('item_count_deltas', None)
+    if deltas:
+        apply_item_count_deltas(session.connection(), deltas)
+
+
+def apply_item_count_deltas(connection, deltas):
+    """
+    按 {(space_id, status): 数量变化} 更新空间计数器（直属及所有祖先的子树计数）
+    ORM 变更由会话事件自动调用；批量 SQL 修改物品状态时需自行调用
+    """
+    space_ids = {space_id for space_id, _ in deltas}
+    ancestry = dict(connection.execute(
+        db.select(Space.id, Space.ancestry).where(Space.id.in_(space_ids))
+    ).all())
+
+    # 合并为每个空间每一列的最终增量（同一建筑内移动时，公共祖先的子树计数相互抵消）
+    per_space = {}
+    for (space_id, status), delta in deltas.items():
+        if delta == 0 or space_id not in ancestry:
+            continue
+        ancestor_ids = [int(x) for x in (ancestry[space_id] or '').split('/') if x]
+        for column, value in _status_counter_deltas(status, delta).items():
+            targets = ancestor_ids + [space_id] if column.startswith('subtree_') else [space_id]
+            for target in targets:
+                columns = per_space.setdefault(target, {})
+                columns[column] = columns.get(column, 0) + value
+
+    table = Space.__table__
+    for space_id, columns in per_space.items():
+        values = {name: table.c[name] + value for name, value in columns.items() if value}
+        if values:
+            connection.execute(table.update().where(table.c.id == space_id).values(**values))
+
+
+def apply_space_move_deltas(connection, moves):
+    """
+    按 [(旧祖先ID列表, 新祖先ID列表, {子树计数列: 数量}), ...] 调整空间移动后的祖先子树计数
+    被移动空间自身及其子孙的计数不变；新旧祖先链的公共部分相互抵消
+    """
+    per_space = {}
+    for old_ancestor_ids, new_ancestor_ids, totals in moves:
+        for sign, ancestor_ids in ((-1, old_ancestor_ids), (1, new_ancestor_ids)):
+            for target in ancestor_ids:
+                columns = per_space.setdefault(target, {})
+                for column, value in totals.items():
+                    columns[column] = columns.get(column, 0) + sign * value
+
+    table = Space.__table__
+    for space_id, columns in per_space.items():
+        values = {name: table.c[name] + value for name, value in columns.items() if value}
+        if values:
+            connection.execute(table.update().where(table.c.id == space_id).values(**values))
+
+
+def _discard_item_count_deltas(session, previous_transaction=None):
+    # flush 失败回滚时丢弃未应用的增量，避免带入下一次 flush
+    session.info.pop('item_count_deltas', None)
+    session.info.pop('space_moves', None)
+
+
+event.listen(db.session, 'before_flush', _collect_item_count_deltas)
+event.listen(db.session, 'after_flush', _apply_item_count_deltas)
+event.listen(db.session, 'after_soft_rollback', _discard_item_count_deltas)
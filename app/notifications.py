@@ -0,0 +1,171 @@
+"""
+通知台账（notification_log）
+- 每条逻辑通知以 (对象类型, 对象ID, 通知类型, 状态版本) 唯一登记；唯一约束 + INSERT ... ON CONFLICT DO NOTHING
+  保证只有一个进程 / 一次运行登记成功，登记成功后才发送（重启、多 worker、手动触发都不会重复发送）
+- 登记随调用方事务提交后再发送；发送结果由后台线程回写（sent / failed）
+- 发送失败、或领取后超时仍为 pending 的台账行可以被重新领取（以状态 / 尝试次数为条件的 UPDATE，
+  同一时刻只有一个进程领取成功），最多尝试 NOTIFICATION_MAX_ATTEMPTS 次；retry_notifications() 定期重发
+- 状态版本：预约为 "状态@开始时间"（同一状态下只通知一次，时段变化视为新版本）；逾期为本地日期（每天最多一次）
+"""
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, func, insert, or_, select
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+
+KEY_COLUMNS = ('subject_type', 'subject_id', 'notification_type', 'state_version')
+
+
+def reservation_version(reservation):
+    """预约的状态版本"""
+    return f"{reservation.status}@{reservation._utc_reservation_start.strftime('%Y-%m-%dT%H:%M')}"
+
+
+def _retryable(table, now):
+    """可重新领取的台账行：发送失败，或领取后超时仍未回写结果；且未达到最大尝试次数"""
+    stale_before = now - timedelta(minutes=current_app.config['NOTIFICATION_PENDING_TIMEOUT_MINUTES'])
+    return and_(
+        table.c.attempts < current_app.config['NOTIFICATION_MAX_ATTEMPTS'],
+        or_(table.c.status == 'failed', and_(table.c.status == 'pending', table.c.claimed_at < stale_before))
+    )
+
+
+def claim(subject_type, subject_id, notification_type, state_version, recipient=None):
+    """
+    原子登记（领取）一条通知
+    - 首次登记：插入台账行
+    - 已登记但可重试（见 _retryable）：以当前尝试次数为条件的 UPDATE 重新领取同一行，并发时只有一个进程成功
+    :return: 台账ID；已发送、正在由其他进程发送或已达最大尝试次数时返回 None
+    """
+    from app.models import NotificationLog
+
+    table = NotificationLog.__table__
+    now = datetime.utcnow()
+    values = dict(subject_type=subject_type, subject_id=subject_id, notification_type=notification_type,
+                  state_version=state_version, recipient=recipient, status='pending', attempts=1,
+                  created_at=now, claimed_at=now)
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        result = db.session.execute(
+            dialect_insert(table).values(**values).on_conflict_do_nothing(index_elements=list(KEY_COLUMNS))
+        )
+        if result.rowcount == 1:
+            return result.inserted_primary_key[0]
+    else:
+        # 其他数据库：依靠唯一约束，冲突时回滚到保存点
+        try:
+            with db.session.begin_nested():
+                result = db.session.execute(insert(table).values(**values))
+            return result.inserted_primary_key[0]
+        except IntegrityError:
+            pass
+
+    key = [table.c[column] == value for column, value in zip(KEY_COLUMNS, (
+        subject_type, subject_id, notification_type, state_version))]
+    row = db.session.execute(select(table.c.id, table.c.attempts).where(*key)).first()
+    if row is None:
+        return None
+    result = db.session.execute(
+        table.update().where(table.c.id == row.id, table.c.attempts == row.attempts, _retryable(table, now))
+        .values(status='pending', attempts=table.c.attempts + 1, claimed_at=now, recipient=recipient, error=None)
+    )
+    return row.id if result.rowcount == 1 else None
+
+
+def _record_delivery(log_ids):
+    """生成发送结果回调：按邮件回写对应台账行的状态"""
+
+    def on_result(errors):
+        from app.models import NotificationLog
+
+        table = NotificationLog.__table__
+        now = datetime.utcnow()
+        try:
+            sent = [log_id for ids, error in zip(log_ids, errors) if error is None for log_id in ids]
+            if sent:
+                db.session.execute(table.update().where(table.c.id.in_(sent)).values(status='sent', sent_at=now))
+            for ids, error in zip(log_ids, errors):
+                if error is not None:
+                    db.session.execute(table.update().where(table.c.id.in_(ids)).values(status='failed', error=error))
+            db.session.commit()
+        except Exception as e:
+            current_app.logger.error(f"回写通知发送结果失败: {str(e)}", exc_info=True)
+            db.session.rollback()
+
+    return on_result
+
+
+def send_logged(pairs):
+    """
+    提交登记后发送
+    :param pairs: [(Message, [台账ID, ...])]，一封邮件可以对应多条台账（如逾期汇总邮件）
+    :return: 发送线程（没有邮件时为 None）
+    """
+    from app.email import send_messages
+
+    db.session.commit()
+    if not pairs:
+        return None
+    return send_messages([msg for msg, _ in pairs], on_result=_record_delivery([ids for _, ids in pairs]))
+
+
+def retry_notifications(now_utc=None):
+    """
+    重试阶段：重新发送可重试的通知（发送失败或领取后超时未回写结果，未达最大尝试次数）
+    - 预约通知：预约仍处于登记时的状态版本才重发（状态或时段已变化的旧通知不再有意义）
+    - 逾期通知：只重发当天（本地日期）已登记的条目，不提前发送当天新出现的逾期记录
+    实际领取仍经过 claim()，多个进程同时重试时每条通知只会被一个进程重发
+    :return: 发送线程列表
+    """
+    from app.models import NotificationLog, Reservation
+    from app.overdue import send_overdue_digests
+    from app.reservation_timeline import send_notifications
+
+    now_utc = now_utc or datetime.utcnow()
+    table = NotificationLog.__table__
+    rows = db.session.execute(
+        select(table.c.subject_type, table.c.subject_id, table.c.notification_type, table.c.state_version)
+        .where(_retryable(table, now_utc))
+    ).all()
+    if not rows:
+        return []
+
+    threads = []
+    pending = [(row.subject_id, row.notification_type, row.state_version)
+               for row in rows if row.subject_type == 'reservation']
+    if pending:
+        reservations = {res.id: res for res in Reservation.query.filter(
+            Reservation.id.in_({reservation_id for reservation_id, _, _ in pending}))}
+        threads.append(send_notifications([
+            (reservation_id, kind) for reservation_id, kind, version in pending
+            if reservation_id in reservations and reservation_version(reservations[reservation_id]) == version
+        ]))
+    if any(row.notification_type in ('overdue', 'overdue_summary') for row in rows):
+        threads.append(send_overdue_digests(now_utc, retry_only=True)[1])
+    db.session.commit()
+    current_app.logger.info(f"通知重试：可重试台账 {len(rows)} 条")
+    return [thread for thread in threads if thread is not None]
+
+
+def notification_stats(since=None):
+    """
+    发送统计
+    :param since: 只统计该时间（UTC）之后登记的通知
+    :return: {通知类型: {'pending': n, 'sent': n, 'failed': n}}
+    """
+    from app.models import NotificationLog
+
+    query = db.session.query(NotificationLog.notification_type, NotificationLog.status, func.count())
+    if since is not None:
+        query = query.filter(NotificationLog._utc_created_at >= since)
+    stats = {}
+    for notification_type, status, count in query.group_by(NotificationLog.notification_type,
+                                                             NotificationLog.status):
+        stats.setdefault(notification_type, {'pending': 0, 'sent': 0, 'failed': 0})[status] = count
+    return stats
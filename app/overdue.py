@@ -0,0 +1,130 @@
+"""
+逾期检测与提醒汇总
+- 一条查询取出全部逾期记录（连同物品、借用人信息），按借用人分组
+- 每次运行每位借用人只收到一封汇总邮件，管理员另收一封总览邮件
+- 逾期阈值统一使用配置 OVERDUE_DAYS
+"""
+from datetime import datetime, timedelta
+from itertools import groupby
+
+import pytz
+from flask import current_app
+from sqlalchemy import select
+
+from app import db
+
+LOCAL_TIMEZONE = pytz.timezone('Asia/Shanghai')
+
+
+def overdue_cutoff(now_utc=None):
+    """借用开始时间早于该时刻（UTC）且仍在使用中的记录视为逾期"""
+    return (now_utc or datetime.utcnow()) - timedelta(days=current_app.config['OVERDUE_DAYS'])
+
+
+class OverdueEntry:
+    """单条逾期记录（邮件模板使用）"""
+    __slots__ = ('record_id', 'item_name', 'serial_number', 'space_path', 'usage_location', 'start_time',
+                 'overdue_days')
+
+    def __init__(self, row, now_utc, overdue_days):
+        self.record_id = row.id
+        self.item_name = row.item_name
+        self.serial_number = row.serial_number
+        self.space_path = row.space_path
+        self.usage_location = row.usage_location
+        self.start_time = pytz.utc.localize(row.start_time).astimezone(LOCAL_TIMEZONE)
+        self.overdue_days = max((now_utc - row.start_time).days - overdue_days, 0)
+
+
+class OverdueDigest:
+    """某位借用人的全部逾期记录（user_id 为空表示借用人已删除）"""
+
+    def __init__(self, user_id, username, email, entries):
+        self.user_id = user_id
+        self.username = username
+        self.email = email
+        self.entries = entries
+
+
+def find_overdue_digests(now_utc=None):
+    """查询全部逾期记录并按借用人分组，返回 OverdueDigest 列表"""
+    from app.models import Item, Record, User
+
+    now_utc = now_utc or datetime.utcnow()
+    overdue_days = current_app.config['OVERDUE_DAYS']
+    rows = db.session.execute(
+        select(
+            Record.id, Record.user_id, Record.space_path, Record.usage_location,
+            Record._utc_start_time.label('start_time'),
+            Item.name.label('item_name'), Item.serial_number, User.username, User.email
+        ).join(Item, Record.item_id == Item.id).outerjoin(User, Record.user_id == User.id).where(
+            Record.status == 'using',
+            Record._utc_start_time < overdue_cutoff(now_utc)
+        ).order_by(Record.user_id, Record._utc_start_time)
+    ).all()
+
+    return [
+        OverdueDigest(user_id, group[0].username, group[0].email,
+                      [OverdueEntry(row, now_utc, overdue_days) for row in group])
+        for user_id, group in ((key, list(rows)) for key, rows in groupby(rows, key=lambda r: r.user_id))
+    ]
+
+
+def admin_emails():
+    """管理员收件人：数据库中的管理员 + FLASKY_ADMIN 配置的超级管理员"""
+    from app.models import User
+
+    emails = {email for (email,) in db.session.query(User.email).filter(User.role == 'admin')}
+    configured = current_app.config.get('FLASKY_ADMIN') or ''
+    if isinstance(configured, str):
+        configured = configured.split(',')
+    emails.update(email.strip() for email in configured if email and email.strip())
+    return sorted(emails)
+
+
+def send_overdue_digests(now_utc=None, retry_only=False):
+    """
+    发送逾期提醒：每位借用人一封汇总邮件，管理员一封总览邮件（所有邮件在一个后台线程中共用一个 SMTP 连接发送）
+    每条逾期记录、管理员总览每天（本地日期）只在通知台账中登记一次，同一天重复运行不会重复发送
+    （发送失败的按通知台账的重试规则重发）
+    :param retry_only: 只处理当天已登记过的条目（重试阶段使用），不登记新的逾期记录
+    :return: (OverdueDigest 列表, 发送线程；没有需要发送的邮件时为 None)
+    """
+    from app.email import build_message
+    from app.models import NotificationLog
+    from app.notifications import claim, send_logged
+
+    now_utc = now_utc or datetime.utcnow()
+    digests = find_overdue_digests(now_utc)
+    if not digests:
+        return digests, None
+
+    overdue_days = current_app.config['OVERDUE_DAYS']
+    today = pytz.utc.localize(now_utc).astimezone(LOCAL_TIMEZONE).date().isoformat()
+    logged = None
+    if retry_only:
+        logged = set(db.session.query(NotificationLog.subject_type, NotificationLog.subject_id).filter(
+            NotificationLog.notification_type.in_(('overdue', 'overdue_summary')),
+            NotificationLog.state_version == today))
+    pairs = []
+    for digest in digests:
+        if not digest.email:
+            continue
+        claimed = [(entry, claim('record', entry.record_id, 'overdue', today, digest.email))
+                   for entry in digest.entries if logged is None or ('record', entry.record_id) in logged]
+        claimed = [(entry, log_id) for entry, log_id in claimed if log_id is not None]
+        if claimed:
+            pending = OverdueDigest(digest.user_id, digest.username, digest.email, [entry for entry, _ in claimed])
+            pairs.append((build_message(digest.email, '物品逾期提醒', 'records/email/overdue_digest.html',
+                                        digest=pending, overdue_days=overdue_days),
+                          [log_id for _, log_id in claimed]))
+
+    admins = admin_emails()
+    log_id = None
+    if admins and (logged is None or ('system', 0) in logged):
+        log_id = claim('system', 0, 'overdue_summary', today, ','.join(admins))
+    if log_id is not None:
+        total = sum(len(digest.entries) for digest in digests)
+        pairs.append((build_message(admins, f'逾期物品汇总（共 {total} 件）', 'records/email/overdue_summary.html',
+                                    digests=digests, total=total, overdue_days=overdue_days), [log_id]))
+    return digests, send_logged(pairs)
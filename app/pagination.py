@@ -0,0 +1,158 @@
+"""
+键集（游标）分页
+- 以列表的排序键定位下一页 / 上一页，不使用 OFFSET，翻到多深都只扫描一页数据
+- 不再对每个请求执行 COUNT(*)；需要总数时使用带过期时间的进程内缓存（近似值）
+- 游标为 URL 安全的 base64 字符串，记录翻页方向和边界行的排序键
+"""
+import base64
+import json
+import threading
+import time
+from datetime import datetime
+
+from flask import request
+from sqlalchemy import and_, or_
+
+_count_cache = {}
+_count_lock = threading.Lock()
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(direction, values):
+    payload = json.dumps({'d': direction, 'k': [_encode_value(v) for v in values]}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解析游标，返回 (direction, values)；游标无效时返回 (None, None)"""
+    if not cursor:
+        return None, None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if payload['d'] not in ('next', 'prev'):
+            return None, None
+        return payload['d'], [_decode_value(v) for v in payload['k']]
+    except (ValueError, KeyError, TypeError):
+        return None, None
+
+
+def _after(keys, values, reverse=False):
+    """
+    构造“排在边界行之后”的条件，支持多列混合升降序：
+    (k1 在 v1 之后) OR (k1 = v1 AND k2 在 v2 之后) OR ...
+    另加冗余的 “k1 不早于 v1” 范围条件，使数据库可以在 (k1, ...) 索引上直接定位，而不是从头扫描到边界
+    reverse=True 时取“之前”
+    """
+    clauses = []
+    for i, (column, direction) in enumerate(keys):
+        forward = (direction == 'asc') != reverse
+        step = column > values[i] if forward else column < values[i]
+        equals = [keys[j][0] == values[j] for j in range(i)]
+        clauses.append(and_(*equals, step) if equals else step)
+    if len(keys) == 1:
+        return clauses[0]
+    column, direction = keys[0]
+    bound = column >= values[0] if (direction == 'asc') != reverse else column <= values[0]
+    return and_(bound, or_(*clauses))
+
+
+def cached_count(cache_key, query, ttl=60):
+    """
+    带过期时间的计数缓存：同一列表 + 筛选条件在 ttl 秒内只执行一次 COUNT(*)
+    返回值可能略有滞后，仅用于展示“约 N 条”
+    """
+    now = time.monotonic()
+    with _count_lock:
+        hit = _count_cache.get(cache_key)
+    if hit and now - hit[1] < ttl:
+        return hit[0]
+
+    total = query.order_by(None).count()
+    with _count_lock:
+        if len(_count_cache) > 1000:
+            _count_cache.clear()
+        _count_cache[cache_key] = (total, now)
+    return total
+
+
+class KeysetPagination:
+    """
+    键集分页结果，属性与 Flask-SQLAlchemy 的 Pagination 尽量保持一致（items / page / per_page / has_prev / has_next）
+    :param query: 已应用筛选条件的查询（不要带 order_by）
+    :param keys: 排序键列表 [(列, 'asc'|'desc'), ...]，最后一列必须唯一（通常为主键）
+    :param cursor: 请求中的游标
+    :param page: 当前页码，仅用于展示序号，不参与查询
+    :param total: 可选的（近似）总数
+    """
+
+    def __init__(self, query, keys, per_page, cursor=None, page=1, total=None):
+        self.keys = keys
+        self.per_page = per_page
+        self.cursor = cursor
+        self.total = total
+
+        direction, values = decode_cursor(cursor)
+        if values is not None and len(values) != len(keys):
+            direction, values = None, None
+        self.page = max(page, 1) if direction else 1
+
+        if direction == 'prev':
+            query = query.filter(_after(keys, values, reverse=True))
+            order = [column.asc() if d == 'desc' else column.desc() for column, d in keys]
+        else:
+            if direction == 'next':
+                query = query.filter(_after(keys, values))
+            order = [column.asc() if d == 'asc' else column.desc() for column, d in keys]
+
+        rows = query.order_by(*order).limit(per_page + 1).all()
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+
+        if direction == 'prev':
+            rows.reverse()
+            self.has_prev = has_more
+            self.has_next = True
+        else:
+            self.has_prev = direction == 'next'
+            self.has_next = has_more
+
+        self.items = rows
+        self.next_cursor = encode_cursor('next', self._key_values(rows[-1])) if rows and self.has_next else None
+        self.prev_cursor = encode_cursor('prev', self._key_values(rows[0])) if rows and self.has_prev else None
+
+    def _key_values(self, row):
+        return [getattr(row, column.key) for column, _ in self.keys]
+
+    @property
+    def prev_num(self):
+        return self.page - 1
+
+    @property
+    def next_num(self):
+        return self.page + 1
+
+
+def keyset_paginate(query, keys, per_page, count_key=None):
+    """
+    从当前请求读取 cursor / page 参数并执行键集分页
+    :param count_key: 传入时附带缓存的近似总数（键应包含列表名与筛选条件）
+    """
+    total = cached_count(count_key, query) if count_key is not None else None
+    return KeysetPagination(
+        query, keys, per_page,
+        cursor=request.args.get('cursor'),
+        page=request.args.get('page', 1, type=int),
+        total=total
+    )
@@ -0,0 +1,508 @@
+"""
+物品二维码生成
+- 内容寻址：文件名为 (URL, 渲染参数) 的 SHA-256，存放在 static/qrcodes/<前2位>/<3-4位>/ 分片目录
+  同一内容只生成一次，文件已存在即视为有效，直接复用；物品改名不影响二维码（内容只含物品ID）
+- 批量生成：缺失的文件较多时使用进程池并行渲染；数量很大时作为后台任务执行，可查询进度
+- 批量下载：流式输出 ZIP（PNG 已压缩，按 STORED 存储），边读边发送，内存占用与物品数量无关
+- 按需渲染：/items/<id>/qr.png|svg（需登录，物品不存在返回 404）由物品ID和 QR_CODE_BASE_URL 生成，编码结果保存在进程内 LRU 中
+- 标签页：每页 A4 排列多个标签（二维码 + 名称 / 编号 / 空间路径），逐页渲染并流式输出多页 PDF 或 PNG 压缩包
+"""
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import threading
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import qrcode
+import qrcode.image.svg
+import zlib
+from flask import current_app
+from PIL import Image, ImageDraw, ImageFont
+from sqlalchemy import update, bindparam
+
+from app import db
+
+# 渲染参数（参与内容哈希，修改后会生成新文件）
+QR_RENDER_PARAMS = {
+    'version': 1,
+    'error_correction': 'M',
+    'box_size': 10,
+    'border': 4,
+    'fill_color': 'black',
+    'back_color': 'white',
+}
+
+_ERROR_CORRECTION = {
+    'L': qrcode.constants.ERROR_CORRECT_L,
+    'M': qrcode.constants.ERROR_CORRECT_M,
+    'Q': qrcode.constants.ERROR_CORRECT_Q,
+    'H': qrcode.constants.ERROR_CORRECT_H,
+}
+
+QR_DIR = 'qrcodes'
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+QR_MIMETYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+_render_cache = OrderedDict()
+_render_lock = threading.Lock()
+
+
+def item_qrcode_url(item_id):
+    """二维码内容：物品详情页地址"""
+    base_url = current_app.config.get('QR_CODE_BASE_URL', 'http://127.0.0.1:5000').rstrip('/')
+    return f"{base_url}/items/{item_id}"
+
+
+def qrcode_digest(url, params=None):
+    payload = json.dumps({'url': url, 'params': params or QR_RENDER_PARAMS}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def qrcode_relpath(digest, ext='png'):
+    """相对 static 目录的存储路径（统一使用 / 分隔，可直接用于 url_for('static')）"""
+    return f"{QR_DIR}/{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+
+def render_qrcode_png(url, params=None):
+    """渲染二维码 PNG，返回字节串"""
+    params = params or QR_RENDER_PARAMS
+    qr = qrcode.QRCode(
+        version=params['version'],
+        error_correction=_ERROR_CORRECTION[params['error_correction']],
+        box_size=params['box_size'],
+        border=params['border'],
+    )
+    qr.add_data(url)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color=params['fill_color'], back_color=params['back_color'])
+    buffer = io.BytesIO()
+    img.save(buffer)
+    return buffer.getvalue()
+
+
+def render_qrcode_svg(url, params=None):
+    """渲染二维码 SVG（单个 path 元素，不依赖 Pillow），返回字节串"""
+    params = params or QR_RENDER_PARAMS
+    qr = qrcode.QRCode(
+        version=params['version'],
+        error_correction=_ERROR_CORRECTION[params['error_correction']],
+        box_size=params['box_size'],
+        border=params['border'],
+        image_factory=qrcode.image.svg.SvgPathImage,
+    )
+    qr.add_data(url)
+    qr.make(fit=True)
+    buffer = io.BytesIO()
+    qr.make_image().save(buffer)
+    return buffer.getvalue()
+
+
+_RENDERERS = {'png': render_qrcode_png, 'svg': render_qrcode_svg}
+
+
+def _write_atomic(full_path, data):
+    """先写临时文件再改名，避免并发生成时读到半个文件"""
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    tmp_path = f"{full_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, full_path)
+
+
+def _is_valid_file(full_path):
+    return os.path.isfile(full_path) and os.path.getsize(full_path) > 0
+
+
+def _render_to_file(task):
+    """进程池任务：(url, params, full_path)；按扩展名选择格式，文件已存在时跳过"""
+    url, params, full_path = task
+    if not _is_valid_file(full_path):
+        renderer = _RENDERERS[os.path.splitext(full_path)[1].lstrip('.')]
+        _write_atomic(full_path, renderer(url, params))
+    return full_path
+
+
+def _plan(item_id, fmt='png'):
+    url = item_qrcode_url(item_id)
+    relpath = qrcode_relpath(qrcode_digest(url), ext=fmt)
+    return url, relpath, os.path.join(current_app.static_folder, relpath)
+
+
+def ensure_item_qrcode(item_id, fmt='png'):
+    """确保物品二维码文件存在（已存在则不重新渲染），返回相对 static 目录的路径"""
+    url, relpath, full_path = _plan(item_id, fmt)
+    _render_to_file((url, QR_RENDER_PARAMS, full_path))
+    return relpath
+
+
+def generate_item_qrcodes(item_ids, progress=None, fmt='png'):
+    """
+    批量确保二维码存在
+    缺失数量达到 QR_BATCH_PARALLEL_MIN 时使用进程池（spawn 启动，QR_BATCH_WORKERS 个进程，0 为 CPU 核数）
+    :param progress: 可选回调 progress(done, total)
+    :param fmt: 'png' 或 'svg'
+    :return: {item_id: 相对路径}
+    """
+    paths, missing = {}, []
+    for item_id in item_ids:
+        url, relpath, full_path = _plan(item_id, fmt)
+        paths[item_id] = relpath
+        if not _is_valid_file(full_path):
+            missing.append((url, QR_RENDER_PARAMS, full_path))
+
+    total = len(missing)
+    if progress:
+        progress(0, total)
+    if not missing:
+        return paths
+
+    workers = current_app.config.get('QR_BATCH_WORKERS') or os.cpu_count() or 1
+    if total >= current_app.config.get('QR_BATCH_PARALLEL_MIN', 50) and workers > 1:
+        # 调用方通常是 Web 进程中的后台线程：fork 一个多线程进程，子进程可能卡死在继承来的锁上，改用 spawn
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            chunksize = max(1, total // (workers * 8))
+            for done, _ in enumerate(executor.map(_render_to_file, missing, chunksize=chunksize), 1):
+                if progress:
+                    progress(done, total)
+    else:
+        for done, task in enumerate(missing, 1):
+            _render_to_file(task)
+            if progress:
+                progress(done, total)
+    return paths
+
+
+def save_barcode_paths(paths):
+    """把生成结果写回 Item.barcode_path（只更新有变化的行，单次提交）"""
+    from app.models import Item
+
+    ids = list(paths)
+    changed = 0
+    for start in range(0, len(ids), 500):
+        for item in Item.query.filter(Item.id.in_(ids[start:start + 500])):
+            if item.barcode_path != paths[item.id]:
+                item.barcode_path = paths[item.id]
+                changed += 1
+    db.session.commit()
+    return changed
+
+
+# --- 按需渲染 ---
+def item_qrcode_etag(item_id, fmt):
+    """强 ETag：由内容哈希决定，无需渲染即可计算（用于条件请求）"""
+    return f"{fmt}-{qrcode_digest(item_qrcode_url(item_id))}"
+
+
+def get_item_qrcode_bytes(item_id, fmt='png'):
+    """
+    读取物品二维码的编码字节：先查进程内 LRU，再查已生成的内容寻址文件（仅 PNG），最后现场渲染
+    :return: (bytes, etag)
+    """
+    url = item_qrcode_url(item_id)
+    digest = qrcode_digest(url)
+    key = f"{fmt}-{digest}"
+
+    with _render_lock:
+        data = _render_cache.get(key)
+        if data is not None:
+            _render_cache.move_to_end(key)
+            return data, key
+
+    data = None
+    if fmt == 'png':
+        full_path = os.path.join(current_app.static_folder, qrcode_relpath(digest))
+        if _is_valid_file(full_path):
+            with open(full_path, 'rb') as f:
+                data = f.read()
+    if data is None:
+        data = _RENDERERS[fmt](url)
+
+    max_size = current_app.config.get('QR_RENDER_CACHE_SIZE', 256)
+    with _render_lock:
+        _render_cache[key] = data
+        _render_cache.move_to_end(key)
+        while len(_render_cache) > max_size:
+            _render_cache.popitem(last=False)
+    return data, key
+
+
+# --- 流式 ZIP 下载 ---
+class _ChunkBuffer:
+    """只追加、不可 seek 的写入目标；zipfile 写入后由生成器取走已产生的字节"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _static_file_path(barcode_path):
+    """兼容历史 barcode_path（可能带 static 前缀或 Windows 分隔符），返回绝对路径"""
+    relpath = barcode_path.replace('\\', '/').lstrip('/')
+    if relpath.startswith('static/'):
+        relpath = relpath[len('static/'):]
+    return os.path.join(current_app.static_folder, relpath)
+
+
+def iter_qrcode_zip(item_ids, chunk_size=64 * 1024, batch_size=500):
+    """
+    逐个物品输出 ZIP 字节块（需在 stream_with_context 中迭代）
+    - 已有二维码文件直接按块读取写入；缺失的即时生成
+    - PNG 本身已压缩，使用 ZIP_STORED，不再重复 deflate
+    - 需要补写 barcode_path 的物品在全部输出后统一更新，单次提交
+    """
+    from app.models import Item
+    from app.utils import qrcode_download_name
+
+    buffer = _ChunkBuffer()
+    backfill = []
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zf:
+        for start in range(0, len(item_ids), batch_size):
+            rows = db.session.query(Item.id, Item.name, Item.serial_number, Item.barcode_path).filter(
+                Item.id.in_(item_ids[start:start + batch_size])
+            ).order_by(Item.id).all()
+            for row in rows:
+                full_path = _static_file_path(row.barcode_path) if row.barcode_path else None
+                if not full_path or not _is_valid_file(full_path):
+                    relpath = ensure_item_qrcode(row.id)
+                    full_path = os.path.join(current_app.static_folder, relpath)
+                    backfill.append({'item_id': row.id, 'path': relpath})
+
+                with open(full_path, 'rb') as src, zf.open(qrcode_download_name(row), 'w') as dest:
+                    while True:
+                        data = src.read(chunk_size)
+                        if not data:
+                            break
+                        dest.write(data)
+                        chunk = buffer.pop()
+                        if chunk:
+                            yield chunk
+                chunk = buffer.pop()
+                if chunk:
+                    yield chunk
+    # 中央目录
+    yield buffer.pop()
+
+    if backfill:
+        # barcode_path 不参与全文检索和计数器，可直接批量 UPDATE
+        db.session.execute(
+            update(Item.__table__).where(Item.__table__.c.id == bindparam('item_id')).values(barcode_path=bindparam('path')),
+            backfill
+        )
+        db.session.commit()
+
+
+# --- 标签页（打印） ---
+A4_POINTS = (595.28, 841.89)
+
+# 未配置 LABEL_FONT_PATH 时依次尝试的常见中文字体
+_CJK_FONT_CANDIDATES = (
+    'C:/Windows/Fonts/msyh.ttc',
+    'C:/Windows/Fonts/simhei.ttf',
+    '/System/Library/Fonts/PingFang.ttc',
+    '/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/truetype/wqy/wqy-microhei.ttc',
+)
+
+
+def _qrcode_matrix_image(url, size):
+    """直接由二维码矩阵生成灰度图并放大到 size 像素（不经过完整的 PNG 渲染）"""
+    qr = qrcode.QRCode(error_correction=_ERROR_CORRECTION[QR_RENDER_PARAMS['error_correction']], border=1)
+    qr.add_data(url)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+    img = Image.new('L', (len(matrix), len(matrix)))
+    img.putdata([0 if cell else 255 for row in matrix for cell in row])
+    return img.resize((size, size), Image.NEAREST)
+
+
+def _label_fonts(height):
+    """标签字体：优先 LABEL_FONT_PATH，其次系统常见中文字体，都没有时使用 Pillow 内置字体（不含中文字形）"""
+    font_path = current_app.config.get('LABEL_FONT_PATH') or next(
+        (path for path in _CJK_FONT_CANDIDATES if os.path.exists(path)), None)
+    sizes = (max(10, height // 6), max(8, height // 9))
+    if font_path:
+        return [(ImageFont.truetype(font_path, size), size) for size in sizes]
+    return [(ImageFont.load_default(size=size), size) for size in sizes]
+
+
+def _fit_text(draw, text, font, width):
+    """超出宽度时截断并追加省略号"""
+    text = text or ''
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while text and draw.textlength(text + '…', font=font) > width:
+        text = text[:-1]
+    return text + '…'
+
+
+def _iter_label_rows(item_ids, batch_size=500):
+    """按批读取标签所需的列：(id, name, serial_number, full_path)"""
+    from app.models import Item, Space
+
+    for start in range(0, len(item_ids), batch_size):
+        yield from db.session.query(Item.id, Item.name, Item.serial_number, Space.full_path).outerjoin(
+            Space, Item.space_id == Space.id
+        ).filter(Item.id.in_(item_ids[start:start + batch_size])).order_by(Item.id)
+
+
+def iter_label_pages(item_ids):
+    """
+    逐页生成标签图（灰度 PIL Image），每次只在内存中保留一页
+    每页 LABEL_SHEET_COLUMNS × LABEL_SHEET_ROWS 个标签，分辨率 LABEL_SHEET_DPI
+    """
+    config = current_app.config
+    columns, rows, dpi = config['LABEL_SHEET_COLUMNS'], config['LABEL_SHEET_ROWS'], config['LABEL_SHEET_DPI']
+    page_size = (round(A4_POINTS[0] / 72 * dpi), round(A4_POINTS[1] / 72 * dpi))
+    margin = dpi * 3 // 10  # 约 7.6mm 页边距
+    cell_w = (page_size[0] - 2 * margin) // columns
+    cell_h = (page_size[1] - 2 * margin) // rows
+    padding = max(4, cell_h // 12)
+    qr_size = cell_h - 2 * padding
+    text_width = cell_w - qr_size - 3 * padding
+    title_font, body_font = _label_fonts(cell_h)
+
+    page, draw, slot = None, None, 0
+    for row in _iter_label_rows(item_ids):
+        if page is None:
+            page = Image.new('L', page_size, 255)
+            draw = ImageDraw.Draw(page)
+        x = margin + (slot % columns) * cell_w
+        y = margin + (slot // columns) * cell_h
+        draw.rectangle([x, y, x + cell_w - 1, y + cell_h - 1], outline=200)
+        page.paste(_qrcode_matrix_image(item_qrcode_url(row.id), qr_size), (x + padding, y + padding))
+
+        text_x = x + qr_size + 2 * padding
+        lines = [(row.name, title_font), (row.serial_number, body_font), (row.full_path, body_font)]
+        line_y = y + padding
+        for text, (font, size) in lines:
+            draw.text((text_x, line_y), _fit_text(draw, text, font, text_width), font=font, fill=0)
+            line_y += size + padding // 2
+
+        slot += 1
+        if slot == columns * rows:
+            yield page
+            page, draw, slot = None, None, 0
+    if page is not None:
+        yield page
+
+
+def iter_label_sheet_pdf(item_ids):
+    """
+    流式输出多页 PDF：每页一张灰度位图（Flate 压缩），逐页写出对象，最后写页树和交叉引用表
+    内存中只保留当前页与各对象偏移量
+    """
+    offsets = {}
+    position = 0
+    page_ids = []
+
+    def emit(data):
+        nonlocal position
+        position += len(data)
+        return data
+
+    def obj(number, body, stream=None):
+        offsets[number] = position
+        parts = [f'{number} 0 obj\n'.encode(), body]
+        if stream is not None:
+            parts += [b'\nstream\n', stream, b'\nendstream']
+        parts.append(b'\nendobj\n')
+        return emit(b''.join(parts))
+
+    yield emit(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    yield obj(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+
+    next_id = 3
+    width_pt, height_pt = A4_POINTS
+    for page in iter_label_pages(item_ids):
+        image_id, content_id, page_id = next_id, next_id + 1, next_id + 2
+        next_id += 3
+        data = zlib.compress(page.tobytes())
+        yield obj(image_id, (
+            f'<< /Type /XObject /Subtype /Image /Width {page.width} /Height {page.height} '
+            f'/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode /Length {len(data)} >>'
+        ).encode(), data)
+        content = f'q {width_pt} 0 0 {height_pt} 0 0 cm /Im0 Do Q'.encode()
+        yield obj(content_id, f'<< /Length {len(content)} >>'.encode(), content)
+        yield obj(page_id, (
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width_pt} {height_pt}] '
+            f'/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>'
+        ).encode())
+        page_ids.append(page_id)
+
+    kids = ' '.join(f'{page_id} 0 R' for page_id in page_ids)
+    yield obj(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>'.encode())
+
+    xref_position = position
+    lines = [f'xref\n0 {next_id}\n', '0000000000 65535 f \n']
+    lines += [f'{offsets[number]:010d} 00000 n \n' for number in range(1, next_id)]
+    lines.append(f'trailer\n<< /Size {next_id} /Root 1 0 R >>\nstartxref\n{xref_position}\n%%EOF\n')
+    yield emit(''.join(lines).encode())
+
+
+def iter_label_sheet_png_zip(item_ids):
+    """流式输出 ZIP：每页一张 PNG（labels_001.png ...）"""
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zf:
+        for number, page in enumerate(iter_label_pages(item_ids), 1):
+            with zf.open(f'labels_{number:03d}.png', 'w') as dest:
+                page.save(dest, 'PNG', optimize=False)
+            yield buffer.pop()
+    yield buffer.pop()
+
+
+# --- 后台批量任务 ---
+def start_qrcode_job(item_ids):
+    """
+    在后台线程中批量生成二维码并回写路径，立即返回任务ID
+    进度保存在进程内（多进程部署时只能在发起请求的进程中查询）
+    """
+    app = current_app._get_current_object()
+    job_id = uuid.uuid4().hex
+    job = {'id': job_id, 'status': 'running', 'total': None, 'done': 0, 'items': len(item_ids), 'error': None}
+    with _jobs_lock:
+        if len(_jobs) > 100:
+            for old_id in [key for key, value in _jobs.items() if value['status'] != 'running']:
+                del _jobs[old_id]
+        _jobs[job_id] = job
+
+    def progress(done, total):
+        job['done'], job['total'] = done, total
+
+    def run():
+        with app.app_context():
+            try:
+                save_barcode_paths(generate_item_qrcodes(item_ids, progress=progress))
+                job['status'] = 'finished'
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"批量生成二维码失败: {str(e)}", exc_info=True)
+                job['status'] = 'failed'
+                job['error'] = str(e)
+
+    threading.Thread(target=run, name=f'qrcode-job-{job_id[:8]}', daemon=True).start()
+    return job_id
+
+
+def get_qrcode_job(job_id):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    return dict(job) if job else None
@@ -0,0 +1,434 @@
+"""
+预约状态事件驱动调度
+- 进程内最小堆保存每个未结束预约的下一批到期事件 (到期时间UTC, 序号, 事件类型, 预约ID, 版本)：
+  remind  开始前 12 小时提醒（scheduled）
+  start   到达开始时间：scheduled -> active / conflicted
+  expire  active 超过开始 24 小时或到达结束时间、conflicted 到达结束时间：-> expired
+  resume  物品变回可用：conflicted -> active
+- 启动时从数据库重建；任意预约新增 / 修改 / 删除、物品变回可用，提交后通过会话事件更新堆
+- 预约状态或时间变化时版本号 +1，堆中旧版本的事件出堆时直接丢弃（惰性删除）
+- 调度器只保留一个 date 任务，触发时间始终为堆顶事件的到期时间；只处理已到期事件对应的预约，
+  同一次触发的所有事件按类型批量 UPDATE，一次提交，通知在提交后统一发送
+注意：堆为进程内状态，其他进程（多 worker 部署）的修改由定期重建（RESERVATION_RESYNC_MINUTES）补齐
+"""
+import heapq
+import itertools
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event, inspect, select
+
+from app import db
+
+OPEN_STATUSES = ('scheduled', 'active', 'conflicted')
+REMIND_BEFORE = timedelta(hours=12)
+REMIND_WINDOW = timedelta(hours=1)
+PICKUP_DEADLINE = timedelta(hours=24)
+
+
+def due_events(status, start_utc, end_utc):
+    """按预约当前状态计算待触发事件 [(到期时间UTC, 事件类型)]"""
+    if status == 'scheduled':
+        return [(start_utc - REMIND_BEFORE, 'remind'), (start_utc, 'start')]
+    if status == 'active':
+        return [(min(start_utc + PICKUP_DEADLINE, end_utc), 'expire')]
+    if status == 'conflicted':
+        return [(end_utc, 'expire')]
+    return []
+
+
+class ReservationTimeline:
+    """预约到期事件的最小堆（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heap = []
+        self._versions = {}
+        self._seq = itertools.count()
+        self.enabled = False
+        self.on_change = None  # 堆顶变化时回调（参数为新的最早到期时间或 None），用于重新设置调度任务
+
+    def _push(self, due, kind, reservation_id, version):
+        heapq.heappush(self._heap, (due, next(self._seq), kind, reservation_id, version))
+
+    def _schedule_locked(self, reservation_id, status, start_utc, end_utc):
+        version = self._versions.get(reservation_id, 0) + 1
+        events = due_events(status, start_utc, end_utc)
+        if not events:
+            self._versions.pop(reservation_id, None)
+            return
+        self._versions[reservation_id] = version
+        for due, kind in events:
+            self._push(due, kind, reservation_id, version)
+
+    def _next_due_locked(self):
+        while self._heap:
+            due, _, _, reservation_id, version = self._heap[0]
+            if self._versions.get(reservation_id) == version:
+                return due
+            heapq.heappop(self._heap)
+        return None
+
+    def notify(self):
+        """通知调度器最早到期时间（可能未变，由回调自行处理）"""
+        if self.on_change:
+            self.on_change(self.next_due())
+
+    def rebuild(self):
+        """从数据库重建：只读取未结束预约的 ID / 状态 / 时间；物品已可用的冲突预约立即安排恢复"""
+        from app.models import Item, Reservation
+
+        rows = db.session.execute(
+            select(Reservation.id, Reservation.status, Reservation._utc_reservation_start,
+                   Reservation._utc_reservation_end, Item.status.label('item_status'))
+            .join(Item, Reservation.item_id == Item.id)
+            .where(Reservation.status.in_(OPEN_STATUSES))
+            .order_by(Reservation._utc_reservation_start)
+        ).all()
+        now_utc = datetime.utcnow()
+        with self._lock:
+            self._heap = []
+            self._versions = {}
+            for row in rows:
+                self._schedule_locked(row.id, row.status, row._utc_reservation_start, row._utc_reservation_end)
+                if row.status == 'conflicted' and row.item_status == 'available':
+                    self._push(now_utc, 'resume', row.id, self._versions[row.id])
+        self.notify()
+        return len(rows)
+
+    def schedule(self, changes, resumes=()):
+        """
+        更新堆
+        :param changes: [(预约ID, 状态, 开始UTC, 结束UTC)]，状态为 None 表示预约已删除
+        :param resumes: 需要立即尝试恢复的冲突预约 ID（物品刚变回可用）
+        """
+        if not self.enabled:
+            return
+        now_utc = datetime.utcnow()
+        with self._lock:
+            for reservation_id, status, start_utc, end_utc in changes:
+                self._schedule_locked(reservation_id, status, start_utc, end_utc)
+            for reservation_id in resumes:
+                if reservation_id in self._versions:
+                    self._push(now_utc, 'resume', reservation_id, self._versions[reservation_id])
+        self.notify()
+
+    def next_due(self):
+        with self._lock:
+            return self._next_due_locked()
+
+    def pop_due(self, now_utc):
+        """取出所有已到期且仍有效的事件 [(事件类型, 预约ID)]，按到期时间排序"""
+        due_list = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now_utc:
+                due, _, kind, reservation_id, version = heapq.heappop(self._heap)
+                if self._versions.get(reservation_id) == version:
+                    due_list.append((kind, reservation_id))
+        return due_list
+
+    def __len__(self):
+        with self._lock:
+            return len(self._versions)
+
+
+timeline = ReservationTimeline()
+
+
+# --- 到期事件的批量处理：每次触发一个短事务、一次提交 ---
+# 预约状态变化后发送的通知：类型 -> (主题, 模板)
+NOTIFICATIONS = {
+    'remind': ('预约即将开始', 'reservations/email/reservation_reminder.html'),
+    'conflict': ('预约暂时冲突', 'reservations/email/reservation_conflict.html'),
+    'resumed': ('预约已恢复有效', 'reservations/email/reservation_reminder.html'),  # 复用提醒模板
+    'expired': ('预约已作废', 'reservations/email/reservation_expired.html'),
+    'handed_off': ('预约物品已可借用', 'reservations/email/reservation_ready.html'),
+}
+
+
+class _Tick:
+    """
+    一次触发内的批量状态流转
+    按 作废 -> 恢复 -> 开始 的顺序执行（先释放物品，再把物品交给等待中的冲突预约，最后处理新开始的预约），
+    每一步一条 SELECT（关联物品状态）+ 少量按 ID 的批量 UPDATE；
+    批量 SQL 不经过 ORM 事件，空间计数器、物品快照、事件堆在这里同步维护
+    """
+
+    def __init__(self, now_utc):
+        from app.models import Item, Reservation
+
+        self.now = now_utc
+        self.r = Reservation.__table__
+        self.i = Item.__table__
+        self.changes = {}         # 预约ID -> (预约ID, 新状态, 开始UTC, 结束UTC)
+        self.item_ids = set()     # 涉及的物品（快照失效）
+        self.count_deltas = {}    # (space_id, status) -> 数量变化
+        self.released = set()     # 本次释放为可用的物品
+        self.notifications = []   # (预约ID, 通知类型)
+        self.transitions = {}     # 新状态 -> 实际变更的预约数（以 UPDATE 实际更新的行为准）
+
+    def _rows(self, where, order_by=None):
+        r, i = self.r, self.i
+        statement = select(r.c.id, r.c.item_id, r.c.status, r.c.reservation_start, r.c.reservation_end,
+                           i.c.status.label('item_status'), i.c.space_id) \
+            .select_from(r.join(i, r.c.item_id == i.c.id)).where(where)
+        if order_by is not None:
+            statement = statement.order_by(order_by)
+        return db.session.execute(statement).all()
+
+    def _update(self, table, ids, guard, **values):
+        """
+        带状态守卫的按 ID 批量 UPDATE，返回实际被更新的 ID 集合
+        SELECT 之后被并发修改、守卫不再成立的行不会更新，也不计入流转、不发送通知
+        """
+        ids = list(ids)
+        if not ids:
+            return set()
+        statement = table.update().where(table.c.id.in_(ids), guard).values(**values)
+        if db.session.get_bind().dialect.update_returning:
+            return set(db.session.execute(statement.returning(table.c.id)).scalars())
+        # 不支持 RETURNING 的数据库：逐行执行，按每条语句的 rowcount 判断
+        return {row_id for row_id in ids
+                if db.session.execute(table.update().where(table.c.id == row_id, guard).values(**values)).rowcount}
+
+    def _set_reservations(self, rows, status, from_statuses):
+        """返回实际变更的行"""
+        changed = self._update(self.r, (row.id for row in rows), self.r.c.status.in_(from_statuses), status=status)
+        rows = [row for row in rows if row.id in changed]
+        for row in rows:
+            self.changes[row.id] = (row.id, status, row.reservation_start, row.reservation_end)
+            self.item_ids.add(row.item_id)
+        self.transitions[status] = self.transitions.get(status, 0) + len(rows)
+        return rows
+
+    def _set_items(self, rows, status, from_status):
+        """返回物品实际变更的行；计数器只按实际变更调整"""
+        changed = self._update(self.i, (row.item_id for row in rows), self.i.c.status == from_status, status=status)
+        rows = [row for row in rows if row.item_id in changed]
+        for row in rows:
+            for key, delta in (((row.space_id, from_status), -1), ((row.space_id, status), 1)):
+                self.count_deltas[key] = self.count_deltas.get(key, 0) + delta
+        return rows
+
+    def _activate(self, rows, from_status):
+        """先锁定物品（available -> reserved），再把锁定成功的预约置为有效；预约未能更新的撤销锁定"""
+        locked = self._set_items(rows, 'reserved', 'available')
+        activated = self._set_reservations(locked, 'active', (from_status,))
+        activated_ids = {row.id for row in activated}
+        self._set_items([row for row in locked if row.id not in activated_ids], 'available', 'reserved')
+        locked_ids = {row.id for row in locked}
+        return activated, [row for row in rows if row.id not in locked_ids]
+
+    def expire(self, ids):
+        # active：超过开始时间 24 小时仍未取走，或已过预约结束时间；conflicted：已过预约结束时间
+        if not ids:
+            return
+        r = self.r
+        rows = self._rows(r.c.id.in_(ids) & (
+            ((r.c.status == 'active') & ((r.c.reservation_start <= self.now - PICKUP_DEADLINE)
+                                         | (r.c.reservation_end <= self.now)))
+            | ((r.c.status == 'conflicted') & (r.c.reservation_end <= self.now))
+        ))
+        expired = self._set_reservations(rows, 'expired', ('active', 'conflicted'))
+        # 物品仍处于已预约（未被借走）状态则释放为可用
+        released = self._set_items([row for row in expired if row.status == 'active'], 'available', 'reserved')
+        self.released.update(row.item_id for row in released)
+        self.notifications += [(row.id, 'expired') for row in expired if row.status == 'active']
+
+    def resume(self, ids):
+        # 物品变回可用（含本次刚释放的物品）且仍在预约时段内的冲突预约恢复为有效，每件物品取最早的一条
+        if not ids and not self.released:
+            return
+        r, i = self.r, self.i
+        rows = self._rows((r.c.status == 'conflicted') & (r.c.reservation_end > self.now)
+                          & (i.c.status == 'available')
+                          & (r.c.id.in_(ids) | r.c.item_id.in_(self.released)),
+                          order_by=r.c.reservation_start)
+        chosen = list({row.item_id: row for row in reversed(rows)}.values())
+        resumed, _ = self._activate(chosen, 'conflicted')
+        self.notifications += [(row.id, 'resumed') for row in resumed]
+
+    def start(self, ids):
+        # 到达开始时间：物品可用则生效并锁定物品，否则标记冲突（每件物品只有最早的一条可生效）
+        if not ids:
+            return
+        r = self.r
+        rows = self._rows(r.c.id.in_(ids) & (r.c.status == 'scheduled') & (r.c.reservation_start <= self.now),
+                          order_by=r.c.reservation_start)
+        activated, conflicted, taken = [], [], set()
+        for row in rows:
+            if row.item_status == 'available' and row.item_id not in taken:
+                activated.append(row)
+                taken.add(row.item_id)
+            else:
+                conflicted.append(row)
+        # 物品在查询之后被借走（锁定失败）的预约同样标记为冲突
+        _, unlocked = self._activate(activated, 'scheduled')
+        conflicted = self._set_reservations(conflicted + unlocked, 'conflicted', ('scheduled',))
+        # 发送冲突提醒：告知预约人物品未归还
+        self.notifications += [(row.id, 'conflict') for row in conflicted]
+
+    def remind(self, ids):
+        # 开始前 11~12 小时内才提醒（预约创建时已不足 11 小时的不再提醒）
+        if not ids:
+            return
+        r = self.r
+        rows = db.session.execute(select(r.c.id).where(
+            r.c.id.in_(ids), r.c.status == 'scheduled',
+            r.c.reservation_start > self.now + REMIND_BEFORE - REMIND_WINDOW,
+            r.c.reservation_start <= self.now + REMIND_BEFORE
+        )).scalars().all()
+        self.notifications += [(reservation_id, 'remind') for reservation_id in rows]
+
+    def flush_counters(self):
+        from app.models import apply_item_count_deltas
+
+        deltas = {key: delta for key, delta in self.count_deltas.items() if delta}
+        if deltas:
+            apply_item_count_deltas(db.session.connection(), deltas)
+
+    def after_commit(self):
+        from app.availability import invalidate_availability
+        from app.item_snapshot import invalidate_item_snapshots
+
+        invalidate_item_snapshots(self.item_ids)
+        invalidate_availability(self.item_ids)
+        timeline.schedule(self.changes.values())
+        send_notifications(self.notifications)
+
+
+def send_notifications(notifications):
+    """
+    提交后发送通知：一次查询加载预约（连同物品、预约人），逐条在通知台账中登记，
+    只发送登记成功（此前未发送过）的通知，所有邮件在一个后台线程中发送
+    """
+    from sqlalchemy.orm import joinedload
+    from app.email import build_message
+    from app.models import Reservation
+    from app.notifications import claim, reservation_version, send_logged
+
+    if not notifications:
+        return None
+    reservations = {
+        res.id: res for res in Reservation.query.options(
+            joinedload(Reservation.item), joinedload(Reservation.user)
+        ).filter(Reservation.id.in_({reservation_id for reservation_id, _ in notifications}))
+    }
+    pairs = []
+    for reservation_id, kind in notifications:
+        res = reservations.get(reservation_id)
+        if res is None or res.user is None:
+            continue
+        log_id = claim('reservation', res.id, kind, reservation_version(res), res.user.email)
+        if log_id is None:
+            continue
+        subject, template = NOTIFICATIONS[kind]
+        pairs.append((build_message(res.user.email, subject, template, reservation=res, item=res.item), [log_id]))
+    return send_logged(pairs)
+
+
+def hand_off_item(item, now_utc=None):
+    """
+    物品变回可用时立即交接（在调用方事务中执行，随调用方一起提交）：
+    最早的仍在时段内的冲突预约、或已到开始时间的待开始预约立即生效，物品同时锁定为已预约，
+    避免在下一次调度触发前被其他人借走
+    :return: 生效的预约（调用方提交后调用 notify_hand_off 通知预约人），没有则为 None
+    """
+    from app.models import Reservation
+
+    if item.status != 'available':
+        return None
+    now_utc = now_utc or datetime.utcnow()
+    reservation = Reservation.query.filter(
+        Reservation.item_id == item.id,
+        Reservation.status.in_(('conflicted', 'scheduled')),
+        Reservation._utc_reservation_start <= now_utc,
+        Reservation._utc_reservation_end > now_utc
+    ).order_by(Reservation._utc_reservation_start).first()
+    if reservation is None:
+        return None
+    reservation.status = 'active'
+    item.status = 'reserved'
+    return reservation
+
+
+def notify_hand_off(reservation):
+    """交接提交后通知预约人（登记通知台账，后台线程发送）"""
+    return send_notifications([(reservation.id, 'handed_off')])
+
+
+def run_due_events(now_utc=None):
+    """处理所有已到期事件：批量更新后一次提交，通知在提交后发送；返回处理的事件数"""
+    now_utc = now_utc or datetime.utcnow()
+    events = timeline.pop_due(now_utc)
+    if events:
+        by_kind = {}
+        for kind, reservation_id in events:
+            by_kind.setdefault(kind, []).append(reservation_id)
+        tick = _Tick(now_utc)
+        try:
+            tick.expire(by_kind.get('expire', []))
+            tick.resume(by_kind.get('resume', []))
+            tick.start(by_kind.get('start', []))
+            tick.remind(by_kind.get('remind', []))
+            tick.flush_counters()
+            db.session.commit()
+        except Exception:
+            # 已出堆的事件随事务一起作废，从数据库重建后下次触发重试
+            db.session.rollback()
+            timeline.rebuild()
+            raise
+        applied = {status: count for status, count in tick.transitions.items() if count}
+        if applied:
+            current_app.logger.info(f"预约状态流转：{applied}")
+        tick.after_commit()
+    # 没有状态变化（如仅发送提醒）时堆不会更新，这里主动重新设置下一次触发时间
+    timeline.notify()
+    return len(events)
+
+
+# --- 提交后同步：预约新增 / 修改 / 删除、物品变回可用 ---
+def _collect_timeline_changes(session, flush_context):
+    from app.models import Item, Reservation
+
+    if not timeline.enabled:
+        return
+    changes = session.info.setdefault('timeline_changes', {})
+    released = session.info.setdefault('timeline_released_items', set())
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Reservation):
+            changes[obj.id] = (obj.id, obj.status, obj._utc_reservation_start, obj._utc_reservation_end)
+        elif isinstance(obj, Item) and 'available' in inspect(obj).attrs.status.history.added:
+            released.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, Reservation):
+            changes[obj.id] = (obj.id, None, None, None)
+
+
+def _apply_after_commit(session):
+    from app.models import Reservation
+
+    changes = session.info.pop('timeline_changes', None)
+    released = session.info.pop('timeline_released_items', None)
+    if not changes and not released:
+        return
+    resumes = []
+    if released:
+        # after_commit 中不能再使用本会话执行 SQL，改用独立连接
+        with db.engine.connect() as conn:
+            resumes = list(conn.execute(
+                select(Reservation.id).where(Reservation.item_id.in_(released), Reservation.status == 'conflicted')
+                .order_by(Reservation._utc_reservation_start)
+            ).scalars())
+    timeline.schedule((changes or {}).values(), resumes)
+
+
+def _discard_timeline_changes(session):
+    session.info.pop('timeline_changes', None)
+    session.info.pop('timeline_released_items', None)
+
+
+event.listen(db.session, 'after_flush', _collect_timeline_changes)
+event.listen(db.session, 'after_commit', _apply_after_commit)
+event.listen(db.session, 'after_rollback', _discard_timeline_changes)
@@ -1,8 +1,9 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, current_app
 from flask_login import login_required, current_user
 from app import db
 from app.models import User
 from app.utils import super_admin_required
+from app.pagination import keyset_paginate
 
 # 此蓝图用于处理“系统级”管理功能
 # 普通的物品管理在 items.py，空间管理在 spaces.py
@@ -17,9 +18,8 @@ def user_management():
     【超级管理员专属】用户管理界面
     功能：查看所有用户，任免普通管理员
     """
-    page = request.args.get('page', 1, type=int)
-    # 按ID排序展示
-    users = User.query.order_by(User.id.desc()).paginate(page=page, per_page=15, error_out=False)
+    # 按ID倒序键集分页展示
+    users = keyset_paginate(User.query, [(User.id, 'desc')], 15, count_key=('admin.user_management',))
 
     return render_template('auth/user_management.html', users=users)
 
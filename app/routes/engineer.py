@@ -104,10 +104,10 @@ def trigger_task(task_name):
     """手动触发后台任务"""
     try:
         if task_name == 'update_reservation_status':
-            update_reservation_status(current_app.app_context())
+            update_reservation_status(rebuild=True)
             flash('任务 [预约状态流转] 已手动触发执行', 'success')
         elif task_name == 'check_overdue':
-            check_overdue_records(current_app.app_context())
+            check_overdue_records()
             flash('任务 [逾期检查] 已手动触发执行', 'success')
         else:
             flash(f'未知任务: {task_name}', 'warning')
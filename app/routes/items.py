@@ -1,15 +1,21 @@
-import os
-import io
-import zipfile
-from flask import Blueprint, render_template, redirect, url_for, flash, request, send_file, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify, abort, \
+    Response, stream_with_context
 from flask_login import login_required, current_user
 from datetime import datetime
+from sqlalchemy.orm import joinedload
 
 from app import db
-from app.models import Item, Space, Record, Reservation
-from app.forms.item_forms import ItemForm
+from app.models import Item, Space
+from app.forms.item_forms import ItemForm, ItemImportForm
 
 from app.utils import generate_and_save_item_qrcode
+from app.qrcodes import generate_item_qrcodes, save_barcode_paths, start_qrcode_job, get_qrcode_job, iter_qrcode_zip, \
+    get_item_qrcode_bytes, item_qrcode_etag, QR_MIMETYPES, iter_label_sheet_pdf, iter_label_sheet_png_zip
+from app.search import filter_by_search
+from app.pagination import keyset_paginate
+from app.item_snapshot import get_item_snapshot
+from app.importer import import_items, read_rows, ItemImportError
+from app.exporter import export_response
 
 bp = Blueprint('items', __name__)
 
@@ -17,59 +23,51 @@ bp = Blueprint('items', __name__)
 @bp.route('/')
 @login_required
 def all_items():
-    # 获取分页参数
-    page = request.args.get('page', 1, type=int)
     per_page = 15  # 每页显示15条
 
     query = request.args.get('query', '').strip()
     status = request.args.get('status', '')
 
-    items_query = Item.query
+    # 一并加载所在空间（模板显示 space.full_path），避免逐行查询；列表不显示功能描述，不读取该列
+    items_query = Item.query.options(joinedload(Item.space), *Item.list_options())
 
     # 应用搜索条件
     if query:
-        items_query = items_query.filter(
-            (Item.name.ilike(f'%{query}%') |
-             Item.function.ilike(f'%{query}%') |
-             Item.serial_number.ilike(f'%{query}%'))
-        )
+        items_query = filter_by_search(items_query, 'item', query)
 
     # 应用状态筛选
     if status:
         items_query = items_query.filter(Item.status == status)
 
-    # 默认按 ID 排序，确保分页顺序稳定
-    items_query = items_query.order_by(Item.id.asc())
-
-    # 使用 paginate
-    pagination = items_query.paginate(page=page, per_page=per_page, error_out=False)
+    # 按 ID 键集分页，确保分页顺序稳定；总数为缓存的近似值
+    pagination = keyset_paginate(items_query, [(Item.id, 'asc')], per_page,
+                                 count_key=('items.all_items', query, status))
     items = pagination.items
 
     return render_template('items/all_items.html', items=items, pagination=pagination)
 
 
+@bp.route('/export')
+@login_required
+def export_items():
+    """导出物品（CSV / JSONL，筛选条件同物品列表），流式输出"""
+    if not current_user.is_admin():
+        flash('没有权限导出数据')
+        return redirect(url_for('items.all_items'))
+    return export_response('items', request.args)
+
+
 @bp.route('/<int:id>')
 @login_required
 def view(id):
-    item = Item.query.get_or_404(id)
+    # 物品与所在空间一次联表读取（模板显示空间名称和路径）
+    item = Item.query.options(joinedload(Item.space)).filter(Item.id == id).first_or_404()
 
-    # 获取当前借用记录（如果有）
-    current_record = Record.query.filter_by(
-        item_id=id,
-        status='using'
-    ).first()
-
-    # 获取最近的使用记录
-    recent_records = Record.query.filter_by(item_id=id).order_by(Record._utc_start_time.desc()).limit(5).all()
+    # 借用 / 预约状态快照：当前借用记录、最近记录、有效预约合并为一次查询，并短时缓存
+    snapshot = get_item_snapshot(id)
 
     # 获取当前有效的预约（用于展示给管理员或提示冲突）
-    active_reservations = Reservation.query.filter_by(
-        item_id=id,
-        status='active'
-    ).filter(
-        Reservation._utc_reservation_start <= datetime.utcnow(),
-        Reservation._utc_reservation_end >= datetime.utcnow()
-    ).all()
+    active_reservations = snapshot.active_reservations()
 
     # 【新增】判断当前用户是否有权借用
     # 条件1：物品可用
@@ -79,22 +77,38 @@ def view(id):
         user_can_use = True
     elif item.status == 'reserved':
         # 检查是否存在属于当前用户的active预约
-        my_active_res = Reservation.query.filter_by(
-            item_id=id,
-            user_id=current_user.id,
-            status='active'
-        ).first()
-        if my_active_res:
-            user_can_use = True
+        user_can_use = snapshot.has_active_reservation(current_user.id)
 
     return render_template('items/view.html',
                            item=item,
-                           current_record=current_record,
-                           recent_records=recent_records,
+                           current_record=snapshot.current_record,
+                           recent_records=snapshot.recent_records,
                            active_reservations=active_reservations,
                            user_can_use=user_can_use)  # 传递标志位
 
 
+@bp.route('/<int:id>/qr.<any(png, svg):fmt>')
+@login_required
+def qr_image(id, fmt):
+    """
+    按需渲染物品二维码（内容只由物品ID和 QR_CODE_BASE_URL 决定，只做一次物品存在性检查）
+    带强 ETag 和 Cache-Control，浏览器 / 代理重复请求直接命中缓存或返回 304
+    """
+    # 不存在的物品不渲染，避免为任意ID生成并缓存二维码
+    if db.session.query(Item.id).filter_by(id=id).first() is None:
+        abort(404)
+    etag = item_qrcode_etag(id, fmt)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        data, etag = get_item_qrcode_bytes(id, fmt)
+        response = Response(data, mimetype=QR_MIMETYPES[fmt])
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = current_app.config['QR_CACHE_MAX_AGE']
+    return response
+
+
 @bp.route('/create/<int:space_id>', methods=['GET', 'POST'])
 @login_required
 def create(space_id):
@@ -202,42 +216,86 @@ def batch_qr_action():
         flash('请先选择需要操作的物品', 'warning')
         return redirect(request.referrer or url_for('items.all_items'))
 
-    items = Item.query.filter(Item.id.in_(item_ids)).all()
+    ids = [item_id for (item_id,) in db.session.query(Item.id).filter(Item.id.in_(item_ids)).order_by(Item.id)]
 
     if action == 'generate':
-        # 批量生成/重新生成
-        count = 0
-        for item in items:
-            qr_path = generate_and_save_item_qrcode(item)
-            item.barcode_path = qr_path
-            count += 1
-        db.session.commit()
-        flash(f'成功为 {count} 个物品生成了二维码', 'success')
+        # 批量生成：已存在的二维码直接复用；数量很大时转为后台任务，避免阻塞请求
+        if len(ids) >= current_app.config['QR_BATCH_BACKGROUND_MIN']:
+            job_id = start_qrcode_job(ids)
+            flash(f'已开始在后台为 {len(ids)} 个物品生成二维码，进度可在 '
+                  f'{url_for("items.qr_job_status", job_id=job_id)} 查询', 'info')
+        else:
+            save_barcode_paths(generate_item_qrcodes(ids))
+            flash(f'成功为 {len(ids)} 个物品生成了二维码', 'success')
 
     elif action == 'download':
-        # 批量打包下载
-        memory_file = io.BytesIO()
-        with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-            for item in items:
-                # 检查二维码是否存在，不存在则生成
-                full_path = None
-                if item.barcode_path:
-                    full_path = os.path.join(current_app.root_path, 'static', item.barcode_path)
-
-                if not full_path or not os.path.exists(full_path):
-                    item.barcode_path = generate_and_save_item_qrcode(item)
-                    db.session.commit()
-                    full_path = os.path.join(current_app.root_path, 'static', item.barcode_path)
-
-                # 获取文件名放入压缩包
-                arcname = os.path.basename(item.barcode_path)
-                zf.write(full_path, arcname)
-
-        memory_file.seek(0)
-        return send_file(
-            memory_file,
-            download_name=f'qrcodes_{datetime.now().strftime("%Y%m%d%H%M")}.zip',
-            as_attachment=True
+        # 批量打包下载：流式输出 ZIP，缺失的二维码即时生成
+        filename = f'qrcodes_{datetime.now().strftime("%Y%m%d%H%M")}.zip'
+        return Response(
+            stream_with_context(iter_qrcode_zip(ids)),
+            mimetype='application/zip',
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
         )
 
-    return redirect(request.referrer or url_for('items.all_items'))
\ No newline at end of file
+    elif action in ('labels', 'labels_png'):
+        # 打印标签页：逐页渲染并流式输出（PDF，或每页一张 PNG 的压缩包）
+        timestamp = datetime.now().strftime("%Y%m%d%H%M")
+        if action == 'labels':
+            body, mimetype, filename = iter_label_sheet_pdf(ids), 'application/pdf', f'labels_{timestamp}.pdf'
+        else:
+            body, mimetype, filename = iter_label_sheet_png_zip(ids), 'application/zip', f'labels_{timestamp}.zip'
+        return Response(
+            stream_with_context(body),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
+
+    return redirect(request.referrer or url_for('items.all_items'))
+
+
+@bp.route('/batch_qr/jobs/<job_id>')
+@login_required
+def qr_job_status(job_id):
+    """后台二维码任务进度（JSON）"""
+    if not current_user.is_admin():
+        abort(403)
+    job = get_qrcode_job(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job)
+
+
+@bp.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_items_view():
+    """批量导入物品：先整体校验，可仅预检查；导入完成后在后台生成二维码"""
+    if not current_user.is_admin():
+        flash('没有权限导入物品')
+        return redirect(url_for('items.all_items'))
+
+    form = ItemImportForm()
+    report = None
+    if form.validate_on_submit():
+        upload = form.file.data
+        try:
+            report = import_items(
+                read_rows(upload.stream, upload.filename),
+                created_by=current_user.id,
+                dry_run=form.dry_run.data,
+                create_spaces=form.create_spaces.data,
+                batch_size=current_app.config['ITEM_IMPORT_BATCH_SIZE']
+            )
+        except ItemImportError as e:
+            flash(str(e), 'danger')
+        else:
+            if report.item_ids:
+                job_id = start_qrcode_job(report.item_ids)
+                flash(f'{report.summary()}，二维码正在后台生成，进度可在 '
+                      f'{url_for("items.qr_job_status", job_id=job_id)} 查询',
+                      'warning' if report.failed else 'success')
+                if not report.failed:
+                    return redirect(url_for('items.all_items'))
+            else:
+                flash(report.summary(), 'warning' if report.errors or report.failed else 'info')
+
+    return render_template('items/import.html', title='批量导入物品', form=form, report=report)
@@ -1,9 +1,13 @@
 from datetime import datetime
 
-from flask import Blueprint, render_template, request
+from flask import Blueprint, render_template, request, current_app, abort, make_response
 from flask_login import login_required, current_user
-from app.models import Item, Record, Reservation, Space
-from app.routes.spaces import get_space_hierarchy
+from sqlalchemy import or_, and_, func
+from sqlalchemy.orm import joinedload, defer
+
+from app import db
+from app.models import Item, Record, RecordHistory, Reservation, Space
+from app.search import ranked_search, query_time_budget, SearchTimeout, segment
 
 bp = Blueprint('main', __name__)
 
@@ -12,10 +16,15 @@ bp = Blueprint('main', __name__)
 def index():
     if current_user.is_authenticated:
         # 正确代码：使用原始数据库字段_utc_start_time
-        recent_records = current_user.records.order_by(Record._utc_start_time.desc()).limit(5).all()
+        recent_records = current_user.records.options(
+            joinedload(Record.item).options(defer(Item.function), joinedload(Item.space))
+        ).order_by(Record._utc_start_time.desc()).limit(5).all()
 
         # 获取当前用户的有效预约
-        my_reservations = current_user.reservations.filter(
+        my_reservations = current_user.reservations.options(
+            joinedload(Reservation.item).options(defer(Item.function), joinedload(Item.space)),
+            defer(Reservation.notes)
+        ).filter(
             Reservation.status == 'active',
             Reservation._utc_reservation_end >= datetime.utcnow()
         ).order_by(Reservation._utc_reservation_start).limit(5).all()
@@ -26,38 +35,118 @@ def index():
     return render_template('main/index.html')
 
 
+# 全局搜索的结果分类：分类名 -> (检索类型, 模型, 局部模板)；使用记录包括已归档的历史
+SEARCH_CATEGORIES = {
+    'items': ('item', Item, 'main/_search_items.html'),
+    'records': ('record', RecordHistory, 'main/_search_records.html'),
+    'spaces': ('space', Space, 'main/_search_spaces.html'),
+}
+
+
+def _search_load_options(category):
+    """各分类局部模板用到的关联对象随结果一次联表加载；长文本只取 SQL 截取的摘要"""
+    if category == 'items':
+        return [joinedload(Item.space), *Item.list_options(snippet_length=60)]
+    if category == 'records':
+        return [joinedload(RecordHistory.item).defer(Item.function), joinedload(RecordHistory.user)]
+    return []
+
+
+def _query_length(query):
+    """关键词有效长度：汉字信息量大，按 2 个字符计"""
+    return sum(2 if segment(ch) != ch else 1 for ch in query)
+
+
+def _parse_cursor(cursor):
+    """游标格式为 "相关度:ID"，解析失败返回 None"""
+    try:
+        rank, last_id = cursor.rsplit(':', 1)
+        return float(rank), int(last_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _search_category(category, query, limit, cursor=None, with_total=True):
+    """
+    检索单个分类：按 (相关度, ID) 排序，取 limit 条并用键集游标标记下一页
+    总数只统计到 GLOBAL_SEARCH_COUNT_CAP 为止（超过则显示为“N+”），整体受时间预算限制
+    """
+    kind, model, _ = SEARCH_CATEGORIES[category]
+    result = {'rows': [], 'total': 0, 'capped': False, 'next_cursor': None, 'timed_out': False}
+
+    try:
+        with query_time_budget(current_app.config['GLOBAL_SEARCH_TIME_BUDGET']):
+            matched, rank = ranked_search(model.query, kind, query, model)
+
+            page_query = matched.options(*_search_load_options(category))
+            after = _parse_cursor(cursor)
+            if after:
+                page_query = page_query.filter(or_(rank > after[0], and_(rank == after[0], model.id > after[1])))
+            rows = page_query.add_columns(rank).order_by(rank, model.id).limit(limit + 1).all()
+
+            if len(rows) > limit:
+                rows = rows[:limit]
+                last_obj, last_rank = rows[-1]
+                result['next_cursor'] = f'{last_rank!r}:{last_obj.id}'
+            result['rows'] = [obj for obj, _ in rows]
+
+            if with_total:
+                cap = current_app.config['GLOBAL_SEARCH_COUNT_CAP']
+                capped_ids = matched.with_entities(model.id).limit(cap).subquery()
+                result['total'] = db.session.query(func.count()).select_from(capped_ids).scalar()
+                result['capped'] = result['total'] >= cap
+    except SearchTimeout:
+        current_app.logger.warning(f"全局搜索超时：分类={category}, 关键词={query}")
+        result['timed_out'] = True
+
+    return result
+
+
 @bp.route('/search')
 @login_required
 def global_search():
-    query = request.args.get('query', '')
-    results = {
-        'items': [],
-        'records': [],
-        'spaces': []
-    }
-
-    if query:
-        # 搜索物品
-        results['items'] = Item.query.filter(
-            (Item.name.ilike(f'%{query}%') |
-             Item.function.ilike(f'%{query}%') |
-             Item.serial_number.ilike(f'%{query}%'))
-        ).all()
-
-        # 搜索记录
-        results['records'] = Record.query.filter(
-            (Record.usage_location.ilike(f'%{query}%') |
-             Record.space_path.ilike(f'%{query}%'))
-        ).all()
-
-        # 搜索空间
-        results['spaces'] = Space.query.filter(
-            Space.name.ilike(f'%{query}%')
-        ).all()
-
-    total_results = len(results['items']) + len(results['records']) + len(results['spaces'])
+    query = request.args.get('query', '').strip()
+    limit = current_app.config['GLOBAL_SEARCH_PER_CATEGORY']
+    results = {category: {'rows': [], 'total': 0, 'capped': False, 'next_cursor': None, 'timed_out': False}
+               for category in SEARCH_CATEGORIES}
+
+    too_short = bool(query) and _query_length(query) < current_app.config['GLOBAL_SEARCH_MIN_LENGTH']
+    if query and not too_short:
+        for category in SEARCH_CATEGORIES:
+            results[category] = _search_category(category, query, limit)
+
+    total_results = sum(result['total'] for result in results.values())
+    timed_out = any(result['timed_out'] for result in results.values())
 
     return render_template('main/search_results.html',
                            query=query,
                            results=results,
-                           total_results=total_results)
+                           total_results=total_results,
+                           timed_out=timed_out,
+                           too_short=too_short)
+
+
+@bp.route('/search/more/<category>')
+@login_required
+def search_more(category):
+    """
+    “加载更多”：按游标继续读取单个分类，返回表格行 / 卡片片段，下一页游标放在响应头中
+    超时时返回 X-Search-Timeout 头，并原样返回当前游标，前端可重试
+    """
+    if category not in SEARCH_CATEGORIES:
+        abort(404)
+
+    query = request.args.get('query', '').strip()
+    if not query or _query_length(query) < current_app.config['GLOBAL_SEARCH_MIN_LENGTH']:
+        abort(400)
+
+    result = _search_category(category, query, current_app.config['GLOBAL_SEARCH_PER_CATEGORY'],
+                              cursor=request.args.get('cursor'), with_total=False)
+    html = render_template(SEARCH_CATEGORIES[category][2], rows=result['rows'])
+    response = make_response(html)
+    if result['timed_out']:
+        response.headers['X-Search-Timeout'] = '1'
+        response.headers['X-Next-Cursor'] = request.args.get('cursor') or ''
+    else:
+        response.headers['X-Next-Cursor'] = result['next_cursor'] or ''
+    return response
@@ -1,39 +1,46 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
 from datetime import datetime
+from sqlalchemy.orm import joinedload
 
 from app import db
 from app.forms.record_forms import RecordCreateForm, RecordReturnForm
-from app.models import Item, Record, Space, User, Reservation
+from app.models import Item, Record, RecordArchive, RecordHistory, Space, User, Reservation
+from app.pagination import keyset_paginate
+from app.exporter import export_response
+from app.reservation_timeline import hand_off_item, notify_hand_off
 
 bp = Blueprint('records', __name__)
 
+# 记录列表统一排序键：开始时间倒序，ID 倒序兜底
+# 历史列表读取 RecordHistory（热表 + 归档表），归档后的旧记录仍可翻到
+RECORD_SORT_KEYS = [(RecordHistory._utc_start_time, 'desc'), (RecordHistory.id, 'desc')]
+
 
 @bp.route('/my')
 @login_required
 def my_records():
     """查看当前用户的使用记录（分页）"""
-    page = request.args.get('page', 1, type=int)
     per_page = 10  # 每页显示10条
 
     status = request.args.get('status', '')
     item_name = request.args.get('item_name', '').strip()
 
     # 基础查询：当前用户的记录
-    records_query = current_user.records
+    records_query = RecordHistory.query.filter(RecordHistory.user_id == current_user.id).options(
+        joinedload(RecordHistory.item).defer(Item.function))
 
     # 筛选：物品名称（模糊查询）
     if item_name:
-        records_query = records_query.join(Item).filter(Item.name.ilike(f'%{item_name}%'))
+        records_query = records_query.join(RecordHistory.item).filter(Item.name.ilike(f'%{item_name}%'))
 
     # 筛选：状态
     if status:
-        records_query = records_query.filter(Record.status == status)
+        records_query = records_query.filter(RecordHistory.status == status)
 
-    records_query = records_query.order_by(Record._utc_start_time.desc())
-
-    # 使用 paginate 代替 all
-    pagination = records_query.paginate(page=page, per_page=per_page, error_out=False)
+    # 按开始时间倒序键集分页（ID 作为同一时间的次序）
+    pagination = keyset_paginate(records_query, RECORD_SORT_KEYS, per_page,
+                                 count_key=('records.my_records', current_user.id, status, item_name))
     records = pagination.items
 
     return render_template('records/my_records.html', records=records, pagination=pagination)
@@ -47,7 +54,6 @@ def all_records():
         flash('没有权限查看所有记录')
         return redirect(url_for('records.my_records'))
 
-    page = request.args.get('page', 1, type=int)
     per_page = 15  # 管理员界面每页显示更多
 
     # 获取筛选参数
@@ -55,29 +61,39 @@ def all_records():
     item_name = request.args.get('item_name', '').strip()
     status = request.args.get('status', '')
 
-    records_query = Record.query
+    # 列表显示用户名和物品名：与记录一次联表加载
+    records_query = RecordHistory.query.options(joinedload(RecordHistory.user),
+                                                joinedload(RecordHistory.item).defer(Item.function))
 
     # 联表查询：用户名
     if username:
-        records_query = records_query.join(User).filter(User.username.ilike(f'%{username}%'))
+        records_query = records_query.join(RecordHistory.user).filter(User.username.ilike(f'%{username}%'))
 
     # 联表查询：物品名
     if item_name:
-        records_query = records_query.join(Item).filter(Item.name.ilike(f'%{item_name}%'))
+        records_query = records_query.join(RecordHistory.item).filter(Item.name.ilike(f'%{item_name}%'))
 
     # 筛选：状态
     if status:
-        records_query = records_query.filter(Record.status == status)
-
-    records_query = records_query.order_by(Record._utc_start_time.desc())
+        records_query = records_query.filter(RecordHistory.status == status)
 
-    # 使用 paginate
-    pagination = records_query.paginate(page=page, per_page=per_page, error_out=False)
+    pagination = keyset_paginate(records_query, RECORD_SORT_KEYS, per_page,
+                                 count_key=('records.all_records', username, item_name, status))
     records = pagination.items
 
     return render_template('records/all_records.html', records=records, pagination=pagination)
 
 
+@bp.route('/export')
+@login_required
+def export_records():
+    """导出使用记录（CSV / JSONL，筛选条件同全部记录列表），流式输出"""
+    if not current_user.is_admin():
+        flash('没有权限导出数据')
+        return redirect(url_for('records.my_records'))
+    return export_response('records', request.args)
+
+
 @bp.route('/item/<int:item_id>')
 @login_required
 def item_records(item_id):
@@ -89,17 +105,17 @@ def item_records(item_id):
     status = request.args.get('status', '')
 
     item = Item.query.get_or_404(item_id)
-    records_query = Record.query.filter_by(item_id=item_id)
+    records_query = RecordHistory.query.filter_by(item_id=item_id).options(joinedload(RecordHistory.user))
 
     # 筛选：用户名
     if username:
-        records_query = records_query.join(User).filter(User.username.ilike(f'%{username}%'))
+        records_query = records_query.join(RecordHistory.user).filter(User.username.ilike(f'%{username}%'))
 
     # 筛选：状态（虽然通常看物品记录不太需要筛选状态，但保留功能更灵活）
     if status:
-        records_query = records_query.filter(Record.status == status)
+        records_query = records_query.filter(RecordHistory.status == status)
 
-    records_query = records_query.order_by(Record._utc_start_time.desc())
+    records_query = records_query.order_by(RecordHistory._utc_start_time.desc())
 
     pagination = records_query.paginate(page=page, per_page=per_page, error_out=False)
     records = pagination.items
@@ -186,13 +202,18 @@ def return_item(record_id):
         record.status = 'returned'
         record._utc_return_time = datetime.utcnow()
 
-        # 更新物品状态
+        # 更新物品状态；有等待中的预约则在同一事务中直接交给预约人
         item = record.item
         item.status = 'available'
+        handed_off = hand_off_item(item)
 
         db.session.commit()
 
-        flash(f'成功归还物品 "{item.name}"')
+        if handed_off:
+            notify_hand_off(handed_off)
+            flash(f'成功归还物品 "{item.name}"，已为预约人 {handed_off.user.username if handed_off.user else ""} 保留')
+        else:
+            flash(f'成功归还物品 "{item.name}"')
         return redirect(url_for('items.view', id=item.id))
 
     return render_template('records/return.html', form=form, record=record)
@@ -208,8 +229,8 @@ def delete(record_id):
         return redirect(
             url_for('records.all_records', status=request.args.get('status'), page=request.args.get('page')))
 
-    # 2. 查询要删除的记录
-    record = Record.query.get_or_404(record_id)
+    # 2. 查询要删除的记录（已归档的记录在归档表中）
+    record = Record.query.get(record_id) or RecordArchive.query.get_or_404(record_id)
 
     # 3. 记录删除信息（用于日志或提示，可选）
     item_name = record.item.name
@@ -226,5 +247,6 @@ def delete(record_id):
         status=request.args.get('status'),
         username=request.args.get('username'),
         item_name=request.args.get('item_name'),
+        cursor=request.args.get('cursor'),
         page=request.args.get('page')
     ))
\ No newline at end of file
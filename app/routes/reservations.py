@@ -1,12 +1,17 @@
 import pytz
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify
 from flask_login import login_required, current_user
 from datetime import datetime, timedelta
 from sqlalchemy import or_
+from sqlalchemy.orm import joinedload, defer
 
 from app import db
-from app.models import Item, Reservation, Record, User
+from app.models import Item, Reservation, ReservationArchive, ReservationHistory, Record, Space, User
 from app.forms.reservation_forms import ReservationForm
+from app.pagination import keyset_paginate
+from app.exporter import export_response
+from app.reservation_timeline import hand_off_item, notify_hand_off
+from app.availability import busy_intervals, free_intervals, local_day_bounds
 
 bp = Blueprint('reservations', __name__)
 LOCAL_TIMEZONE = pytz.timezone('Asia/Shanghai')
@@ -22,16 +27,19 @@ def my_reservations():
     status = request.args.get('status', '')
     item_id = request.args.get('item_id', '')
 
-    # 构建查询
-    reservations_query = current_user.reservations
+    # 构建查询（历史视图：热表 + 归档表）
+    reservations_query = ReservationHistory.query.filter(ReservationHistory.user_id == current_user.id).options(
+        joinedload(ReservationHistory.item).options(defer(Item.function), joinedload(Item.space)),
+        *ReservationHistory.list_options()
+    )
 
     if status in ['scheduled', 'active', 'expired', 'cancelled', 'used', 'conflicted']:
-        reservations_query = reservations_query.filter(Reservation.status == status)
+        reservations_query = reservations_query.filter(ReservationHistory.status == status)
 
     if item_id:
-        reservations_query = reservations_query.filter(Reservation.item_id == item_id)
+        reservations_query = reservations_query.filter(ReservationHistory.item_id == item_id)
 
-    reservations_query = reservations_query.order_by(Reservation._utc_reservation_start.desc())
+    reservations_query = reservations_query.order_by(ReservationHistory._utc_reservation_start.desc())
 
     # 使用分页
     pagination = reservations_query.paginate(page=page, per_page=per_page, error_out=False)
@@ -56,7 +64,6 @@ def all_reservations():
         flash('没有权限查看所有预约记录', 'danger')
         return redirect(url_for('reservations.my_reservations'))
 
-    page = request.args.get('page', 1, type=int)
     per_page = 15  # 管理员每页15条
 
     # 获取筛选参数（改为文本输入筛选，避免下拉框过长）
@@ -64,24 +71,33 @@ def all_reservations():
     item_name = request.args.get('item_name', '').strip()
     username = request.args.get('username', '').strip()
 
-    reservations_query = Reservation.query
+    # 列表显示用户、物品及其空间路径：一次联表加载（历史视图：热表 + 归档表）
+    reservations_query = ReservationHistory.query.options(
+        joinedload(ReservationHistory.user),
+        joinedload(ReservationHistory.item).options(defer(Item.function), joinedload(Item.space)),
+        *ReservationHistory.list_options()
+    )
 
     # 状态筛选
     if status in ['scheduled', 'active', 'expired', 'cancelled', 'used', 'conflicted']:
-        reservations_query = reservations_query.filter(Reservation.status == status)
+        reservations_query = reservations_query.filter(ReservationHistory.status == status)
 
     # 物品名称模糊筛选
     if item_name:
-        reservations_query = reservations_query.join(Item).filter(Item.name.ilike(f'%{item_name}%'))
+        reservations_query = reservations_query.join(ReservationHistory.item).filter(Item.name.ilike(f'%{item_name}%'))
 
     # 用户名模糊筛选
     if username:
-        reservations_query = reservations_query.join(User).filter(User.username.ilike(f'%{username}%'))
-
-    reservations_query = reservations_query.order_by(Reservation._utc_reservation_start.desc())
-
-    # 执行分页
-    pagination = reservations_query.paginate(page=page, per_page=per_page, error_out=False)
+        reservations_query = reservations_query.join(ReservationHistory.user).filter(
+            User.username.ilike(f'%{username}%'))
+
+    # 按预约开始时间倒序键集分页（ID 作为同一时间的次序）
+    pagination = keyset_paginate(
+        reservations_query,
+        [(ReservationHistory._utc_reservation_start, 'desc'), (ReservationHistory.id, 'desc')],
+        per_page,
+        count_key=('reservations.all_reservations', status, item_name, username)
+    )
     reservations = pagination.items
 
     return render_template(
@@ -92,6 +108,76 @@ def all_reservations():
     )
 
 
+@bp.route('/export')
+@login_required
+def export_reservations():
+    """导出预约（CSV / JSONL，筛选条件同全部预约列表），流式输出"""
+    if not current_user.is_admin():
+        flash('没有权限导出数据', 'danger')
+        return redirect(url_for('reservations.my_reservations'))
+    return export_response('reservations', request.args)
+
+
+@bp.route('/availability.json')
+@login_required
+def availability():
+    """
+    可预约时段（占用 / 空闲区间，东八区 YYYY-MM-DDTHH:MM）
+    参数：item_id（单个物品）或 space_id（空间及全部子空间内的物品）；start 起始日期 YYYY-MM-DD（默认今天）；days 天数（默认 7）
+    """
+    try:
+        first_day = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if request.args.get('start') \
+            else datetime.now(LOCAL_TIMEZONE).date()
+    except ValueError:
+        return jsonify({'error': '起始日期格式应为 YYYY-MM-DD'}), 400
+    days = request.args.get('days', 7, type=int)
+    if not 1 <= days <= current_app.config['AVAILABILITY_MAX_DAYS']:
+        return jsonify({'error': f'天数应在 1 ~ {current_app.config["AVAILABILITY_MAX_DAYS"]} 之间'}), 400
+
+    item_id = request.args.get('item_id', type=int)
+    space_id = request.args.get('space_id', type=int)
+    query = db.session.query(Item.id, Item.name, Item.serial_number)
+    if item_id:
+        query = query.filter(Item.id == item_id)
+    elif space_id:
+        space = Space.query.get_or_404(space_id)
+        query = query.filter(Item.space_id.in_(space.get_subtree_ids()))
+    else:
+        return jsonify({'error': '需要 item_id 或 space_id'}), 400
+    max_items = current_app.config['AVAILABILITY_MAX_ITEMS']
+    items = query.order_by(Item.id).limit(max_items + 1).all()
+    if item_id and not items:
+        return jsonify({'error': '物品不存在'}), 404
+    if len(items) > max_items:
+        return jsonify({'error': f'物品数超过 {max_items}，请缩小空间范围'}), 400
+
+    range_start, _ = local_day_bounds(first_day)
+    _, range_end = local_day_bounds(first_day + timedelta(days=days - 1))
+    # 过去的时间不可预约
+    bookable_from = min(max(range_start, datetime.utcnow().replace(second=0, microsecond=0)), range_end)
+    busy = busy_intervals([item.id for item in items], first_day, days)
+
+    # 东八区没有夏令时：整段范围使用同一偏移量，避免逐个区间做时区换算
+    offset = LOCAL_TIMEZONE.utcoffset(range_start)
+
+    def local(utc_time):
+        return (utc_time + offset).isoformat(timespec='minutes')
+
+    return jsonify({
+        'start': local(range_start),
+        'end': local(range_end),
+        'items': [{
+            'id': item.id,
+            'name': item.name,
+            'serial_number': item.serial_number,
+            'busy': [{'start': local(b.start), 'end': local(b.end), 'kind': b.kind, 'status': b.status}
+                     for b in sorted(busy[item.id], key=lambda b: b.start)],
+            'free': [{'start': local(start), 'end': local(end)}
+                     for start, end in free_intervals(busy[item.id], bookable_from, range_end)],
+        } for item in items],
+    })
+
+
 @bp.route('/item/<int:item_id>')
 @login_required
 def item_reservations(item_id):
@@ -103,12 +189,12 @@ def item_reservations(item_id):
     now_local = datetime.now(LOCAL_TIMEZONE)
 
     # 权限逻辑
-    if current_user.is_admin():
-        query = Reservation.query.filter_by(item_id=item_id)
-    else:
-        query = current_user.reservations.filter_by(item_id=item_id)
+    query = ReservationHistory.query.filter_by(item_id=item_id)
+    if not current_user.is_admin():
+        query = query.filter(ReservationHistory.user_id == current_user.id)
 
-    query = query.order_by(Reservation._utc_reservation_start.desc())
+    query = query.options(joinedload(ReservationHistory.user), *ReservationHistory.list_options()).order_by(
+        ReservationHistory._utc_reservation_start.desc())
 
     pagination = query.paginate(page=page, per_page=per_page, error_out=False)
     reservations = pagination.items
@@ -128,10 +214,11 @@ def create(item_id):
     form = ReservationForm()
 
     if form.validate_on_submit():
-        start_local = form.reservation_start.data
-        start_utc = start_local.astimezone(pytz.utc)
-        end_local = form.reservation_end.data
-        end_utc = end_local.astimezone(pytz.utc)
+        # 表单时间为东八区本地时间（与表单校验、可预约时段接口一致）
+        start_local = LOCAL_TIMEZONE.localize(form.reservation_start.data)
+        start_utc = start_local.astimezone(pytz.utc).replace(tzinfo=None)
+        end_local = LOCAL_TIMEZONE.localize(form.reservation_end.data)
+        end_utc = end_local.astimezone(pytz.utc).replace(tzinfo=None)
 
         # 检查重叠预约
         # 【注意】我们不仅要检查 active/scheduled，还要检查 conflicted，因为 conflicted 随时可能变回 active
@@ -186,12 +273,17 @@ def cancel(reservation_id):
         flash(f'该预约状态为「{status_cn}」，无法取消', 'warning')
         return redirect(url_for('reservations.my_reservations'))
 
-    # 【新增】如果预约是 active 状态，则物品状态应该是 reserved，取消时需释放物品
-    if reservation.status == 'active' and reservation.item.status == 'reserved':
-        reservation.item.status = 'available'
+    # 【新增】如果预约是 active 状态，则物品状态应该是 reserved，取消时需释放物品，并立即交给下一位等待中的预约人
+    release = reservation.status == 'active' and reservation.item.status == 'reserved'
 
     reservation.status = 'cancelled'
+    handed_off = None
+    if release:
+        reservation.item.status = 'available'
+        handed_off = hand_off_item(reservation.item)
     db.session.commit()
+    if handed_off:
+        notify_hand_off(handed_off)
 
     flash('预约已取消', 'success')
     return redirect(request.referrer or url_for('reservations.my_reservations'))
@@ -231,16 +323,23 @@ def delete(reservation_id):
         flash('没有权限执行此操作', 'danger')
         return redirect(url_for('reservations.all_reservations'))
 
-    reservation = Reservation.query.get_or_404(reservation_id)
+    # 已归档的预约在归档表中
+    reservation = Reservation.query.get(reservation_id) or ReservationArchive.query.get_or_404(reservation_id)
     item_name = reservation.item.name
     username = reservation.user.username
 
-    # 【新增】关键修复：如果删除的是Active状态的预约，必须释放物品状态
-    if reservation.status == 'active' and reservation.item.status == 'reserved':
-        reservation.item.status = 'available'
+    # 【新增】关键修复：如果删除的是Active状态的预约，必须释放物品状态，并立即交给下一位等待中的预约人
+    item = reservation.item
+    release = reservation.status == 'active' and item.status == 'reserved'
 
     db.session.delete(reservation)
+    handed_off = None
+    if release:
+        item.status = 'available'
+        handed_off = hand_off_item(item)
     db.session.commit()
+    if handed_off:
+        notify_hand_off(handed_off)
 
     flash(f'成功删除预约记录：物品「{item_name}」（预约人：{username}）', 'success')
     return redirect(url_for('reservations.all_reservations'))
\ No newline at end of file
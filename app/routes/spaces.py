@@ -1,29 +1,25 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
+from sqlalchemy.orm import contains_eager
 from app import db
 from app.models import Space, Item
 from app.forms.space_forms import SpaceForm
+from app.search import filter_by_search
+from app.space_tree import get_cached_hierarchy, get_cached_subtree, bump_space_version, search_space_paths
 
 bp = Blueprint('spaces', __name__)
 
 
 # --- 辅助函数：获取空间层级结构 ---
-def get_space_hierarchy(parent_id=None, level=0):
+def get_space_hierarchy(parent_id=None):
     """
-    递归获取空间层级结构
-    :param parent_id: 父空间ID
-    :param level: 当前层级
-    :return: list of dict
+    获取空间层级结构（读取进程内缓存，整表单次查询构建，不再逐节点递归查询）
+    :param parent_id: 父空间ID，为空时返回完整树
+    :return: list of dict，{'space': SpaceNode, 'level': 绝对层级, 'children': [...]}
     """
-    spaces = Space.query.filter_by(parent_id=parent_id).all()
-    hierarchy = []
-    for space in spaces:
-        hierarchy.append({
-            'space': space,
-            'level': level,
-            'children': get_space_hierarchy(space.id, level + 1)
-        })
-    return hierarchy
+    if parent_id is None:
+        return get_cached_hierarchy()
+    return get_cached_subtree(parent_id)
 
 
 # --------------------------------
@@ -35,12 +31,12 @@ def index():
     # 这里假设 parent_id 为 NULL 代表顶级
     spaces = Space.query.filter(Space.parent_id == None).all()
 
-    # 构造数据结构供模板使用
+    # 构造数据结构供模板使用（子空间列表取自缓存的空间树）
     spaces_data = []
     for space in spaces:
         spaces_data.append({
             'space': space,
-            'children': space.children.all()
+            'children': [entry['space'] for entry in get_space_hierarchy(space.id)]
         })
 
     return render_template('spaces/index.html', spaces=spaces_data)
@@ -57,7 +53,7 @@ def view(id):
     for sub in subspaces_query:
         subspaces_data.append({
             'space': sub,
-            'children': sub.children.all()
+            'children': [entry['space'] for entry in get_space_hierarchy(sub.id)]
         })
 
     # 2. 获取物品数据（分页）
@@ -65,7 +61,9 @@ def view(id):
     per_page = 10
 
     # space.items 是 lazy='dynamic'，可以直接调用 paginate
-    pagination = space.items.paginate(page=page, per_page=per_page, error_out=False)
+    # 功能描述只显示摘要：在 SQL 中截取，不读取完整文本
+    pagination = space.items.options(*Item.list_options(snippet_length=20)).paginate(
+        page=page, per_page=per_page, error_out=False)
     items = pagination.items
 
     return render_template('spaces/view.html',
@@ -75,25 +73,50 @@ def view(id):
                            pagination=pagination)
 
 
-@bp.route('/search/<int:id>', methods=['POST'])
+@bp.route('/paths.json')
+@login_required
+def path_search():
+    """空间路径前缀搜索（供物品表单的 typeahead 使用）"""
+    query = request.args.get('q', '').strip()
+    limit = min(request.args.get('limit', 20, type=int), 50)
+    results = search_space_paths(query, limit=limit)
+    return jsonify([{'id': space_id, 'path': path} for space_id, path in results])
+
+
+@bp.route('/search/<int:id>', methods=['GET', 'POST'])
 @login_required
 def search(id):
-    """空间内搜索"""
+    """
+    空间内搜索
+    subtree=1 时搜索整个子树（借助 ancestry 索引单次联表查询），否则仅搜索本空间直属物品
+    结果按相关度排序并分页，每条结果附带所在空间路径
+    """
     space = Space.query.get_or_404(id)
-    query = request.form.get('query', '').strip()
+    query = request.values.get('query', '').strip()
+    subtree = request.values.get('subtree') in ('1', 'on', 'true')
 
     if not query:
         return redirect(url_for('spaces.view', id=id))
 
+    page = request.args.get('page', 1, type=int)
+    per_page = 15
+
     # 搜索逻辑
-    items = Item.query.filter(
-        Item.space_id == id,
-        (Item.name.ilike(f'%{query}%') |
-         Item.function.ilike(f'%{query}%') |
-         Item.serial_number.ilike(f'%{query}%'))
-    ).all()
+    items_query = Item.query.join(Space, Item.space_id == Space.id).options(
+        contains_eager(Item.space), *Item.list_options(snippet_length=30))
+    if subtree:
+        items_query = items_query.filter(db.or_(Space.id == id, space.descendants_filter()))
+    else:
+        items_query = items_query.filter(Item.space_id == id)
+
+    # 全文检索并按相关度排序（BM25；名称权重最高），同分时离本空间越近越靠前
+    items_query = filter_by_search(items_query, 'item', query, ranked=True)
+    items_query = items_query.order_by(Space.level, Item.id)
+
+    pagination = items_query.paginate(page=page, per_page=per_page, error_out=False)
 
-    return render_template('spaces/search_results.html', space=space, items=items, query=query)
+    return render_template('spaces/search_results.html', space=space, items=pagination.items,
+                           pagination=pagination, query=query, subtree=subtree)
 
 
 @bp.route('/create/<int:parent_id>', methods=['GET', 'POST'])
@@ -117,6 +140,7 @@ def create(parent_id):
         )
         db.session.add(space)
         db.session.commit()
+        bump_space_version()
         flash(f'空间 "{space.name}" 创建成功')
 
         if parent:
@@ -139,6 +163,7 @@ def edit(id):
     if form.validate_on_submit():
         space.name = form.name.data
         db.session.commit()
+        bump_space_version()
         flash(f'空间 "{space.name}" 更新成功')
         if space.parent_id:
             return redirect(url_for('spaces.view', id=space.parent_id))
@@ -160,18 +185,22 @@ def delete(id):
 
     # 2. 安全检查：如果有子空间或物品，禁止删除
     # (虽然前端有 disabled 属性，但后端必须进行二次校验)
-    if space.children.count() > 0:
-        flash(f'无法删除：该空间包含 {space.children.count()} 个子空间，请先处理子空间。', 'warning')
+    # 物品删除会级联，这里直接查库而不依赖计数器，每项只查询一次
+    child_count = space.children.count()
+    if child_count > 0:
+        flash(f'无法删除：该空间包含 {child_count} 个子空间，请先处理子空间。', 'warning')
         return redirect(url_for('spaces.edit', id=id))
 
-    if space.items.count() > 0:
-        flash(f'无法删除：该空间包含 {space.items.count()} 个物品，请先移除或转移物品。', 'warning')
+    item_count = space.items.count()
+    if item_count > 0:
+        flash(f'无法删除：该空间包含 {item_count} 个物品，请先移除或转移物品。', 'warning')
         return redirect(url_for('spaces.edit', id=id))
 
     # 3. 执行删除
     try:
         db.session.delete(space)
         db.session.commit()
+        bump_space_version()
         flash(f'空间 "{space.name}" 已成功删除', 'success')
     except Exception as e:
         db.session.rollback()
@@ -0,0 +1,270 @@
+"""
+全文检索（SQLite FTS5）
+- 虚拟表 search_fts 统一索引物品、使用记录和空间，kind 区分类型，ref_id 指向原表主键
+- 中文按单字切分后写入（unicode61 分词器会把连续汉字当作一个词），查询时按短语匹配，
+  因此任意长度的中文片段都能命中；英文/编号按词前缀匹配
+- 通过 ORM after_flush 事件与原表保持同步；批量 SQL 修改不会触发事件，可用 rebuild_search_index() 重建
+- 归档的使用记录保留原主键，文档随之保留；检索记录时通过 RecordHistory（热表 + 归档表）读取
+- 非 SQLite 或 SQLite 未编译 FTS5 时，自动回退为原来的 ilike 模糊查询
+"""
+import re
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event, inspect, select, table, column, literal_column, or_, case, text
+from sqlalchemy.exc import OperationalError
+
+from app import db
+
+FTS_TABLE = 'search_fts'
+
+# 类型 -> (模型名, 写入 name / serial / content 三列的字段)
+_INDEXED_FIELDS = {
+    'item': ('Item', ('name', 'serial_number', 'function')),
+    'record': ('Record', ('usage_location', None, 'space_path')),
+    'space': ('Space', ('name', None, 'full_path')),
+}
+
+# 类型 -> 归档表模型名：归档行沿用原主键，文档不删除；重建索引时一并写入，删除归档行时清理
+_ARCHIVE_MODELS = {
+    'record': 'RecordArchive',
+}
+
+# BM25 列权重：kind, ref_id 不参与；名称 > 编号 > 正文
+_BM25_WEIGHTS = '0.0, 0.0, 10.0, 5.0, 1.0'
+
+_CJK_RE = re.compile(r'([぀-ヿ㐀-䶿一-鿿가-힯豈-﫿])')
+
+search_fts = table(FTS_TABLE, column('kind'), column('ref_id'), column('name'), column('serial'), column('content'))
+
+_fts_state = {}
+
+
+def segment(value):
+    """在每个中日韩字符两侧插入空格，使其成为独立的词"""
+    if not value:
+        return ''
+    return _CJK_RE.sub(r' \1 ', str(value))
+
+
+def build_match_expression(query):
+    """
+    把用户输入转换为 FTS5 MATCH 表达式
+    每个空白分隔的词转为带前缀通配的短语，词之间为 AND 关系；无可检索内容时返回 None
+    """
+    terms = []
+    for word in (query or '').split():
+        tokens = re.findall(r'\w+', segment(word))
+        if tokens:
+            terms.append('"{}"*'.format(' '.join(tokens)))
+    return ' '.join(terms) or None
+
+
+def fts_available():
+    """当前数据库是否可用 FTS5 检索表（按引擎缓存检测结果）"""
+    engine = db.engine
+    if engine not in _fts_state:
+        available = False
+        if engine.dialect.name == 'sqlite':
+            # 复用会话连接检测，避免内存数据库下另开连接影响当前事务
+            available = db.session.connection().execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {'name': FTS_TABLE}
+            ).first() is not None
+        _fts_state[engine] = available
+    return _fts_state[engine]
+
+
+def ensure_search_index():
+    """创建 FTS5 虚拟表（若不存在）。db.create_all() 不会创建虚拟表，需在应用启动时调用"""
+    engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        _fts_state[engine] = False
+        return False
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+                'kind UNINDEXED, ref_id UNINDEXED, name, serial, content, '
+                "tokenize = 'unicode61 remove_diacritics 2')"
+            ))
+    except Exception:
+        # SQLite 未编译 FTS5：保持 ilike 回退
+        _fts_state[engine] = False
+        return False
+    _fts_state[engine] = True
+    return True
+
+
+def _document(kind, obj):
+    _, fields = _INDEXED_FIELDS[kind]
+    return {
+        'kind': kind,
+        'ref_id': obj.id,
+        'name': segment(getattr(obj, fields[0]) if fields[0] else ''),
+        'serial': segment(getattr(obj, fields[1]) if fields[1] else ''),
+        'content': segment(getattr(obj, fields[2]) if fields[2] else ''),
+    }
+
+
+def _delete_documents(conn, kind, ids):
+    if ids:
+        conn.execute(search_fts.delete().where(search_fts.c.kind == kind, search_fts.c.ref_id.in_(ids)))
+
+
+def rebuild_search_index(batch_size=1000):
+    """清空并重建全文检索表，返回写入的文档数"""
+    from app import models
+
+    if not ensure_search_index():
+        return 0
+
+    conn = db.session.connection()
+    conn.execute(search_fts.delete())
+    total = 0
+    for kind, (model_name, _) in _INDEXED_FIELDS.items():
+        for name in filter(None, (model_name, _ARCHIVE_MODELS.get(kind))):
+            batch = []
+            for obj in getattr(models, name).query.yield_per(batch_size):
+                batch.append(_document(kind, obj))
+                if len(batch) >= batch_size:
+                    conn.execute(search_fts.insert(), batch)
+                    total += len(batch)
+                    batch = []
+            if batch:
+                conn.execute(search_fts.insert(), batch)
+                total += len(batch)
+    return total
+
+
+def _search_subquery(kind, query):
+    """(ref_id, rank) 子查询；FTS 不可用或无可检索词时返回 None"""
+    match = build_match_expression(query)
+    if match is None or not fts_available():
+        return None
+    rank = literal_column(f'bm25({FTS_TABLE}, {_BM25_WEIGHTS})')
+    return select(search_fts.c.ref_id.label('ref_id'), rank.label('rank')).where(
+        search_fts.c.kind == kind,
+        literal_column(FTS_TABLE).op('MATCH')(match)
+    ).subquery()
+
+
+def _like_columns(kind, model=None):
+    from app import models
+
+    model_name, fields = _INDEXED_FIELDS[kind]
+    model = model or getattr(models, model_name)
+    return model, [getattr(model, field) for field in fields if field]
+
+
+def ranked_search(sa_query, kind, query, model=None):
+    """
+    给查询加上全文检索条件，并返回相关度表达式（值越小越相关）
+    FTS 模式为 BM25 分值；回退模式按名称完全匹配 / 前缀 / 包含分级
+    :param model: 被检索的模型，默认为该类型的原表模型；可传入同主键、同字段的视图模型（如 RecordHistory）
+    :return: (sa_query, rank_expression)
+    """
+    model, like_columns = _like_columns(kind, model)
+    sub = _search_subquery(kind, query)
+
+    if sub is None:
+        name = like_columns[0]
+        rank = case(
+            (name == query, 0),
+            (name.ilike(f'{query}%'), 1),
+            (name.ilike(f'%{query}%'), 2),
+            else_=3
+        )
+        return sa_query.filter(or_(*(col.ilike(f'%{query}%') for col in like_columns))), rank
+
+    return sa_query.join(sub, sub.c.ref_id == model.id), sub.c.rank
+
+
+def filter_by_search(sa_query, kind, query, ranked=False, model=None):
+    """
+    给查询加上全文检索条件
+    :param kind: 'item' / 'record' / 'space'
+    :param ranked: 为 True 时按相关度排序（FTS 使用 BM25，回退模式按名称匹配程度）
+    :param model: 同 ranked_search
+    """
+    if ranked:
+        sa_query, rank = ranked_search(sa_query, kind, query, model)
+        return sa_query.order_by(rank)
+
+    model, like_columns = _like_columns(kind, model)
+    sub = _search_subquery(kind, query)
+    if sub is None:
+        return sa_query.filter(or_(*(col.ilike(f'%{query}%') for col in like_columns)))
+    return sa_query.filter(model.id.in_(select(sub.c.ref_id)))
+
+
+class SearchTimeout(Exception):
+    """检索超出时间预算"""
+
+
+@contextmanager
+def query_time_budget(seconds):
+    """
+    限制代码块内 SQLite 查询的执行时间
+    借助 sqlite3 的 progress handler 定期检查截止时间，超时中断当前语句并抛出 SearchTimeout
+    非 SQLite 数据库或 seconds 为空时不做限制
+    """
+    if not seconds or db.engine.dialect.name != 'sqlite':
+        yield
+        return
+
+    raw = db.session.connection().connection.dbapi_connection
+    deadline = time.monotonic() + seconds
+    raw.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, 1000)
+    try:
+        yield
+    except OperationalError as e:
+        if 'interrupted' in str(e.orig):
+            raise SearchTimeout() from e
+        raise
+    finally:
+        raw.set_progress_handler(None, 0)
+
+
+# --- 索引同步 ---
+def _sync_search_index(session, flush_context):
+    from app import models
+
+    if not fts_available():
+        return
+
+    kinds = {getattr(models, model_name): (kind, fields) for kind, (model_name, fields) in _INDEXED_FIELDS.items()}
+    archives = {getattr(models, model_name): kind for kind, model_name in _ARCHIVE_MODELS.items()}
+    upserts, deletes = {}, {}
+
+    for obj in session.new:
+        if type(obj) in kinds:
+            kind, _ = kinds[type(obj)]
+            upserts.setdefault(kind, []).append(obj)
+
+    for obj in session.dirty:
+        if type(obj) in kinds and obj not in session.deleted:
+            kind, fields = kinds[type(obj)]
+            state = inspect(obj)
+            if any(field and state.attrs[field].history.has_changes() for field in fields):
+                upserts.setdefault(kind, []).append(obj)
+
+    for obj in session.deleted:
+        if type(obj) in kinds:
+            kind, _ = kinds[type(obj)]
+            deletes.setdefault(kind, []).append(obj.id)
+        elif type(obj) in archives:
+            deletes.setdefault(archives[type(obj)], []).append(obj.id)
+
+    if not upserts and not deletes:
+        return
+
+    conn = session.connection()
+    for kind, ids in deletes.items():
+        _delete_documents(conn, kind, ids)
+    for kind, objs in upserts.items():
+        _delete_documents(conn, kind, [obj.id for obj in objs])
+        conn.execute(search_fts.insert(), [_document(kind, obj) for obj in objs])
+
+
+event.listen(db.session, 'after_flush', _sync_search_index)
@@ -0,0 +1,138 @@
+"""
+空间树缓存
+- 单次 SELECT 读取整张 space 表，在内存中组装层级结构
+- 按进程缓存，以空间表版本号为键；spaces 路由在新建/编辑/删除后调用 bump_space_version() 使缓存失效
+- 缓存中保存的是轻量节点（SpaceNode），不是 ORM 对象，可安全跨请求复用
+注意：版本号为进程内计数，多进程部署时其他 worker 在各自下一次变更前可能读到旧树
+"""
+import threading
+from bisect import bisect_left
+
+from app import db
+
+_lock = threading.Lock()
+_space_version = 0
+_tree_cache = {'version': None, 'hierarchy': [], 'nodes': {}, 'entries': {}, 'choices': [], 'paths': []}
+
+
+class SpaceNode:
+    """空间树节点（只读），提供模板需要的 id / name 等属性"""
+    __slots__ = ('id', 'name', 'parent_id', 'full_path', 'level', 'children')
+
+    def __init__(self, id, name, parent_id, full_path, level):
+        self.id = id
+        self.name = name
+        self.parent_id = parent_id
+        self.full_path = full_path
+        self.level = level
+        self.children = []
+
+    def get_path(self):
+        return self.full_path or self.name
+
+    def get_level(self):
+        return self.level or 0
+
+
+def get_space_version():
+    return _space_version
+
+
+def bump_space_version():
+    """空间表发生变更后调用，使所有基于版本号的缓存失效"""
+    global _space_version
+    with _lock:
+        _space_version += 1
+
+
+def _build_tree():
+    from app.models import Space
+
+    rows = db.session.query(
+        Space.id, Space.name, Space.parent_id, Space.full_path, Space.level
+    ).order_by(Space.id).all()
+
+    nodes = {row.id: SpaceNode(row.id, row.name, row.parent_id, row.full_path, row.level) for row in rows}
+    children_of = {}
+    for node in nodes.values():
+        children_of.setdefault(node.parent_id if node.parent_id in nodes else None, []).append(node)
+
+    entries = {}
+
+    def build(parent_id, level):
+        hierarchy = []
+        for node in children_of.get(parent_id, []):
+            children = build(node.id, level + 1)
+            node.children = [child['space'] for child in children]
+            entries[node.id] = {'space': node, 'level': level, 'children': children}
+            hierarchy.append(entries[node.id])
+        return hierarchy
+
+    hierarchy = build(None, 0)
+    # 按路径排序的 (id, path) 列表：既是下拉框选项，也是前缀搜索的有序索引
+    choices = sorted(((node.id, node.get_path()) for node in nodes.values()), key=lambda c: c[1])
+    return hierarchy, nodes, entries, choices
+
+
+def _get_cache():
+    version = _space_version
+    if _tree_cache['version'] != version:
+        hierarchy, nodes, entries, choices = _build_tree()
+        with _lock:
+            _tree_cache.update(version=version, hierarchy=hierarchy, nodes=nodes, entries=entries,
+                               choices=choices, paths=[path for _, path in choices])
+    return _tree_cache
+
+
+def get_cached_hierarchy():
+    """完整空间层级：list of {'space': SpaceNode, 'level': int, 'children': [...]}"""
+    return _get_cache()['hierarchy']
+
+
+def get_cached_subtree(space_id):
+    """某个空间的直接子节点层级（结构同 get_cached_hierarchy）"""
+    entry = _get_cache()['entries'].get(space_id)
+    return entry['children'] if entry else []
+
+
+def get_cached_nodes():
+    """空间ID -> SpaceNode 映射"""
+    return _get_cache()['nodes']
+
+
+def get_cached_node(space_id):
+    return get_cached_nodes().get(space_id)
+
+
+def get_cached_space_choices():
+    """按路径排序的 (id, path) 选项列表"""
+    return _get_cache()['choices']
+
+
+def search_space_paths(query, limit=20):
+    """
+    按前缀搜索空间路径
+    先在有序路径列表上二分查找完整路径前缀，不足 limit 时再补充名称前缀匹配
+    """
+    query = (query or '').strip()
+    if not query:
+        return []
+
+    cache = _get_cache()
+    choices, paths = cache['choices'], cache['paths']
+    results = []
+    start = bisect_left(paths, query)
+    for space_id, path in choices[start:]:
+        if not path.startswith(query) or len(results) >= limit:
+            break
+        results.append((space_id, path))
+
+    if len(results) < limit:
+        seen = {space_id for space_id, _ in results}
+        nodes = cache['nodes']
+        for space_id, path in choices:
+            if space_id not in seen and nodes[space_id].name.startswith(query):
+                results.append((space_id, path))
+                if len(results) >= limit:
+                    break
+    return results
@@ -1,107 +1,22 @@
-from datetime import datetime, timedelta
+from datetime import datetime
 from flask import current_app  # 新增：用于日志输出
 from app import db
-from app.models import Reservation, Record
-from app.email import send_email, send_overdue_reminder  # 合并导入，更简洁
+from app.overdue import send_overdue_digests
+from app.reservation_timeline import timeline, run_due_events
 
 
-def update_reservation_status():
-    """更新预约状态的定时任务（去掉app_context参数，适配包装函数的上下文）"""
+def update_reservation_status(rebuild=False):
+    """
+    处理已到期的预约事件（开始 / 作废 / 恢复 / 开始前提醒），由调度器在堆顶事件到期时触发
+    :param rebuild: 先从数据库重建事件堆（手动触发、定期同步时使用）
+    """
     try:
         current_app.logger.info("开始执行：更新预约状态任务")
-        now_utc = datetime.utcnow()
-
-        # ===================================================
-        # 1. 处理 [待开始] (scheduled) -> [有效] / [冲突]
-        # ===================================================
-        scheduled_res = Reservation.query.filter_by(status='scheduled').all()
-        for res in scheduled_res:
-            # 到达开始时间
-            if now_utc >= res._utc_reservation_start:
-                if res.item.status == 'available':
-                    res.status = 'active'
-                    res.item.status = 'reserved'  # 【新增】预约生效，锁定物品状态
-                    # 可选：发送预约生效通知
-                else:
-                    res.status = 'conflicted'
-                    # 发送冲突提醒：告知预约人物品未归还
-                    if res.user:
-                        send_email(
-                            to=res.user.email,
-                            subject='预约暂时冲突',
-                            template='reservations/email/reservation_conflict.html',
-                            item=res.item,
-                            reservation=res
-                        )
-                db.session.commit()
-
-        # ===================================================
-        # 2. 处理 [冲突] (conflicted) -> [有效] / [作废]
-        # ===================================================
-        # 场景：前一个人迟还了，现在还了，预约应自动恢复为有效
-        conflicted_res = Reservation.query.filter_by(status='conflicted').all()
-        for res in conflicted_res:
-            # 如果已经超过了预约结束时间，直接作废
-            if now_utc >= res._utc_reservation_end:
-                res.status = 'expired'
-                db.session.commit()
-                continue
-
-            # 如果物品变回可用，且仍在预约时段内，恢复为有效
-            if res.item.status == 'available':
-                res.status = 'active'
-                res.item.status = 'reserved'  # 【新增】冲突解除，锁定物品状态
-                if res.user:
-                    send_email(
-                        to=res.user.email,
-                        subject='预约已恢复有效',
-                        template='reservations/email/reservation_reminder.html',  # 复用提醒模板
-                        reservation=res
-                    )
-                db.session.commit()
-
-        # ===================================================
-        # 3. 处理 [有效] (active) -> [作废] (expired)
-        # ===================================================
-        active_res = Reservation.query.filter_by(status='active').all()
-        for res in active_res:
-            # 判定条件：
-            # A. 超过预约开始时间24小时仍未取走 (原有逻辑)
-            # B. 或者已经超过了预约结束时间 (新增逻辑，预约时段已过)
-            is_long_overdue = now_utc - res._utc_reservation_start > timedelta(hours=24)
-            is_past_end_time = now_utc >= res._utc_reservation_end
-
-            if is_long_overdue or is_past_end_time:
-                res.status = 'expired'
-                # 【新增】如果物品当前状态是已预约（未被借走），则释放为可用
-                if res.item.status == 'reserved':
-                    res.item.status = 'available'
-
-                if res.user:
-                    send_email(
-                        to=res.user.email,
-                        subject='预约已作废',
-                        template='reservations/email/reservation_expired.html',
-                        reservation=res
-                    )
-                db.session.commit()
-
-        # ===================================================
-        # 4. 预约前提醒 (scheduled)
-        # ===================================================
-        soon_res = Reservation.query.filter_by(status='scheduled').all()
-        for res in soon_res:
-            time_diff = res._utc_reservation_start - now_utc
-            # 提前12小时提醒
-            if timedelta(hours=12) >= time_diff > timedelta(hours=11):
-                if res.user:
-                    send_email(
-                        to=res.user.email,
-                        subject='预约即将开始',
-                        template='reservations/email/reservation_reminder.html',
-                        reservation=res
-                    )
-        current_app.logger.info("预约状态更新任务执行完成")
+        if rebuild:
+            count = timeline.rebuild()
+            current_app.logger.info(f"预约事件堆已重建，共 {count} 个未结束预约")
+        handled = run_due_events()
+        current_app.logger.info(f"预约状态更新任务执行完成，处理 {handled} 个到期事件")
 
     except Exception as e:
         # 捕获所有异常，记录日志并回滚数据库，避免任务崩溃
@@ -119,18 +34,36 @@ def print_test_task():
 
 
 def check_overdue_records():
-    """检查逾期记录并发送提醒（去掉app_context参数）"""
+    """检查逾期记录并发送提醒：每位借用人一封汇总邮件 + 管理员总览（去掉app_context参数）"""
     try:
         current_app.logger.info("开始执行：检查逾期记录任务")
-        overdue_records = Record.query.filter(
-            Record.status == 'using',
-            Record._utc_start_time < datetime.utcnow() - timedelta(days=7)
-        ).all()
+        digests, _ = send_overdue_digests()
+        current_app.logger.info(f"逾期记录检查完成，共找到 {sum(len(d.entries) for d in digests)} 条逾期记录，"
+                                f"涉及 {len(digests)} 位用户")
+    except Exception as e:
+        current_app.logger.error(f"检查逾期记录任务执行失败: {str(e)}", exc_info=True)
+        db.session.rollback()
 
-        for record in overdue_records:
-            send_overdue_reminder(record)
 
-        current_app.logger.info(f"逾期记录检查完成，共找到 {len(overdue_records)} 条逾期记录")
+def retry_notifications_task():
+    """重新发送失败或超时未回写结果的通知（按通知台账的最大尝试次数）"""
+    from app.notifications import retry_notifications
+    try:
+        current_app.logger.info("开始执行：通知重试任务")
+        threads = retry_notifications()
+        current_app.logger.info(f"通知重试任务执行完成，发送批次 {len(threads)} 个")
     except Exception as e:
-        current_app.logger.error(f"检查逾期记录任务执行失败: {str(e)}", exc_info=True)
-        db.session.rollback()
\ No newline at end of file
+        current_app.logger.error(f"通知重试任务执行失败: {str(e)}", exc_info=True)
+        db.session.rollback()
+
+
+def archive_history_task():
+    """归档已结束的使用记录和预约（热表 -> 归档表）"""
+    from app.archive import archive_history
+    try:
+        current_app.logger.info("开始执行：冷数据归档任务")
+        moved = archive_history()
+        current_app.logger.info(f"冷数据归档完成：记录 {moved['records']} 条，预约 {moved['reservations']} 条")
+    except Exception as e:
+        current_app.logger.error(f"冷数据归档任务执行失败: {str(e)}", exc_info=True)
+        db.session.rollback()
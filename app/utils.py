@@ -1,11 +1,9 @@
-import os
 import re
 from datetime import datetime, timedelta
 
 from flask import current_app, redirect, url_for, flash, session
 from flask_login import current_user
 from functools import wraps
-import qrcode
 
 
 # 登录且是管理员(Admin)才能访问的装饰器
@@ -52,23 +50,19 @@ def is_admin():
 
 
 def get_space_path(space):
-    """获取空间的完整路径"""
-    path = [space.name]
-    current = space.parent
-    while current:
-        path.insert(0, current.name)
-        current = current.parent
-    return '/'.join(path)
+    """获取空间的完整路径（读取物化路径）"""
+    return space.get_path()
 
 
-def is_overdue(record, days=10):
+def is_overdue(record, days=None):
     """
     检查记录是否逾期
-    默认超过10天未归还视为逾期
+    默认超过 OVERDUE_DAYS 天未归还视为逾期
     """
     if record.return_time or record.status != 'using':
         return False
-    return (datetime.utcnow() - record.start_time) > timedelta(days=days)
+    days = days if days is not None else current_app.config['OVERDUE_DAYS']
+    return (datetime.utcnow() - record._utc_start_time) > timedelta(days=days)
 
 
 def format_datetime(dt, format='%Y-%m-%d %H:%M'):
@@ -105,44 +99,21 @@ def sanitize_filename(filename):
     return re.sub(r'[\\/*?:"<>|]', "", str(filename)).strip()
 
 
-def generate_and_save_item_qrcode(item):
-    """
-    生成物品二维码并保存到static/qrcodes目录
-    文件名格式：物品名称_编号.png
-    """
-    # 1. 获取配置的 Base URL
-    base_url = current_app.config.get('QR_CODE_BASE_URL', 'http://127.0.0.1:5000')
-    base_url = base_url.rstrip('/')  # 去除末尾斜杠
-
-    # 2. 构建物品详情页URL
-    url = f"{base_url}/items/{item.id}"
-
-    # 3. 生成二维码
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_M,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(url)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-
-    # 4. 构建文件名 (物品名称_编号.png)
+def qrcode_download_name(item):
+    """二维码下载 / 打包时使用的文件名：物品名称_编号.png（名称或编号为空时回退到ID）"""
     safe_name = sanitize_filename(item.name)
     safe_serial = sanitize_filename(item.serial_number)
-    # 如果文件名为空，回退到使用ID
     if not safe_name or not safe_serial:
-        filename = f"item_{item.id}_qrcode.png"
-    else:
-        filename = f"{safe_name}_{safe_serial}.png"
+        return f"item_{item.id}_qrcode.png"
+    return f"{safe_name}_{safe_serial}.png"
 
-    # 5. 定义存储路径（static/qrcodes目录）
-    qr_dir = os.path.join(current_app.root_path, 'static', 'qrcodes')
-    os.makedirs(qr_dir, exist_ok=True)  # 确保目录存在
 
-    qr_path = os.path.join(qr_dir, filename)
-    img.save(qr_path)
-
-    # 6. 返回相对static目录的子路径（如qrcodes/名称_编号.png）
-    return os.path.join('qrcodes', filename)
\ No newline at end of file
+def generate_and_save_item_qrcode(item, fmt='png'):
+    """
+    生成物品二维码并保存到 static/qrcodes 下的内容寻址目录
+    内容与渲染参数不变时直接复用已有文件，不再重复渲染
+    :param fmt: 'png'（Pillow 位图）或 'svg'（矢量图，体积更小、生成更快）
+    返回相对 static 目录的子路径（如 qrcodes/ab/cd/<sha256>.png）
+    """
+    from app.qrcodes import ensure_item_qrcode
+    return ensure_item_qrcode(item.id, fmt)
@@ -50,11 +50,64 @@ class Config:
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
     ITEMS_PER_PAGE = 10
     RECORDS_PER_PAGE = 10
+
+    # 物品表单“所属空间”下拉框最多直接内嵌的选项数，超过后改用路径搜索（typeahead）
+    SPACE_CHOICES_MAX = int(os.environ.get('SPACE_CHOICES_MAX', '500'))
+
+    # 全局搜索：每类结果条数、最短关键词长度（汉字按 2 计）、计数估算上限、每类查询时间预算（秒）
+    GLOBAL_SEARCH_PER_CATEGORY = 10
+    GLOBAL_SEARCH_MIN_LENGTH = 2
+    GLOBAL_SEARCH_COUNT_CAP = 1000
+    GLOBAL_SEARCH_TIME_BUDGET = float(os.environ.get('GLOBAL_SEARCH_TIME_BUDGET', '0.5'))
+
+    # 物品详情页借用/预约状态快照的缓存时间（秒），0 表示不缓存；借用、归还、预约变更提交后立即失效
+    ITEM_SNAPSHOT_TTL = float(os.environ.get('ITEM_SNAPSHOT_TTL', '5'))
+    # 预约日历（可预约时段）：按 (物品, 日期) 缓存占用区间的时间（秒）；单次查询最多天数、最多物品数
+    AVAILABILITY_CACHE_TTL = float(os.environ.get('AVAILABILITY_CACHE_TTL', '60'))
+    AVAILABILITY_MAX_DAYS = 31
+    AVAILABILITY_MAX_ITEMS = 1000
     # BABEL_DEFAULT_TIMEZONE = 'Asia/Shanghai' # 未使用
 
     # 【保留你的自定义配置】：二维码基础链接
     QR_CODE_BASE_URL = os.environ.get('QR_CODE_BASE_URL') or 'http://192.168.1.101:8080'
 
+    # 批量生成二维码：缺失数量达到 QR_BATCH_PARALLEL_MIN 时使用进程池（QR_BATCH_WORKERS 为 0 时取 CPU 核数），
+    # 选中物品达到 QR_BATCH_BACKGROUND_MIN 时转为后台任务
+    QR_BATCH_WORKERS = int(os.environ.get('QR_BATCH_WORKERS', '0'))
+    QR_BATCH_PARALLEL_MIN = 50
+    QR_BATCH_BACKGROUND_MIN = 500
+
+    # 按需渲染二维码：进程内 LRU 缓存条数、浏览器/代理缓存时间（秒）
+    QR_RENDER_CACHE_SIZE = int(os.environ.get('QR_RENDER_CACHE_SIZE', '256'))
+    QR_CACHE_MAX_AGE = 86400
+
+    # 打印标签页（A4）：每页列数 × 行数、渲染分辨率；中文标签需指定含中文字形的字体文件
+    LABEL_SHEET_COLUMNS = 3
+    LABEL_SHEET_ROWS = 8
+    LABEL_SHEET_DPI = 150
+    LABEL_FONT_PATH = os.environ.get('LABEL_FONT_PATH')
+
+    # 批量导入：每批插入的物品数（每批一次提交）
+    ITEM_IMPORT_BATCH_SIZE = 500
+
+    # 预约状态：由事件堆驱动（到期即触发）；多进程部署时其他进程的修改靠定期从数据库重建同步（分钟）
+    RESERVATION_RESYNC_MINUTES = 10
+
+    # 逾期提醒：借用超过 N 天未归还视为逾期（页面标记与提醒邮件共用）；提醒任务间隔（小时），每次运行每人一封汇总邮件
+    OVERDUE_DAYS = int(os.environ.get('OVERDUE_DAYS', '10'))
+    OVERDUE_CHECK_INTERVAL_HOURS = 24
+
+    # 冷数据归档：已结束超过 N 天的记录 / 预约移入归档表；每批行数、定时任务间隔（小时）
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '180'))
+    ARCHIVE_BATCH_SIZE = 1000
+    ARCHIVE_INTERVAL_HOURS = 24
+
+    # 通知重试：发送失败、或领取后超过 N 分钟仍未回写结果（发送进程中途退出）的通知重新发送；
+    # 每条通知最多尝试次数、重试任务间隔（分钟）
+    NOTIFICATION_PENDING_TIMEOUT_MINUTES = 30
+    NOTIFICATION_MAX_ATTEMPTS = 5
+    NOTIFICATION_RETRY_INTERVAL_MINUTES = 15
+
     @staticmethod
     def init_app(app):
         pass
@@ -0,0 +1,57 @@
+"""Add materialized path columns to Space
+
+Revision ID: 3c1f2a7d9e04
+Revises: ba3539feac65
+Create Date: 2026-10-17 10:12:31.204815
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1f2a7d9e04'
+down_revision = 'ba3539feac65'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('space', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('full_path', sa.String(length=1024), nullable=True))
+        batch_op.add_column(sa.Column('level', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('ancestry', sa.String(length=255), nullable=True))
+        batch_op.create_index(batch_op.f('ix_space_ancestry'), ['ancestry'], unique=False)
+
+    # 回填已有空间的物化路径：一次读出全部空间，在内存中自顶向下计算
+    conn = op.get_bind()
+    rows = conn.execute(sa.text('SELECT id, name, parent_id FROM space')).fetchall()
+    by_parent = {}
+    for row in rows:
+        by_parent.setdefault(row.parent_id, []).append(row)
+
+    stack = [(row, None) for row in by_parent.get(None, [])]
+    while stack:
+        row, parent = stack.pop()
+        if parent is None:
+            values = {'full_path': row.name, 'level': 0, 'ancestry': '/'}
+        else:
+            values = {
+                'full_path': f"{parent['full_path']}/{row.name}",
+                'level': parent['level'] + 1,
+                'ancestry': f"{parent['ancestry']}{parent['id']}/",
+            }
+        conn.execute(
+            sa.text('UPDATE space SET full_path = :full_path, level = :level, ancestry = :ancestry WHERE id = :id'),
+            dict(values, id=row.id)
+        )
+        values['id'] = row.id
+        stack.extend((child, values) for child in by_parent.get(row.id, []))
+
+
+def downgrade():
+    with op.batch_alter_table('space', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_space_ancestry'))
+        batch_op.drop_column('ancestry')
+        batch_op.drop_column('level')
+        batch_op.drop_column('full_path')
@@ -0,0 +1,53 @@
+"""Add rolled-up item counters to Space
+
+Revision ID: 7e52b0c4a1d3
+Revises: 3c1f2a7d9e04
+Create Date: 2026-10-17 14:03:47.518230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e52b0c4a1d3'
+down_revision = '3c1f2a7d9e04'
+branch_labels = None
+depends_on = None
+
+STATUSES = ('available', 'borrowed', 'reserved')
+COLUMNS = ['item_count'] + [f'{s}_count' for s in STATUSES]
+COLUMNS += [f'subtree_{c}' for c in COLUMNS]
+
+
+def upgrade():
+    with op.batch_alter_table('space', schema=None) as batch_op:
+        for column in COLUMNS:
+            batch_op.add_column(sa.Column(column, sa.Integer(), server_default='0', nullable=False))
+
+    # 回填：按 (space_id, status) 分组统计直属数量，再沿 ancestry 向上汇总
+    conn = op.get_bind()
+    ancestry = dict(conn.execute(sa.text('SELECT id, ancestry FROM space')).fetchall())
+    totals = {space_id: dict.fromkeys(COLUMNS, 0) for space_id in ancestry}
+    rows = conn.execute(sa.text(
+        'SELECT space_id, status, COUNT(id) FROM item GROUP BY space_id, status'
+    )).fetchall()
+    for space_id, status, count in rows:
+        if space_id not in totals:
+            continue
+        targets = [space_id] + [int(x) for x in (ancestry[space_id] or '').split('/') if x and int(x) in totals]
+        direct = ['item_count'] + ([f'{status}_count'] if status in STATUSES else [])
+        for column in direct:
+            totals[space_id][column] += count
+            for target in targets:
+                totals[target][f'subtree_{column}'] += count
+
+    for space_id, values in totals.items():
+        assignments = ', '.join(f'{column} = :{column}' for column in COLUMNS)
+        conn.execute(sa.text(f'UPDATE space SET {assignments} WHERE id = :id'), dict(values, id=space_id))
+
+
+def downgrade():
+    with op.batch_alter_table('space', schema=None) as batch_op:
+        for column in reversed(COLUMNS):
+            batch_op.drop_column(column)
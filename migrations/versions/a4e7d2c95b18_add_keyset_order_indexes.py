@@ -0,0 +1,36 @@
+"""Add (start, id) indexes matching the keyset order of the history lists
+
+Revision ID: a4e7d2c95b18
+Revises: f3a9c2d81e47
+Create Date: 2026-10-17 21:06:42.518930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4e7d2c95b18'
+down_revision = 'f3a9c2d81e47'
+branch_labels = None
+depends_on = None
+
+# (索引名, 表, 列)：全部记录 / 全部预约列表按 (开始时间, ID) 倒序键集分页
+INDEXES = [
+    ('ix_record_start_time_id', 'record', ['start_time', 'id']),
+    ('ix_reservation_start_id', 'reservation', ['reservation_start', 'id']),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns in INDEXES:
+        if name not in {index['name'] for index in inspector.get_indexes(table)}:
+            op.create_index(name, table, columns, unique=False)
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('ANALYZE')
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,34 @@
+"""Add attempts and claimed_at to the notification ledger for retries
+
+Revision ID: b6d1e93f2a57
+Revises: a4e7d2c95b18
+Create Date: 2026-10-17 22:31:07.845213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d1e93f2a57'
+down_revision = 'a4e7d2c95b18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 应用启动时 db.create_all() 可能已按新模型建好该表
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('notification_log')}
+    with op.batch_alter_table('notification_log', schema=None) as batch_op:
+        if 'attempts' not in columns:
+            batch_op.add_column(sa.Column('attempts', sa.Integer(), server_default='1', nullable=False))
+        if 'claimed_at' not in columns:
+            batch_op.add_column(sa.Column('claimed_at', sa.DateTime(), nullable=True))
+    # 已有台账行的领取时间即登记时间
+    op.execute('UPDATE notification_log SET claimed_at = created_at WHERE claimed_at IS NULL')
+
+
+def downgrade():
+    with op.batch_alter_table('notification_log', schema=None) as batch_op:
+        batch_op.drop_column('claimed_at')
+        batch_op.drop_column('attempts')
@@ -0,0 +1,65 @@
+"""Add FTS5 full-text search index
+
+Revision ID: c94e3d5f8b21
+Revises: 7e52b0c4a1d3
+Create Date: 2026-10-17 16:40:09.732118
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c94e3d5f8b21'
+down_revision = '7e52b0c4a1d3'
+branch_labels = None
+depends_on = None
+
+_CJK_RE = re.compile(r'([぀-ヿ㐀-䶿一-鿿가-힯豈-﫿])')
+
+# 与 app/search.py 保持一致：kind -> (表名, name / serial / content 对应列)
+SOURCES = {
+    'item': ('item', ('name', 'serial_number', 'function')),
+    'record': ('record', ('usage_location', None, 'space_path')),
+    'space': ('space', ('name', None, 'full_path')),
+}
+
+
+def _segment(value):
+    return _CJK_RE.sub(r' \1 ', str(value)) if value else ''
+
+
+def upgrade():
+    conn = op.get_bind()
+    if conn.dialect.name != 'sqlite':
+        # 非 SQLite 数据库使用 ilike 回退，无需建表
+        return
+
+    conn.execute(sa.text(
+        'CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5('
+        'kind UNINDEXED, ref_id UNINDEXED, name, serial, content, '
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    ))
+
+    insert = sa.text(
+        'INSERT INTO search_fts (kind, ref_id, name, serial, content) '
+        'VALUES (:kind, :ref_id, :name, :serial, :content)'
+    )
+    for kind, (table_name, fields) in SOURCES.items():
+        columns = ', '.join(field or "''" for field in fields)
+        rows = conn.execute(sa.text(f'SELECT id, {columns} FROM {table_name}')).fetchall()
+        docs = [
+            {'kind': kind, 'ref_id': row[0], 'name': _segment(row[1]),
+             'serial': _segment(row[2]), 'content': _segment(row[3])}
+            for row in rows
+        ]
+        if docs:
+            conn.execute(insert, docs)
+
+
+def downgrade():
+    conn = op.get_bind()
+    if conn.dialect.name == 'sqlite':
+        conn.execute(sa.text('DROP TABLE IF EXISTS search_fts'))
@@ -0,0 +1,45 @@
+"""Add composite and partial indexes for hot query shapes
+
+Revision ID: d2a8f61c7b90
+Revises: c94e3d5f8b21
+Create Date: 2026-10-17 19:25:14.306582
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a8f61c7b90'
+down_revision = 'c94e3d5f8b21'
+branch_labels = None
+depends_on = None
+
+USING_ONLY = sa.text("status = 'using'")
+
+# (索引名, 表, 列, 部分索引条件)
+INDEXES = [
+    ('ix_space_parent_id', 'space', ['parent_id'], None),
+    ('ix_item_status', 'item', ['status'], None),
+    ('ix_item_space_id', 'item', ['space_id'], None),
+    ('ix_record_status_start_time', 'record', ['status', 'start_time'], None),
+    ('ix_record_item_id_start_time', 'record', ['item_id', 'start_time'], None),
+    ('ix_record_user_id_start_time', 'record', ['user_id', 'start_time'], None),
+    ('ix_record_using_start_time', 'record', ['start_time'], USING_ONLY),
+    ('ix_reservation_status_start', 'reservation', ['status', 'reservation_start'], None),
+    ('ix_reservation_item_status_period', 'reservation',
+     ['item_id', 'status', 'reservation_start', 'reservation_end'], None),
+]
+
+
+def upgrade():
+    for name, table, columns, where in INDEXES:
+        op.create_index(name, table, columns, unique=False, sqlite_where=where, postgresql_where=where)
+    # 让查询规划器立即用上新索引的统计信息
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('ANALYZE')
+
+
+def downgrade():
+    for name, table, _, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
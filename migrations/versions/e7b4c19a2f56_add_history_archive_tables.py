@@ -0,0 +1,99 @@
+"""Add archive tables for returned records and finished reservations
+
+Revision ID: e7b4c19a2f56
+Revises: d2a8f61c7b90
+Create Date: 2026-10-17 21:02:38.917443
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b4c19a2f56'
+down_revision = 'd2a8f61c7b90'
+branch_labels = None
+depends_on = None
+
+RECORD_COLUMNS = ['id', 'item_id', 'user_id', 'space_path', 'usage_location', 'start_time', 'return_time',
+                  'created_at', 'status']
+RESERVATION_COLUMNS = ['id', 'item_id', 'user_id', 'reservation_start', 'reservation_end', 'created_at', 'status',
+                       'notes']
+
+
+def _enable_autoincrement(table, partial_indexes):
+    # 归档行保留原ID：热表主键改为 AUTOINCREMENT，SQLite 不再复用已删除（已归档）的最大ID
+    # 部分索引在重建表时不一定能被正确反射，先删除再按原定义重建
+    for name, columns, where in partial_indexes:
+        op.drop_index(name, table_name=table)
+    with op.batch_alter_table(table, recreate='always', table_kwargs={'sqlite_autoincrement': True}):
+        pass
+    for name, columns, where in partial_indexes:
+        op.create_index(name, table, columns, unique=False, sqlite_where=where, postgresql_where=where)
+
+
+def upgrade():
+    # 应用启动时 db.create_all() 可能已建好归档表（连同索引），此时只需处理热表主键
+    existing = sa.inspect(op.get_bind()).get_table_names()
+    if 'record_archive' not in existing:
+        _create_archive_tables()
+
+    if op.get_bind().dialect.name == 'sqlite':
+        _enable_autoincrement('record', [
+            ('ix_record_using_start_time', ['start_time'], sa.text("status = 'using'")),
+        ])
+        _enable_autoincrement('reservation', [])
+
+
+def _create_archive_tables():
+    op.create_table(
+        'record_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('item_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('space_path', sa.String(length=255), nullable=True),
+        sa.Column('usage_location', sa.String(length=255), nullable=True),
+        sa.Column('start_time', sa.DateTime(), nullable=True),
+        sa.Column('return_time', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_record_archive_item_id_start_time', 'record_archive', ['item_id', 'start_time'])
+    op.create_index('ix_record_archive_user_id_start_time', 'record_archive', ['user_id', 'start_time'])
+    op.create_index('ix_record_archive_start_time', 'record_archive', ['start_time'])
+
+    op.create_table(
+        'reservation_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('item_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('reservation_start', sa.DateTime(), nullable=False),
+        sa.Column('reservation_end', sa.DateTime(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('notes', sa.Text(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_reservation_archive_item_id_start', 'reservation_archive', ['item_id', 'reservation_start'])
+    op.create_index('ix_reservation_archive_user_id_start', 'reservation_archive', ['user_id', 'reservation_start'])
+    op.create_index('ix_reservation_archive_start', 'reservation_archive', ['reservation_start'])
+
+
+def downgrade():
+    # 先把归档数据移回热表，再删除归档表
+    op.execute(f'INSERT INTO record ({", ".join(RECORD_COLUMNS)}) '
+               f'SELECT {", ".join(RECORD_COLUMNS)} FROM record_archive')
+    op.execute(f'INSERT INTO reservation ({", ".join(RESERVATION_COLUMNS)}) '
+               f'SELECT {", ".join(RESERVATION_COLUMNS)} FROM reservation_archive')
+
+    op.drop_index('ix_reservation_archive_start', table_name='reservation_archive')
+    op.drop_index('ix_reservation_archive_user_id_start', table_name='reservation_archive')
+    op.drop_index('ix_reservation_archive_item_id_start', table_name='reservation_archive')
+    op.drop_table('reservation_archive')
+    op.drop_index('ix_record_archive_start_time', table_name='record_archive')
+    op.drop_index('ix_record_archive_user_id_start_time', table_name='record_archive')
+    op.drop_index('ix_record_archive_item_id_start_time', table_name='record_archive')
+    op.drop_table('record_archive')
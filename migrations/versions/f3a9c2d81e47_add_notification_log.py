@@ -0,0 +1,44 @@
+"""Add notification ledger
+
+Revision ID: f3a9c2d81e47
+Revises: e7b4c19a2f56
+Create Date: 2026-10-17 23:14:52.603118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a9c2d81e47'
+down_revision = 'e7b4c19a2f56'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 应用启动时 db.create_all() 可能已建好该表
+    if 'notification_log' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'notification_log',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('subject_type', sa.String(length=20), nullable=False),
+        sa.Column('subject_id', sa.Integer(), nullable=False),
+        sa.Column('notification_type', sa.String(length=30), nullable=False),
+        sa.Column('state_version', sa.String(length=64), nullable=False),
+        sa.Column('recipient', sa.String(length=255), nullable=True),
+        sa.Column('status', sa.String(length=10), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('subject_type', 'subject_id', 'notification_type', 'state_version',
+                            name='uq_notification_log_key')
+    )
+    op.create_index('ix_notification_log_type_created', 'notification_log', ['notification_type', 'created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_notification_log_type_created', table_name='notification_log')
+    op.drop_table('notification_log')
@@ -1,8 +1,8 @@
 import os
 import click
 from app import create_app, db
-from app.models import Record
-from app.email import send_overdue_reminder
+from app.models import Space
+from app.overdue import send_overdue_digests
 
 # 核心：读取 FLASK_CONFIG 环境变量，默认值为 'default'
 # FLASK_CONFIG 值对应 config.py 的 config 字典键：development/production/testing/docker
@@ -23,15 +23,116 @@ def init_db():
 def manual_check_overdue():
     """手动检查逾期记录（保留手动触发的功能）"""
     with app.app_context():
-        from datetime import datetime, timedelta
-        overdue_records = Record.query.filter(
-            Record.status == 'using',
-            Record.start_time < datetime.utcnow() - timedelta(days=10)
-        ).all()
+        digests, thread = send_overdue_digests()
+        if thread:
+            thread.join()
+    click.echo(f'已检查逾期记录并发送提醒：{sum(len(d.entries) for d in digests)} 条逾期记录，{len(digests)} 位用户')
 
-        for record in overdue_records:
-            send_overdue_reminder(record)
-    click.echo('已检查逾期记录并发送提醒')
+
+@app.cli.command("rebuild-space-paths")
+def rebuild_space_paths():
+    """重建空间物化路径（full_path / level / ancestry）"""
+    with app.app_context():
+        count = Space.rebuild_paths()
+        db.session.commit()
+    click.echo(f'已重建 {count} 个空间的路径')
+
+
+@app.cli.command("rebuild-space-counts")
+def rebuild_space_counts():
+    """重建空间物品计数器（直属及子树，按物品状态拆分）"""
+    with app.app_context():
+        count = Space.rebuild_item_counts()
+        db.session.commit()
+    click.echo(f'已重建 {count} 个空间的物品计数')
+
+
+@app.cli.command("rebuild-search-index")
+def rebuild_search_index_command():
+    """重建全文检索索引（物品 / 使用记录 / 空间）"""
+    from app.search import rebuild_search_index
+    with app.app_context():
+        count = rebuild_search_index()
+        db.session.commit()
+    click.echo(f'已重建全文检索索引，共 {count} 条文档')
+
+
+@app.cli.command("import-items")
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--dry-run', is_flag=True, help='只校验并输出报告，不写入数据')
+@click.option('--no-create-spaces', is_flag=True, help='空间路径不存在时报错，而不是自动创建')
+@click.option('--batch-size', default=500, show_default=True, help='每批插入并提交的物品数')
+@click.option('--no-qr', is_flag=True, help='导入后不生成二维码')
+def import_items_command(path, dry_run, no_create_spaces, batch_size, no_qr):
+    """从 CSV / XLSX 批量导入物品"""
+    from app.importer import import_items, read_rows, ItemImportError
+    from app.qrcodes import generate_item_qrcodes, save_barcode_paths
+    with app.app_context():
+        try:
+            with open(path, 'rb') as f:
+                report = import_items(read_rows(f, path), dry_run=dry_run,
+                                      create_spaces=not no_create_spaces, batch_size=batch_size)
+        except ItemImportError as e:
+            raise click.ClickException(str(e))
+
+        for line, message in report.errors:
+            click.echo(f'第 {line} 行：{message}', err=True)
+        for space_path in report.new_space_paths:
+            click.echo(f'{"将新建" if dry_run else "已新建"}空间：{space_path}')
+        click.echo(report.summary())
+        if report.errors:
+            raise SystemExit(1)
+
+        # 二维码在全部物品写入后统一生成
+        if report.item_ids and not no_qr:
+            paths = generate_item_qrcodes(report.item_ids)
+            save_barcode_paths(paths)
+            click.echo(f'已为 {len(paths)} 个物品生成二维码')
+
+
+@app.cli.command("export-data")
+@click.argument('kind', type=click.Choice(['items', 'records', 'reservations']))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default='csv', show_default=True)
+@click.option('--gzip', 'use_gzip', is_flag=True, help='输出 gzip 压缩流')
+@click.option('--output', '-o', type=click.Path(dir_okay=False, allow_dash=True), default='-',
+              help='输出文件，默认写到标准输出')
+@click.option('--status', default='', help='按状态筛选')
+@click.option('--query', default='', help='物品关键词（仅 items）')
+@click.option('--username', default='', help='用户名模糊筛选（records / reservations）')
+@click.option('--item-name', default='', help='物品名模糊筛选（records / reservations）')
+def export_data_command(kind, fmt, use_gzip, output, status, query, username, item_name):
+    """流式导出物品 / 使用记录 / 预约（筛选条件同管理列表）"""
+    from app.exporter import iter_export
+    filters = {'status': status, 'query': query, 'username': username, 'item_name': item_name}
+    with app.app_context():
+        with click.open_file(output, 'wb') as f:
+            for chunk in iter_export(kind, fmt, filters, gzip=use_gzip):
+                f.write(chunk)
+
+
+@app.cli.command("archive-history")
+@click.option('--days', type=int, default=None, help='结束超过多少天的数据移入归档表（默认 ARCHIVE_AFTER_DAYS）')
+@click.option('--batch-size', type=int, default=None, help='每批移动的行数（默认 ARCHIVE_BATCH_SIZE）')
+def archive_history_command(days, batch_size):
+    """把已结束的使用记录 / 预约移入归档表"""
+    from app.archive import archive_history
+    with app.app_context():
+        moved = archive_history(older_than_days=days, batch_size=batch_size)
+    click.echo(f'已归档 {moved["records"]} 条使用记录、{moved["reservations"]} 条预约')
+
+
+@app.cli.command("notification-stats")
+@click.option('--days', type=int, default=None, help='只统计最近 N 天登记的通知')
+def notification_stats_command(days):
+    """按通知类型统计发送情况（待发送 / 已发送 / 失败）"""
+    from datetime import datetime, timedelta
+    from app.notifications import notification_stats
+    with app.app_context():
+        stats = notification_stats(since=datetime.utcnow() - timedelta(days=days) if days else None)
+    if not stats:
+        click.echo('暂无通知记录')
+    for notification_type, counts in sorted(stats.items()):
+        click.echo(f'{notification_type}: 已发送 {counts["sent"]}，失败 {counts["failed"]}，待发送 {counts["pending"]}')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,70 @@
+"""
+测试公共夹具
+- 将项目根目录加入 sys.path，测试文件可直接 from app import ...
+- app：每个测试模块一个测试应用（内存 SQLite 各自独立）；需要调整配置的模块在模块内覆盖该夹具
+- fresh_db：重建全部表并清空全文检索文档（内存库在同一应用的多个应用上下文之间共享）；测试自行推入应用上下文，
+  避免同一会话跨越测试客户端请求读到旧对象
+- count_queries：统计代码块内实际发出的 SQL 语句
+- join_mail_threads：等待后台发信线程结束（邮件与发送结果回写都在后台线程中进行）
+"""
+import os
+import sys
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.search import fts_available, search_fts
+
+
+@pytest.fixture(scope='module')
+def app():
+    return create_app('testing')
+
+
+@pytest.fixture
+def fresh_db(app):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        # 全文检索虚拟表不在 ORM 元数据中，drop_all 不会删除
+        if fts_available():
+            db.session.execute(search_fts.delete())
+            db.session.commit()
+    return db
+
+
+@pytest.fixture
+def count_queries(app):
+    with app.app_context():
+        engine = db.engine
+
+    @contextmanager
+    def counter():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+    return counter
+
+
+@pytest.fixture
+def join_mail_threads():
+    def join():
+        for thread in threading.enumerate():
+            if thread is not threading.main_thread() and not thread.daemon:
+                thread.join(timeout=5)
+
+    return join
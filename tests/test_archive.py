@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+
+from app import db
+from app.models import Space, Item, Record, Reservation, User, RecordArchive, ReservationArchive
+from app.archive import archive_history
+
+
+def _populate():
+    admin = User(username='admin', email='admin@example.com', role='admin')
+    admin.set_password('pw')
+    space = Space(name='实验室')
+    db.session.add_all([admin, space])
+    db.session.flush()
+    item = Item(name='示波器', serial_number='OSC-1', space_id=space.id)
+    db.session.add(item)
+    db.session.flush()
+
+    now = datetime.utcnow()
+    old = now - timedelta(days=400)
+    for i in range(5):
+        db.session.add(Record(item_id=item.id, user_id=admin.id, status='returned', usage_location=f'旧地点{i}',
+                              _utc_start_time=old + timedelta(hours=i), _utc_return_time=old + timedelta(hours=i + 1)))
+    # 进行中 / 近期的数据保留在热表
+    db.session.add(Record(item_id=item.id, user_id=admin.id, status='using', _utc_start_time=old))
+    db.session.add(Record(item_id=item.id, user_id=admin.id, status='returned',
+                          _utc_start_time=now - timedelta(days=1), _utc_return_time=now))
+    for status in ('expired', 'cancelled', 'used', 'scheduled'):
+        db.session.add(Reservation(item_id=item.id, user_id=admin.id, status=status, notes='备注' * 40,
+                                   _utc_reservation_start=old, _utc_reservation_end=old + timedelta(hours=1)))
+    db.session.commit()
+    return item.id
+
+
+def test_archive_moves_only_finished_rows_in_batches(app, fresh_db):
+    with app.app_context():
+        _populate()
+        moved = archive_history(older_than_days=180, batch_size=2)
+
+        assert moved == {'records': 5, 'reservations': 3}
+        assert {r.status for r in Record.query} == {'using', 'returned'} and Record.query.count() == 2
+        assert [r.status for r in Reservation.query] == ['scheduled']
+        assert RecordArchive.query.count() == 5
+        assert ReservationArchive.query.filter_by(status='used').one().notes == '备注' * 40
+        # 再次执行没有可归档的数据
+        assert archive_history(older_than_days=180) == {'records': 0, 'reservations': 0}
+
+        # 归档后的主键不会被新记录复用
+        max_id = db.session.query(db.func.max(RecordArchive.id)).scalar()
+        Record.query.filter(Record.status == 'returned').delete()
+        db.session.add(Record(item_id=1, user_id=1, status='using'))
+        db.session.commit()
+        assert Record.query.filter_by(status='using').order_by(Record.id.desc()).first().id > max_id
+
+
+def test_history_pages_read_hot_and_archived_rows(app, fresh_db):
+    with app.app_context():
+        item_id = _populate()
+        archive_history(older_than_days=180)
+
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'pw'})
+    html = client.get(f'/records/item/{item_id}').get_data(as_text=True)
+    assert '旧地点0' in html and '旧地点4' in html
+    assert client.get('/records/my?status=returned').status_code == 200
+    html = client.get('/reservations/all?status=used').get_data(as_text=True)
+    assert '备注' * 25 + '...' in html
+    assert client.get('/reservations/my').status_code == 200
+
+    # 归档的记录仍可删除；删除物品时一并清理归档数据
+    with app.app_context():
+        archived_id = RecordArchive.query.first().id
+    client.post(f'/records/delete/{archived_id}')
+    with app.app_context():
+        assert RecordArchive.query.get(archived_id) is None
+    client.post(f'/items/delete/{item_id}')
+    with app.app_context():
+        assert RecordArchive.query.count() == 0 and ReservationArchive.query.count() == 0
+
+
+def test_archived_records_stay_in_global_search(app, fresh_db):
+    from app.search import fts_available, rebuild_search_index, search_fts
+
+    def documents():
+        return db.session.query(search_fts.c.ref_id).filter(search_fts.c.kind == 'record').count()
+
+    with app.app_context():
+        _populate()
+        assert fts_available() and documents() == 7
+        archive_history(older_than_days=180)
+        # 归档不删除文档（归档行沿用原主键）
+        assert documents() == 7
+        assert rebuild_search_index() == 7 + 1 + 1  # 记录（含归档）+ 物品 + 空间
+        db.session.commit()
+
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'pw'})
+    html = client.get('/search?query=旧地点').get_data(as_text=True)
+    assert all(f'旧地点{i}' in html for i in range(5))
+
+    # 删除归档记录时清理其文档
+    with app.app_context():
+        archived_id = RecordArchive.query.order_by(RecordArchive.id).first().id
+    client.post(f'/records/delete/{archived_id}')
+    with app.app_context():
+        assert documents() == 6
+    assert '旧地点0' not in client.get('/search?query=旧地点').get_data(as_text=True)
+
+    # 删除物品时批量清理归档记录，同时清理其文档（不留下计入总数的孤立文档）
+    with app.app_context():
+        item_id = Item.query.first().id
+    client.post(f'/items/delete/{item_id}')
+    with app.app_context():
+        assert RecordArchive.query.count() == 0 and documents() == 0
+    assert '共找到 0 个匹配项' in client.get('/search?query=旧地点').get_data(as_text=True)
@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta
+
+import pytz
+
+from app import db
+from app.models import Space, Item, Record, Reservation, User
+
+LOCAL_TIMEZONE = pytz.timezone('Asia/Shanghai')
+
+
+def _utc(local_naive):
+    return LOCAL_TIMEZONE.localize(local_naive).astimezone(pytz.utc).replace(tzinfo=None)
+
+
+def _populate(extra_items=0):
+    admin = User(username='admin', email='admin@example.com', role='admin')
+    admin.set_password('pw')
+    building = Space(name='一号楼')
+    db.session.add_all([admin, building])
+    db.session.flush()
+    room = Space(name='实验室', parent=building)
+    db.session.add(room)
+    db.session.flush()
+    items = [Item(name='示波器', serial_number='OSC-1', space_id=building.id),
+             Item(name='万用表', serial_number='DMM-1', space_id=room.id)]
+    items += [Item(name=f'物品{i}', serial_number=f'SN-{i}', space_id=room.id) for i in range(extra_items)]
+    db.session.add_all(items)
+    db.session.commit()
+    return admin.id, building.id, [item.id for item in items[:2]]
+
+
+def _client(app):
+    client = app.test_client(app)
+    client.post('/auth/login', data={'username': 'admin', 'password': 'pw'})
+    return client
+
+
+def _tomorrow():
+    return datetime.now(LOCAL_TIMEZONE).date() + timedelta(days=1)
+
+
+def test_busy_and_free_intervals_for_item(app, fresh_db):
+    with app.app_context():
+        user_id, _, (item_id, _) = _populate()
+        day = _tomorrow()
+        db.session.add(Reservation(item_id=item_id, user_id=user_id, status='scheduled',
+                                   _utc_reservation_start=_utc(datetime(day.year, day.month, day.day, 10)),
+                                   _utc_reservation_end=_utc(datetime(day.year, day.month, day.day, 12))))
+        db.session.commit()
+
+    data = _client(app).get(f'/reservations/availability.json?item_id={item_id}&start={day}&days=1').get_json()
+    (item,) = data['items']
+    assert item['busy'] == [{'start': f'{day}T10:00', 'end': f'{day}T12:00', 'kind': 'reservation',
+                             'status': 'scheduled'}]
+    next_day = day + timedelta(days=1)
+    assert item['free'] == [{'start': f'{day}T00:00', 'end': f'{day}T10:00'},
+                            {'start': f'{day}T12:00', 'end': f'{next_day}T00:00'}]
+
+
+def test_multi_day_reservation_and_open_record(app, fresh_db):
+    with app.app_context():
+        user_id, building_id, (first_id, second_id) = _populate()
+        day = _tomorrow()
+        db.session.add(Reservation(item_id=first_id, user_id=user_id, status='active',
+                                   _utc_reservation_start=_utc(datetime(day.year, day.month, day.day, 20)),
+                                   _utc_reservation_end=_utc(datetime(day.year, day.month, day.day, 8)
+                                                             + timedelta(days=1))))
+        # 未归还的记录：一直占用到查询范围结束
+        db.session.add(Record(item_id=second_id, user_id=user_id, status='using',
+                              _utc_start_time=datetime.utcnow() - timedelta(days=3)))
+        db.session.commit()
+
+    data = _client(app).get(f'/reservations/availability.json?space_id={building_id}&start={day}&days=3').get_json()
+    by_name = {item['name']: item for item in data['items']}
+    assert set(by_name) == {'示波器', '万用表'}  # 包含子空间内的物品
+    assert by_name['示波器']['busy'] == [{'start': f'{day}T20:00', 'end': f'{day + timedelta(days=1)}T08:00',
+                                          'kind': 'reservation', 'status': 'active'}]
+    assert by_name['万用表']['free'] == []
+    assert by_name['万用表']['busy'][0]['end'] == data['end']
+
+
+def test_cached_days_skip_queries_until_invalidated(app, fresh_db, count_queries):
+    with app.app_context():
+        user_id, _, (item_id, _) = _populate()
+    client = _client(app)
+    url = f'/reservations/availability.json?item_id={item_id}&days=7'
+    assert len(client.get(url).get_json()['items'][0]['free']) == 1
+
+    with count_queries() as statements:
+        client.get(url)
+    assert not any('FROM reservation' in s or 'FROM record' in s for s in statements)
+
+    # 预约提交后缓存失效
+    with app.app_context():
+        start = datetime.utcnow() + timedelta(days=2)
+        db.session.add(Reservation(item_id=item_id, user_id=user_id, status='scheduled',
+                                   _utc_reservation_start=start,
+                                   _utc_reservation_end=start + timedelta(hours=1)))
+        db.session.commit()
+    assert len(client.get(url).get_json()['items'][0]['free']) == 2
+
+
+def test_week_view_for_many_items_uses_few_queries(app, fresh_db, count_queries):
+    with app.app_context():
+        user_id, building_id, _ = _populate(extra_items=500)
+        items = Item.query.all()
+        start = datetime.utcnow() + timedelta(days=1)
+        for i, item in enumerate(items[:300]):
+            db.session.add(Reservation(item_id=item.id, user_id=user_id, status='scheduled',
+                                       _utc_reservation_start=start + timedelta(hours=i % 48),
+                                       _utc_reservation_end=start + timedelta(hours=i % 48 + 2)))
+        db.session.commit()
+
+    client = _client(app)
+    with count_queries() as statements:
+        data = client.get(f'/reservations/availability.json?space_id={building_id}&days=7').get_json()
+    assert len(data['items']) == 502
+    assert sum(len(item['busy']) for item in data['items']) == 300
+    assert len([s for s in statements if 'FROM reservation' in s or 'FROM record' in s]) == 2
+
+
+def test_invalid_parameters(app, fresh_db):
+    with app.app_context():
+        _populate()
+    client = _client(app)
+    assert client.get('/reservations/availability.json').status_code == 400
+    assert client.get('/reservations/availability.json?item_id=1&start=2026-13-01').status_code == 400
+    assert client.get('/reservations/availability.json?item_id=1&days=90').status_code == 400
+    assert client.get('/reservations/availability.json?item_id=999').status_code == 404
+
+
+def test_create_interprets_form_times_as_local(app, fresh_db):
+    with app.app_context():
+        _, _, (item_id, _) = _populate()
+    day = _tomorrow()
+    response = _client(app).post(f'/reservations/create/{item_id}', data={
+        'reservation_start': f'{day}T09:00', 'reservation_end': f'{day}T10:00', 'notes': ''})
+    assert response.status_code == 302
+    with app.app_context():
+        reservation = Reservation.query.one()
+        assert reservation._utc_reservation_start == _utc(datetime(day.year, day.month, day.day, 9))
@@ -0,0 +1,107 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta
+
+from app import db
+from app.models import Space, Item, Record, Reservation, User
+from app import exporter
+
+
+def _populate():
+    admin = User(username='admin', email='admin@example.com', role='admin')
+    admin.set_password('secret')
+    alice = User(username='alice', email='alice@example.com')
+    space = Space(name='实验室')
+    db.session.add_all([admin, alice, space])
+    db.session.flush()
+    items = [Item(name=f'示波器{i}', serial_number=f'OSC-{i}', function='测量,"波形"\n多行',
+                  status='borrowed' if i % 2 else 'available', space_id=space.id) for i in range(5)]
+    db.session.add_all(items)
+    db.session.flush()
+    start = datetime(2025, 1, 1, 8, 0)
+    for i, item in enumerate(items):
+        db.session.add(Record(item_id=item.id, user_id=alice.id, status='returned',
+                              _utc_start_time=start + timedelta(days=i), _utc_return_time=start + timedelta(days=i, hours=2)))
+        db.session.add(Reservation(item_id=item.id, user_id=alice.id, status='scheduled' if i % 2 else 'used',
+                                   _utc_reservation_start=start + timedelta(days=i),
+                                   _utc_reservation_end=start + timedelta(days=i, hours=1)))
+    db.session.commit()
+
+
+def test_csv_export_applies_list_filters(app, fresh_db):
+    with app.app_context():
+        _populate()
+        body = b''.join(exporter.iter_export('items', 'csv', {'status': 'borrowed'}))
+
+    rows = list(csv.DictReader(io.StringIO(body.decode('utf-8-sig'))))
+    assert [row['serial_number'] for row in rows] == ['OSC-1', 'OSC-3']
+    assert rows[0]['function'] == '测量,"波形"\n多行'
+    assert rows[0]['space_path'] == '实验室'
+
+
+def test_jsonl_export_uses_local_time_and_streams_in_chunks(app, fresh_db):
+    with app.app_context():
+        _populate()
+        chunk_size = exporter.CHUNK_SIZE
+        exporter.CHUNK_SIZE = 1
+        try:
+            chunks = list(exporter.iter_export('records', 'jsonl', {'username': 'ali'}))
+        finally:
+            exporter.CHUNK_SIZE = chunk_size
+
+    assert len(chunks) > 5
+    rows = [json.loads(line) for line in b''.join(chunks).decode('utf-8').splitlines()]
+    assert len(rows) == 5
+    # 按开始时间倒序；UTC 08:00 对应北京时间 16:00
+    assert rows[-1]['start_time'] == '2025-01-01 16:00:00'
+    assert rows[-1]['username'] == 'alice'
+
+
+def test_export_endpoint_gzip_and_permissions(app, fresh_db):
+    with app.app_context():
+        _populate()
+
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'secret'})
+    response = client.get('/reservations/export?format=csv&gzip=1&status=scheduled')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/gzip'
+    assert '.csv.gz' in response.headers['Content-Disposition']
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(response.data).decode('utf-8-sig'))))
+    assert len(rows) == 2 and {row['status'] for row in rows} == {'scheduled'}
+
+    client.get('/auth/logout')
+    with app.app_context():
+        alice = User.query.filter_by(username='alice').one()
+        alice.set_password('secret')
+        db.session.commit()
+    client.post('/auth/login', data={'username': 'alice', 'password': 'secret'})
+    assert client.get('/records/export').status_code == 302
+
+
+def test_export_includes_archived_history(app, fresh_db):
+    from app.archive import archive_history
+    from app.models import RecordArchive
+
+    with app.app_context():
+        _populate()
+        Reservation.query.filter_by(status='used').update({'notes': '长备注' * 40})
+        db.session.commit()
+        moved = archive_history(older_than_days=30)
+        assert moved == {'records': 5, 'reservations': 3}
+        assert Record.query.count() == 0 and RecordArchive.query.count() == 5
+
+        records = list(exporter.iter_export_rows('records', {'username': 'alice'}))
+        reservations = list(exporter.iter_export_rows('reservations', {}))
+
+    # 与列表页一致：热表 + 归档表，按开始时间倒序
+    assert [row['id'] for row in records] == [5, 4, 3, 2, 1]
+    assert records[0]['item_name'] == '示波器4' and records[0]['status'] == 'returned'
+    assert len(reservations) == 5
+    assert {row['status'] for row in reservations} == {'scheduled', 'used'}
+    # 归档预约导出完整备注，而不是列表页的摘要
+    assert {row['notes'] for row in reservations if row['status'] == 'used'} == {'长备注' * 40}
+    assert [row['reservation_start'] for row in reservations] == sorted(
+        (row['reservation_start'] for row in reservations), reverse=True)
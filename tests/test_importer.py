@@ -0,0 +1,177 @@
+import io
+
+from app import db
+from app.models import Space, Item
+from app.importer import import_items, read_rows, ItemImportError
+from app.space_tree import bump_space_version
+
+
+def _populate():
+    building = Space(name='A栋')
+    db.session.add(building)
+    db.session.flush()
+    db.session.add(Space(name='3楼', parent_id=building.id))
+    db.session.add(Item(name='旧示波器', serial_number='OSC-001', space_id=building.id))
+    db.session.commit()
+    bump_space_version()
+
+
+def _rows(text, filename='items.csv'):
+    return read_rows(io.BytesIO(text.encode('utf-8-sig')), filename)
+
+
+CSV = (
+    '名称,编号,功能,空间路径\n'
+    '万用表,DMM-001,测量电压,A栋/3楼\n'
+    '电烙铁,SLD-001,,A栋 / 3楼 / 301\n'
+    '\n'
+    '信号源,SIG-001,产生波形,B栋/1楼\n'
+)
+
+
+def test_dry_run_reports_new_spaces_without_writing(app, fresh_db):
+    with app.app_context():
+        _populate()
+        report = import_items(_rows(CSV), dry_run=True)
+
+        assert report.ok and report.total == 3
+        assert report.new_space_paths == ['B栋', 'B栋/1楼', 'A栋/3楼/301']
+        assert Item.query.count() == 1
+        assert Space.query.count() == 2
+
+
+def test_validation_errors_abort_whole_import(app, fresh_db):
+    with app.app_context():
+        _populate()
+        text = (
+            'name,serial_number,space_path,status\n'
+            '万用表,DMM-001,A栋/3楼,available\n'
+            '万用表2,DMM-001,A栋/3楼,available\n'
+            '示波器,OSC-001,A栋,lost\n'
+            ',X-1,C栋,available\n'
+        )
+        report = import_items(_rows(text), create_spaces=False)
+
+        assert [line for line, _ in report.errors] == [3, 4, 4, 5, 5]
+        assert '与第 2 行重复' in report.errors[0][1]
+        assert Item.query.count() == 1
+
+
+def test_import_creates_spaces_and_items_in_batches(app, fresh_db):
+    with app.app_context():
+        _populate()
+        report = import_items(_rows(CSV), batch_size=2)
+
+        assert report.ok and report.created_items == 3 and report.created_spaces == 3
+        assert len(report.item_ids) == 3
+        room = Space.query.filter_by(full_path='A栋/3楼/301').one()
+        assert room.level == 2
+        assert Item.query.filter_by(serial_number='SLD-001').one().space_id == room.id
+        assert Item.query.filter_by(serial_number='SIG-001').one().space.get_path() == 'B栋/1楼'
+        # 计数器由会话事件维护
+        assert Space.query.filter_by(full_path='A栋').one().subtree_item_count == 3
+
+
+def test_missing_columns_and_unsupported_files(app, fresh_db):
+    with app.app_context():
+        _populate()
+        for rows in (_rows('name,serial_number\nX,1\n'), _rows('a,b', 'items.txt')):
+            try:
+                list(rows)
+            except ItemImportError:
+                pass
+            else:
+                raise AssertionError('应当抛出 ItemImportError')
+
+
+def test_admin_upload_dry_run(app, fresh_db):
+    from app.models import User
+
+    with app.app_context():
+        _populate()
+        admin = User(username='admin', email='admin@example.com', role='admin')
+        admin.set_password('secret')
+        db.session.add(admin)
+        db.session.commit()
+
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'secret'})
+    response = client.post('/items/import', data={
+        'file': (io.BytesIO(CSV.encode('utf-8')), 'items.csv'),
+        'dry_run': 'y', 'create_spaces': 'y',
+    }, content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    assert '校验通过' in response.get_data(as_text=True)
+    with app.app_context():
+        assert Item.query.count() == 1
+
+
+def test_space_paths_resolved_from_database_not_process_cache(app, fresh_db):
+    from app.space_tree import get_cached_space_choices
+
+    with app.app_context():
+        _populate()
+        get_cached_space_choices()
+        # 模拟其他进程的改动：不调用 bump_space_version，本进程的空间树缓存仍是旧的
+        other = Space(name='C栋')
+        db.session.add(other)
+        db.session.delete(Space.query.filter_by(full_path='A栋/3楼').one())
+        db.session.commit()
+
+        text = 'name,serial_number,space_path\n投影仪,PRJ-001,C栋\n万用表,DMM-001,A栋/3楼\n'
+        report = import_items(_rows(text))
+
+        assert report.ok and report.new_space_paths == ['A栋/3楼'] and report.created_spaces == 1
+        assert Space.query.filter_by(full_path='C栋').count() == 1
+        assert Item.query.filter_by(serial_number='PRJ-001').one().space_id == other.id
+        assert Item.query.filter_by(serial_number='DMM-001').one().space.full_path == 'A栋/3楼'
+
+
+def test_failed_batch_is_rolled_back_and_reported(app, fresh_db):
+    from app import importer
+
+    original = importer.validate_rows
+
+    def validate_then_insert_concurrently(rows, create_spaces=True):
+        report = original(rows, create_spaces=create_spaces)
+        # 校验通过后，其他请求写入了相同编号（落在第 2 批）
+        db.session.add(Item(name='抢先写入', serial_number='SLD-001', space_id=Space.query.first().id))
+        db.session.commit()
+        return report
+
+    with app.app_context():
+        _populate()
+        importer.validate_rows = validate_then_insert_concurrently
+        try:
+            report = import_items(_rows(CSV), batch_size=1)
+        finally:
+            importer.validate_rows = original
+
+        assert report.committed_lines == [2, 5]
+        assert [line for line, _ in report.failed] == [3]
+        assert report.created_items == 2 and sorted(report.item_ids) == report.item_ids
+        assert '部分导入' in report.summary() and '1 行' in report.summary()
+        assert Item.query.filter_by(serial_number='SLD-001').one().name == '抢先写入'
+        assert Item.query.filter(Item.serial_number.in_(['DMM-001', 'SIG-001'])).count() == 2
+
+
+def test_ambiguous_space_paths_are_reported_per_line(app, fresh_db):
+    with app.app_context():
+        _populate()
+        building = Space.query.filter_by(full_path='A栋').one()
+        # 同一上级下的同名空间：路径相同
+        db.session.add(Space(name='3楼', parent_id=building.id))
+        db.session.commit()
+
+        text = (
+            'name,serial_number,space_path\n'
+            '万用表,DMM-001,A栋/3楼\n'
+            '电烙铁,SLD-001,A栋/3楼/301\n'
+            '信号源,SIG-001,A栋\n'
+        )
+        report = import_items(_rows(text))
+
+        assert [line for line, _ in report.errors] == [2, 3]
+        assert all('A栋/3楼 对应多个同名空间' in message for _, message in report.errors)
+        assert Item.query.count() == 1 and Space.query.count() == 3
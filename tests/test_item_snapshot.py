@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models import User, Space, Item, Record, Reservation
+from app.item_snapshot import get_item_snapshot
+
+
+@pytest.fixture(scope='module')
+def app(app):
+    app.config['ITEM_SNAPSHOT_TTL'] = 60
+    return app
+
+
+def _populate():
+    alice = User(username='alice', email='alice@example.com')
+    bob = User(username='bob', email='bob@example.com')
+    alice.set_password('pw')
+    space = Space(name='器材室')
+    db.session.add_all([alice, bob, space])
+    db.session.commit()
+    item = Item(name='万用表', serial_number='DMM-1', space_id=space.id, status='reserved')
+    db.session.add(item)
+    db.session.commit()
+
+    now = datetime.utcnow()
+    db.session.add_all([
+        Record(item_id=item.id, user_id=bob.id, status='returned',
+               _utc_start_time=now - timedelta(days=d), _utc_return_time=now - timedelta(days=d) + timedelta(hours=1))
+        for d in range(1, 8)
+    ])
+    db.session.add(Reservation(item_id=item.id, user_id=alice.id, status='active',
+                               _utc_reservation_start=now - timedelta(hours=1),
+                               _utc_reservation_end=now + timedelta(hours=1)))
+    db.session.commit()
+    return item.id, alice.id, bob.id
+
+
+def test_snapshot_is_one_query_and_invalidated_on_commit(app, fresh_db, count_queries):
+    with app.app_context():
+        item_id, alice_id, bob_id = _populate()
+
+        with count_queries() as statements:
+            snapshot = get_item_snapshot(item_id)
+        assert len(statements) == 1
+        assert snapshot.current_record is None
+        assert [r.username for r in snapshot.recent_records] == ['bob'] * 5
+        assert [r.username for r in snapshot.active_reservations()] == ['alice']
+        assert snapshot.has_active_reservation(alice_id) and not snapshot.has_active_reservation(bob_id)
+
+        # 缓存命中不再查询
+        with count_queries() as statements:
+            assert get_item_snapshot(item_id) is snapshot
+        assert statements == []
+
+        # 借用提交后快照立即失效
+        db.session.add(Record(item_id=item_id, user_id=alice_id, status='using'))
+        db.session.commit()
+        snapshot = get_item_snapshot(item_id)
+        assert snapshot.current_record.username == 'alice'
+        assert snapshot.recent_records[0].status == 'using'
+
+
+def test_item_view_uses_snapshot(app, fresh_db, count_queries):
+    with app.app_context():
+        item_id, _, _ = _populate()
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'alice', 'password': 'pw'})
+    client.get(f'/items/{item_id}')
+
+    # 用户 + 物品（含空间），快照走缓存
+    with count_queries() as statements:
+        html = client.get(f'/items/{item_id}').get_data(as_text=True)
+    assert len(statements) == 2
+    assert '当前生效的预约' in html and '立即使用 (预约)' in html
@@ -0,0 +1,200 @@
+from datetime import datetime, timedelta
+
+from app import db, mail
+from app.models import Space, Item, Record, Reservation, User, NotificationLog
+from app.notifications import claim, notification_stats, reservation_version, retry_notifications
+from app.overdue import send_overdue_digests
+from app.reservation_timeline import timeline, run_due_events
+
+
+def _populate():
+    admin = User(username='admin', email='admin@example.com', role='admin')
+    alice = User(username='alice', email='alice@example.com')
+    space = Space(name='实验室')
+    db.session.add_all([admin, alice, space])
+    db.session.flush()
+    item = Item(name='示波器', serial_number='OSC-1', space_id=space.id)
+    db.session.add(item)
+    db.session.commit()
+    return alice.id, item.id
+
+
+def _refuse_mail():
+    def refuse():
+        raise ConnectionRefusedError('SMTP 不可用')
+
+    original, mail.connect = mail.connect, refuse
+    return original
+
+
+def test_claim_is_idempotent(app, fresh_db):
+    with app.app_context():
+        _populate()
+        first = claim('reservation', 1, 'remind', 'scheduled@2026-10-18T08:00', 'a@example.com')
+        assert first is not None
+        assert claim('reservation', 1, 'remind', 'scheduled@2026-10-18T08:00', 'a@example.com') is None
+        # 状态版本不同视为新的通知
+        assert claim('reservation', 1, 'remind', 'scheduled@2026-10-19T08:00', 'a@example.com') is not None
+        db.session.commit()
+        assert NotificationLog.query.count() == 2
+
+
+def test_reminder_survives_restarts_without_duplicates(app, fresh_db, join_mail_threads):
+    with app.app_context():
+        user_id, item_id = _populate()
+        timeline.enabled, timeline.on_change = True, None
+        now = datetime.utcnow()
+        db.session.add(Reservation(item_id=item_id, user_id=user_id, status='scheduled',
+                                   _utc_reservation_start=now + timedelta(hours=11, minutes=30),
+                                   _utc_reservation_end=now + timedelta(hours=13)))
+        db.session.commit()
+        try:
+            with mail.record_messages() as outbox:
+                # 模拟重启 / 手动重建：每次重建都会重新安排开始前提醒
+                for _ in range(3):
+                    timeline.rebuild()
+                    run_due_events()
+                    join_mail_threads()
+        finally:
+            timeline.enabled = False
+        assert len(outbox) == 1
+        log = NotificationLog.query.one()
+        assert (log.subject_type, log.notification_type, log.status) == ('reservation', 'remind', 'sent')
+
+
+def test_overdue_reminders_once_per_day(app, fresh_db, join_mail_threads):
+    with app.app_context():
+        user_id, item_id = _populate()
+        db.session.add(Record(item_id=item_id, user_id=user_id, status='using',
+                              _utc_start_time=datetime.utcnow() - timedelta(days=30)))
+        db.session.commit()
+        with mail.record_messages() as outbox:
+            send_overdue_digests()
+            join_mail_threads()
+            send_overdue_digests()
+            join_mail_threads()
+        assert len(outbox) == 2  # 借用人汇总 + 管理员总览，第二次运行不再发送
+
+        with mail.record_messages() as outbox:
+            send_overdue_digests(datetime.utcnow() + timedelta(days=1))
+            join_mail_threads()
+        assert len(outbox) == 2
+
+        stats = notification_stats()
+        assert stats['overdue'] == {'pending': 0, 'sent': 2, 'failed': 0}
+        assert stats['overdue_summary']['sent'] == 2
+
+
+def test_failed_delivery_is_recorded(app, fresh_db, join_mail_threads):
+    with app.app_context():
+        user_id, item_id = _populate()
+        db.session.add(Record(item_id=item_id, user_id=user_id, status='using',
+                              _utc_start_time=datetime.utcnow() - timedelta(days=30)))
+        db.session.commit()
+
+        original = _refuse_mail()
+        try:
+            send_overdue_digests()
+            join_mail_threads()
+        finally:
+            mail.connect = original
+        db.session.expire_all()
+        assert {log.status for log in NotificationLog.query} == {'failed'}
+        assert 'SMTP' in NotificationLog.query.first().error
+        # 重试阶段重新领取失败的台账行并发送，之后不再重复发送
+        with mail.record_messages() as outbox:
+            retry_notifications()
+            join_mail_threads()
+            retry_notifications()
+            send_overdue_digests()
+            join_mail_threads()
+        assert len(outbox) == 2
+        db.session.expire_all()
+        assert {(log.status, log.attempts) for log in NotificationLog.query} == {('sent', 2)}
+
+
+def test_failed_reminder_is_delivered_exactly_once_by_a_later_tick(app, fresh_db, join_mail_threads):
+    with app.app_context():
+        user_id, item_id = _populate()
+        timeline.enabled, timeline.on_change = True, None
+        now = datetime.utcnow()
+        db.session.add(Reservation(item_id=item_id, user_id=user_id, status='scheduled',
+                                   _utc_reservation_start=now + timedelta(hours=11, minutes=30),
+                                   _utc_reservation_end=now + timedelta(hours=13)))
+        db.session.commit()
+        original = _refuse_mail()
+        try:
+            run_due_events()
+            join_mail_threads()
+        finally:
+            mail.connect = original
+            timeline.enabled = False
+        db.session.expire_all()
+        assert NotificationLog.query.one().status == 'failed'
+
+        with mail.record_messages() as outbox:
+            for _ in range(3):
+                retry_notifications()
+                join_mail_threads()
+        assert len(outbox) == 1
+        db.session.expire_all()
+        log = NotificationLog.query.one()
+        assert (log.status, log.attempts, log.error) == ('sent', 2, None)
+
+
+def test_retry_stops_after_max_attempts_and_skips_outdated_versions(app, fresh_db, join_mail_threads):
+    with app.app_context():
+        user_id, item_id = _populate()
+        now = datetime.utcnow()
+        res = Reservation(item_id=item_id, user_id=user_id, status='scheduled',
+                          _utc_reservation_start=now + timedelta(hours=1),
+                          _utc_reservation_end=now + timedelta(hours=2))
+        db.session.add(res)
+        db.session.commit()
+        version = reservation_version(res)
+        log_id = claim('reservation', res.id, 'remind', version, 'alice@example.com')
+        db.session.commit()
+
+        original = _refuse_mail()
+        try:
+            NotificationLog.query.filter_by(id=log_id).update({'status': 'failed'})
+            db.session.commit()
+            for _ in range(app.config['NOTIFICATION_MAX_ATTEMPTS'] + 2):
+                retry_notifications()
+                join_mail_threads()
+        finally:
+            mail.connect = original
+        db.session.expire_all()
+        log = db.session.get(NotificationLog, log_id)
+        assert (log.status, log.attempts) == ('failed', app.config['NOTIFICATION_MAX_ATTEMPTS'])
+        assert claim('reservation', res.id, 'remind', version, 'alice@example.com') is None
+
+        # 预约时段已变化：旧版本的失败通知不再重发，也不会登记新版本
+        log.attempts = 1
+        res._utc_reservation_start = now + timedelta(hours=1, minutes=30)
+        db.session.commit()
+        with mail.record_messages() as outbox:
+            retry_notifications()
+            join_mail_threads()
+        assert outbox == []
+        assert NotificationLog.query.count() == 1
+
+
+def test_stale_pending_claim_is_taken_back_once(app, fresh_db):
+    with app.app_context():
+        _populate()
+        key = ('reservation', 1, 'remind', 'scheduled@2026-10-18T08:00', 'a@example.com')
+        log_id = claim(*key)
+        db.session.commit()
+        # 刚领取、仍在发送中的通知不能被重新领取
+        assert claim(*key) is None
+
+        # 发送进程中途退出：超时仍为 pending，只有第一个重新领取的调用成功
+        timeout = app.config['NOTIFICATION_PENDING_TIMEOUT_MINUTES']
+        NotificationLog.query.filter_by(id=log_id).update(
+            {NotificationLog._utc_claimed_at: datetime.utcnow() - timedelta(minutes=timeout + 1)})
+        db.session.commit()
+        assert claim(*key) == log_id
+        assert claim(*key) is None
+        db.session.commit()
+        assert db.session.get(NotificationLog, log_id).attempts == 2
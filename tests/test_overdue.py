@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+from app import db, mail
+from app.models import Space, Item, Record, User
+from app.overdue import find_overdue_digests, send_overdue_digests
+
+
+def _populate():
+    admin = User(username='admin', email='admin@example.com', role='admin')
+    alice = User(username='alice', email='alice@example.com')
+    bob = User(username='bob', email='bob@example.com')
+    space = Space(name='实验室')
+    db.session.add_all([admin, alice, bob, space])
+    db.session.flush()
+    items = [Item(name=f'物品{i}', serial_number=f'SN-{i}', space_id=space.id, status='borrowed') for i in range(5)]
+    db.session.add_all(items)
+    db.session.flush()
+
+    now = datetime.utcnow()
+    db.session.add_all([
+        # alice 两件逾期，bob 一件逾期
+        Record(item_id=items[0].id, user_id=alice.id, status='using', _utc_start_time=now - timedelta(days=30)),
+        Record(item_id=items[1].id, user_id=alice.id, status='using', _utc_start_time=now - timedelta(days=12)),
+        Record(item_id=items[2].id, user_id=bob.id, status='using', _utc_start_time=now - timedelta(days=11)),
+        # 未到阈值 / 已归还的不算逾期
+        Record(item_id=items[3].id, user_id=bob.id, status='using', _utc_start_time=now - timedelta(days=8)),
+        Record(item_id=items[4].id, user_id=admin.id, status='returned', _utc_start_time=now - timedelta(days=40),
+               _utc_return_time=now - timedelta(days=35)),
+    ])
+    db.session.commit()
+
+
+def test_overdue_records_grouped_by_user(app, fresh_db):
+    with app.app_context():
+        _populate()
+        digests = find_overdue_digests()
+
+        assert [(d.username, [e.item_name for e in d.entries]) for d in digests] == [
+            ('alice', ['物品0', '物品1']), ('bob', ['物品2'])]
+        assert digests[0].entries[0].overdue_days == 20
+
+
+def test_threshold_comes_from_config(app, fresh_db):
+    with app.app_context():
+        _populate()
+        app.config['OVERDUE_DAYS'] = 7
+        try:
+            assert sum(len(d.entries) for d in find_overdue_digests()) == 4
+            assert Record.query.filter_by(item_id=4).one().is_overdue()
+        finally:
+            app.config['OVERDUE_DAYS'] = 10
+        assert not Record.query.filter_by(item_id=4).one().is_overdue()
+
+
+def test_one_digest_per_user_and_admin_summary(app, fresh_db):
+    with app.app_context():
+        _populate()
+        with mail.record_messages() as outbox:
+            digests, thread = send_overdue_digests()
+            thread.join()
+
+        assert len(digests) == 2
+        by_recipient = {tuple(msg.recipients): msg for msg in outbox}
+        assert len(outbox) == 3
+        assert '物品0' in by_recipient[('alice@example.com',)].html
+        assert '物品1' in by_recipient[('alice@example.com',)].html
+        assert '物品0' not in by_recipient[('bob@example.com',)].html
+        summary = by_recipient[('admin@example.com',)]
+        assert '共 3 件' in summary.subject and 'alice' in summary.html and 'bob' in summary.html
+
+
+def test_no_overdue_records_sends_nothing(app, fresh_db):
+    with app.app_context():
+        with mail.record_messages() as outbox:
+            digests, thread = send_overdue_digests()
+        assert digests == [] and thread is None and outbox == []
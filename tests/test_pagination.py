@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+
+from app import db
+from app.models import Space, Item, Record
+from app.pagination import KeysetPagination, encode_cursor, decode_cursor
+
+
+KEYS = [(Record._utc_start_time, 'desc'), (Record.id, 'desc')]
+
+
+def test_cursor_round_trip():
+    start = datetime(2025, 1, 2, 3, 4, 5, 678)
+    assert decode_cursor(encode_cursor('next', [start, 42])) == ('next', [start, 42])
+    assert decode_cursor('not-a-cursor') == (None, None)
+
+
+def test_keyset_pages_cover_every_row_in_order_both_ways(app, fresh_db):
+    with app.app_context():
+        space = Space(name='仓库')
+        db.session.add(space)
+        db.session.commit()
+        item = Item(name='投影仪', serial_number='P-1', space_id=space.id)
+        db.session.add(item)
+        db.session.commit()
+
+        base = datetime(2025, 1, 1)
+        # 每 3 条记录共享同一开始时间，验证 ID 兜底排序
+        db.session.add_all([
+            Record(item_id=item.id, _utc_start_time=base + timedelta(hours=i // 3), status='returned')
+            for i in range(23)
+        ])
+        db.session.commit()
+        expected = [r.id for r in Record.query.order_by(Record._utc_start_time.desc(), Record.id.desc())]
+
+        pages, cursor = [], None
+        while True:
+            pagination = KeysetPagination(Record.query, KEYS, 5, cursor=cursor)
+            pages.append(pagination)
+            if not pagination.has_next:
+                break
+            cursor = pagination.next_cursor
+        assert [r.id for p in pages for r in p.items] == expected
+        assert not pages[0].has_prev and pages[-1].has_prev
+
+        # 从最后一页逐页向前翻，结果应与向后翻一致
+        backwards, cursor = [], pages[-1].prev_cursor
+        while cursor:
+            pagination = KeysetPagination(Record.query, KEYS, 5, cursor=cursor)
+            backwards.insert(0, [r.id for r in pagination.items])
+            cursor = pagination.prev_cursor
+        assert backwards == [[r.id for r in p.items] for p in pages[:-1]]
@@ -0,0 +1,185 @@
+import os
+import tempfile
+import time
+
+import pytest
+
+from app import db
+from app.models import Space, Item, User
+from app import qrcodes
+
+
+@pytest.fixture(scope='module')
+def app(app):
+    app.static_folder = tempfile.mkdtemp(prefix='qrcodes-test-')
+    app.config['QR_CODE_BASE_URL'] = 'http://qr.example.com'
+    return app
+
+
+def _populate(count):
+    space = Space(name='仓库')
+    db.session.add(space)
+    db.session.commit()
+    items = [Item(name=f'标签机{i}', serial_number=f'LBL-{i}', space_id=space.id) for i in range(count)]
+    db.session.add_all(items)
+    db.session.commit()
+    return [item.id for item in items]
+
+
+def test_qrcode_is_content_addressed_and_reused(app, fresh_db):
+    with app.app_context():
+        item_id = _populate(1)[0]
+        relpath = qrcodes.ensure_item_qrcode(item_id)
+        digest = qrcodes.qrcode_digest('http://qr.example.com/items/%d' % item_id)
+        assert relpath == f'qrcodes/{digest[:2]}/{digest[2:4]}/{digest}.png'
+
+        full_path = os.path.join(app.static_folder, relpath)
+        mtime = os.stat(full_path).st_mtime_ns
+        rendered = []
+        original = qrcodes.render_qrcode_png
+        qrcodes.render_qrcode_png = lambda *args: rendered.append(args) or original(*args)
+        try:
+            assert qrcodes.ensure_item_qrcode(item_id) == relpath
+        finally:
+            qrcodes.render_qrcode_png = original
+        assert rendered == [] and os.stat(full_path).st_mtime_ns == mtime
+
+        # 渲染参数不同则生成新文件
+        other = qrcodes.qrcode_digest('http://qr.example.com/items/%d' % item_id, dict(qrcodes.QR_RENDER_PARAMS, box_size=4))
+        assert other != digest
+
+
+def test_batch_generation_in_process_pool_and_background_job(app, fresh_db):
+    app.config.update(QR_BATCH_PARALLEL_MIN=2, QR_BATCH_WORKERS=2)
+    app.static_folder = tempfile.mkdtemp(prefix='qrcodes-test-')
+    with app.app_context():
+        ids = _populate(6)
+        progress = []
+        paths = qrcodes.generate_item_qrcodes(ids[:3], progress=lambda done, total: progress.append((done, total)))
+        assert progress[0] == (0, 3) and progress[-1] == (3, 3)
+        assert all(os.path.getsize(os.path.join(app.static_folder, p)) > 0 for p in paths.values())
+
+        job_id = qrcodes.start_qrcode_job(ids)
+        for _ in range(200):
+            job = qrcodes.get_qrcode_job(job_id)
+            if job['status'] != 'running':
+                break
+            time.sleep(0.05)
+        # 前 3 个已存在，只渲染剩余 3 个
+        assert job['status'] == 'finished' and job['total'] == 3 and job['done'] == 3
+
+        db.session.expire_all()
+        assert all(item.barcode_path == qrcodes.ensure_item_qrcode(item.id) for item in Item.query)
+
+
+def test_streaming_zip_uses_stored_entries_and_backfills_once(app, fresh_db):
+    import io
+    import zipfile
+
+    app.static_folder = tempfile.mkdtemp(prefix='qrcodes-test-')
+    with app.app_context():
+        ids = _populate(3)
+        # 历史平铺路径（带 static 前缀和 Windows 分隔符）仍可读取
+        legacy = os.path.join(app.static_folder, 'qrcodes', 'legacy.png')
+        os.makedirs(os.path.dirname(legacy))
+        with open(legacy, 'wb') as f:
+            f.write(b'legacy-png')
+        first = db.session.get(Item, ids[0])
+        first.barcode_path = 'static\\qrcodes\\legacy.png'
+        db.session.commit()
+
+        commits = []
+
+        def count_commit(session):
+            commits.append(session)
+
+        db.event.listen(db.session, 'after_commit', count_commit)
+        try:
+            chunks = list(qrcodes.iter_qrcode_zip(ids))
+        finally:
+            db.event.remove(db.session, 'after_commit', count_commit)
+
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+        assert archive.namelist() == ['标签机0_LBL-0.png', '标签机1_LBL-1.png', '标签机2_LBL-2.png']
+        assert all(info.compress_type == zipfile.ZIP_STORED for info in archive.infolist())
+        assert archive.read('标签机0_LBL-0.png') == b'legacy-png'
+        assert len(chunks) > 3 and len(commits) == 1
+
+        db.session.expire_all()
+        assert [item.barcode_path for item in Item.query.order_by(Item.id)] == \
+            ['static\\qrcodes\\legacy.png'] + [qrcodes.ensure_item_qrcode(item_id) for item_id in ids[1:]]
+
+
+def test_on_demand_qr_endpoint_sets_strong_etag_and_reuses_lru(app, fresh_db):
+    app.static_folder = tempfile.mkdtemp(prefix='qrcodes-test-')
+    with app.app_context():
+        item_id = _populate(1)[0]
+        user = User(username='alice', email='alice@example.com')
+        user.set_password('pw')
+        db.session.add(user)
+        db.session.commit()
+    url = f'/items/{item_id}/qr.png'
+    client = app.test_client()
+
+    # 未登录跳转登录页，不渲染
+    assert client.get(url).status_code == 302
+    client.post('/auth/login', data={'username': 'alice', 'password': 'pw'})
+    # 不存在的物品返回 404
+    assert client.get(f'/items/{item_id + 1}/qr.png').status_code == 404
+
+    response = client.get(url)
+    assert response.status_code == 200 and response.mimetype == 'image/png'
+    assert response.data.startswith(b'\x89PNG')
+    etag, weak = response.get_etag()
+    assert not weak and etag.startswith('png-')
+    assert 'private' in response.headers['Cache-Control'] and 'max-age=' in response.headers['Cache-Control']
+
+    # 条件请求：不渲染，直接 304
+    assert client.get(url, headers={'If-None-Match': f'"{etag}"'}).status_code == 304
+
+    # 重复请求命中进程内 LRU
+    rendered = []
+    original = qrcodes._RENDERERS['png']
+    qrcodes._RENDERERS['png'] = lambda *args: rendered.append(args) or original(*args)
+    try:
+        assert client.get(url).data == response.data
+    finally:
+        qrcodes._RENDERERS['png'] = original
+    assert rendered == []
+
+    svg = client.get(f'/items/{item_id}/qr.svg')
+    assert svg.mimetype == 'image/svg+xml' and b'<svg' in svg.data
+    assert svg.get_etag()[0] != etag
+
+
+def test_svg_mode_and_label_sheets_stream_page_by_page(app, fresh_db):
+    import io
+    import zipfile
+    from PIL import Image
+
+    app.static_folder = tempfile.mkdtemp(prefix='qrcodes-test-')
+    app.config.update(LABEL_SHEET_COLUMNS=2, LABEL_SHEET_ROWS=3, LABEL_SHEET_DPI=72)
+    with app.app_context():
+        ids = _populate(7)
+        relpath = qrcodes.ensure_item_qrcode(ids[0], fmt='svg')
+        assert relpath.endswith('.svg') and relpath[:-4] == qrcodes.ensure_item_qrcode(ids[0])[:-4]
+        with open(os.path.join(app.static_folder, relpath), 'rb') as f:
+            assert b'<svg' in f.read()
+
+        # 7 个标签，每页 6 个 -> 2 页
+        pages = list(qrcodes.iter_label_pages(ids))
+        assert len(pages) == 2 and pages[0].size == (595, 842)
+
+        pdf = b''.join(qrcodes.iter_label_sheet_pdf(ids))
+        assert pdf.startswith(b'%PDF-1.4') and pdf.rstrip().endswith(b'%%EOF')
+        assert b'/Count 2' in pdf and pdf.count(b'/Type /Page ') == 2
+        # 交叉引用表中的偏移量指向对应对象
+        xref = int(pdf.rsplit(b'startxref\n', 1)[1].split(b'\n')[0])
+        entries = pdf[xref:].split(b'\n')[3:]
+        for number, entry in enumerate(entries[:5], 1):
+            offset = int(entry[:10])
+            assert pdf[offset:].startswith(f'{number} 0 obj'.encode())
+
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(qrcodes.iter_label_sheet_png_zip(ids))))
+        assert archive.namelist() == ['labels_001.png', 'labels_002.png']
+        assert Image.open(io.BytesIO(archive.read('labels_002.png'))).size == (595, 842)
@@ -0,0 +1,98 @@
+import re
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models import User, Space, Item, Record, Reservation
+
+# 每个列表页允许的最大 SQL 条数（与每页行数无关）
+MAX_QUERIES = {
+    '/': 3,
+    '/items/': 2,
+    '/records/my': 2,
+    '/records/all': 2,
+    '/records/item/1': 5,
+    '/reservations/my': 3,
+    '/reservations/all': 2,
+    '/reservations/item/1': 4,
+    '/search?query=示波器': 7,
+}
+
+
+@pytest.fixture(scope='module')
+def app(app):
+    app.config['FLASKY_ADMIN'] = 'admin@example.com'
+    return app
+
+
+def _populate(rows):
+    users = [User(username=f'user{i}', email=f'user{i}@example.com', role='user') for i in range(rows)]
+    admin = User(username='admin', email='admin@example.com')
+    admin.set_password('pw')
+    db.session.add_all(users + [admin])
+    building = Space(name='实验楼')
+    db.session.add(building)
+    db.session.commit()
+    rooms = [Space(name=f'{i}号房间', parent_id=building.id) for i in range(rows)]
+    db.session.add_all(rooms)
+    db.session.commit()
+
+    now = datetime.utcnow()
+    items = [Item(name=f'示波器{i}', serial_number=f'OSC-{i}', function='测量' * 200, space_id=rooms[i].id)
+             for i in range(rows)]
+    db.session.add_all(items)
+    db.session.commit()
+    for i in range(rows):
+        # 管理员在每件物品上各有一条记录和预约；物品 1 另有每个用户的记录和预约
+        for item, user in ((items[i], admin), (items[0], users[i])):
+            db.session.add(Record(item_id=item.id, user_id=user.id, status='returned', _utc_return_time=now))
+            db.session.add(Reservation(item_id=item.id, user_id=user.id,
+                                       _utc_reservation_start=now + timedelta(hours=i + 1),
+                                       _utc_reservation_end=now + timedelta(hours=i + 2), status='active',
+                                       notes='备注' * 200))
+    db.session.commit()
+
+
+def _page_statements(app, count_queries, rows):
+    # 同一测试中以不同行数重新构造数据
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        _populate(rows)
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'pw'})
+    pages = {}
+    for url in MAX_QUERIES:
+        # 先请求一次，排除空间树等进程缓存的首次加载
+        client.get(url)
+        with count_queries() as statements:
+            response = client.get(url)
+        assert response.status_code == 200, url
+        pages[url] = statements
+    return pages
+
+
+def test_list_pages_issue_constant_number_of_queries(app, count_queries):
+    small = _page_statements(app, count_queries, 3)
+    large = _page_statements(app, count_queries, 20)
+    for url, limit in MAX_QUERIES.items():
+        assert len(large[url]) == len(small[url]), url
+        assert len(large[url]) <= limit, (url, len(large[url]))
+
+
+def test_list_pages_do_not_select_long_text_columns(app, count_queries):
+    # 列表页只允许出现 SQL 截取的摘要，不直接读取完整的 function / notes 列
+    # （分页 COUNT 的子查询会被 SQLite 展开，不实际读取列值，不计入）
+    full_column = re.compile(r'\b(function|notes) AS ')
+    for url, statements in _page_statements(app, count_queries, 3).items():
+        rows_statements = [statement for statement in statements if not statement.startswith('SELECT count(*)')]
+        assert not any(full_column.search(statement) for statement in rows_statements), url
+
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'pw'})
+    html = client.get('/reservations/all').get_data(as_text=True)
+    assert '备注' * 25 + '...' in html and '备注' * 26 not in html
+
+    # 详情页仍读取完整描述
+    assert '测量' * 200 in client.get('/items/1').get_data(as_text=True)
@@ -0,0 +1,117 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, or_
+
+from app import db
+from app.models import Space, Item, Record, Reservation, RecordHistory, ReservationHistory
+from app.overdue import overdue_cutoff
+from app.pagination import KeysetPagination, encode_cursor
+
+
+def _hot_queries():
+    """路由与定时任务中的热点查询（筛选条件与实际代码一致）"""
+    now = datetime.utcnow()
+    return {
+        'scheduler: scheduled': Reservation.query.filter_by(status='scheduled'),
+        'scheduler: conflicted': Reservation.query.filter_by(status='conflicted'),
+        'scheduler: active': Reservation.query.filter_by(status='active'),
+        'overdue check': Record.query.join(Item, Record.item_id == Item.id).filter(
+            Record.status == 'using', Record._utc_start_time < overdue_cutoff(now)
+        ).order_by(Record.user_id, Record._utc_start_time),
+        'all records by status': Record.query.filter(Record.status == 'returned').order_by(
+            Record._utc_start_time.desc(), Record.id.desc()).limit(16),
+        'item records': Record.query.filter_by(item_id=1).order_by(Record._utc_start_time.desc()).limit(11),
+        'my records': Record.query.filter_by(user_id=1).order_by(
+            Record._utc_start_time.desc(), Record.id.desc()).limit(11),
+        'reservation overlap': Reservation.query.filter_by(item_id=1).filter(
+            or_(Reservation.status == 'scheduled', Reservation.status == 'active',
+                Reservation.status == 'conflicted'),
+            Reservation._utc_reservation_start < now + timedelta(hours=2),
+            Reservation._utc_reservation_end > now
+        ),
+        'borrow: own reservation': Reservation.query.filter_by(item_id=1, user_id=1).filter(
+            Reservation.status.in_(['active', 'scheduled'])),
+        'items by status': Item.query.filter(Item.status == 'borrowed'),
+        'items in space': Item.query.filter(Item.space_id == 1),
+        'child spaces': Space.query.filter(Space.parent_id == 1),
+        # 历史列表：条件下推到热表和归档表两个分支
+        'record history by user': RecordHistory.query.filter(RecordHistory.user_id == 1).order_by(
+            RecordHistory._utc_start_time.desc(), RecordHistory.id.desc()).limit(11),
+        'reservation history by item': ReservationHistory.query.filter(ReservationHistory.item_id == 1).order_by(
+            ReservationHistory._utc_reservation_start.desc()).limit(11),
+    }
+
+
+def _query_plan(run):
+    """执行查询并捕获最后发出的 SQL（含展开后的参数），再对其执行 EXPLAIN QUERY PLAN"""
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        run()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+    statement, parameters = captured[-1]
+    rows = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)
+    return [row[-1] for row in rows]
+
+
+def test_hot_queries_use_indexes(app, fresh_db):
+    with app.app_context():
+
+        full_scans = {}
+        for name, query in _hot_queries().items():
+            plan = _query_plan(query.all)
+            scans = [step for step in plan if step.startswith('SCAN') and step != 'SCAN CONSTANT ROW']
+            if scans:
+                full_scans[name] = plan
+        assert not full_scans, full_scans
+
+
+def test_overdue_check_uses_partial_index(app, fresh_db):
+    with app.app_context():
+        plan = _query_plan(Record.query.filter(
+            Record.status == 'using', Record._utc_start_time < datetime.utcnow()).all)
+        assert any('ix_record_using_start_time' in step or 'ix_record_status_start_time' in step for step in plan)
+
+
+def _list_pages():
+    """不带筛选的历史列表首页与深翻页（与 records.all_records / reservations.all_reservations 的排序键一致）"""
+    record_keys = [(RecordHistory._utc_start_time, 'desc'), (RecordHistory.id, 'desc')]
+    reservation_keys = [(ReservationHistory._utc_reservation_start, 'desc'), (ReservationHistory.id, 'desc')]
+    boundary = datetime(2026, 1, 1)
+    return {
+        'all records': (RecordHistory.query, record_keys, None),
+        'all records, deep page': (RecordHistory.query, record_keys, encode_cursor('next', [boundary, 500])),
+        'all records, prev page': (RecordHistory.query, record_keys, encode_cursor('prev', [boundary, 500])),
+        'all reservations': (ReservationHistory.query, reservation_keys, None),
+        'all reservations, deep page': (
+            ReservationHistory.query, reservation_keys, encode_cursor('next', [boundary, 500])),
+    }
+
+
+def test_unfiltered_list_pages_follow_keyset_index(app, fresh_db):
+    """热表与归档表两个分支都按 (开始时间, ID) 索引顺序读取：没有全表扫描，也没有临时排序"""
+    with app.app_context():
+
+        bad_plans = {}
+        for name, (query, keys, cursor) in _list_pages().items():
+            plan = _query_plan(lambda: KeysetPagination(query, keys, 15, cursor=cursor))
+            unordered = [step for step in plan if step.startswith('SCAN') and 'USING' not in step
+                         and step != 'SCAN CONSTANT ROW']
+            if unordered or any('TEMP B-TREE' in step for step in plan):
+                bad_plans[name] = plan
+        assert not bad_plans, bad_plans
+
+
+def test_deep_page_seeks_to_cursor(app, fresh_db):
+    """深翻页在索引上直接定位到游标位置，而不是从头扫描到边界"""
+    with app.app_context():
+        for name, (query, keys, cursor) in _list_pages().items():
+            if cursor is None:
+                continue
+            plan = _query_plan(lambda: KeysetPagination(query, keys, 15, cursor=cursor))
+            assert not any(step.startswith('SCAN') for step in plan), (name, plan)
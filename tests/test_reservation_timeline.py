@@ -0,0 +1,318 @@
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app import create_app, db, mail
+from app.models import Space, Item, Record, Reservation, User, NotificationLog
+from app.reservation_timeline import timeline, run_due_events
+from config import config, TestingConfig
+
+@pytest.fixture(scope='module')
+def app():
+    # 通知在后台线程中回写发送结果：内存数据库只有一个共享连接，会与请求结束时的回滚互相干扰，这里使用临时文件数据库
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(db_fd)
+
+    class TimelineTestingConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + db_path
+
+    config['testing_timeline'] = TimelineTestingConfig
+    app = create_app('testing_timeline')
+    yield app
+    timeline.enabled = False
+    with app.app_context():
+        db.engine.dispose()
+    os.remove(db_path)
+
+
+def _populate():
+    admin = User(username='admin', email='admin@example.com', role='admin')
+    admin.set_password('pw')
+    space = Space(name='实验室')
+    db.session.add_all([admin, space])
+    db.session.flush()
+    items = [Item(name=f'物品{i}', serial_number=f'SN-{i}', space_id=space.id) for i in range(3)]
+    db.session.add_all(items)
+    db.session.commit()
+    return admin.id, [item.id for item in items]
+
+
+def _reserve(user_id, item_id, start, hours=2, status='scheduled'):
+    reservation = Reservation(item_id=item_id, user_id=user_id, status=status,
+                              _utc_reservation_start=start, _utc_reservation_end=start + timedelta(hours=hours))
+    db.session.add(reservation)
+    db.session.commit()
+    return reservation.id
+
+
+@pytest.fixture
+def tick(join_mail_threads):
+    """处理到期事件并等待通知发送完成"""
+    def run(now_utc=None):
+        run_due_events(now_utc)
+        join_mail_threads()
+
+    return run
+
+
+def _setup_timeline():
+    timeline.enabled = True
+    timeline.on_change = None
+    timeline.rebuild()
+
+
+def test_transitions_fire_at_due_time_and_touch_one_row(app, fresh_db, count_queries, tick):
+    with app.app_context():
+        user_id, item_ids = _populate()
+        _setup_timeline()
+        now = datetime.utcnow()
+        first = _reserve(user_id, item_ids[0], now + timedelta(hours=1))
+        _reserve(user_id, item_ids[1], now + timedelta(days=2))
+        assert timeline.next_due() <= now + timedelta(hours=1)
+
+        # 未到期：不读取任何预约
+        with count_queries() as statements:
+            assert run_due_events(now) == 1  # 仅第一条的开始前提醒（已不足 11 小时，不发送）
+            statements.clear()
+            run_due_events(now + timedelta(minutes=30))
+            assert statements == []
+
+            run_due_events(now + timedelta(hours=1, seconds=1))
+        assert db.session.get(Reservation, first).status == 'active'
+        assert db.session.get(Item, item_ids[0]).status == 'reserved'
+        assert not any('FROM reservation' in s and 'WHERE reservation.status' in s for s in statements)
+
+        # 超过预约结束时间：作废并释放物品
+        tick(now + timedelta(hours=3, seconds=1))
+        assert db.session.get(Reservation, first).status == 'expired'
+        assert db.session.get(Item, item_ids[0]).status == 'available'
+        assert len(timeline) == 1
+
+
+def test_reminder_sent_once_inside_window(app, fresh_db, join_mail_threads):
+    with app.app_context():
+        user_id, item_ids = _populate()
+        _setup_timeline()
+        now = datetime.utcnow()
+        _reserve(user_id, item_ids[0], now + timedelta(hours=20))
+        with mail.record_messages() as outbox:
+            run_due_events(now + timedelta(hours=8, minutes=30))
+            run_due_events(now + timedelta(hours=9))
+            join_mail_threads()
+        assert [msg.subject for msg in outbox] == [app.config['MAIL_SUBJECT_PREFIX'] + '预约即将开始']
+
+
+def test_conflict_resumes_when_item_returned(app, fresh_db, tick):
+    with app.app_context():
+        user_id, item_ids = _populate()
+        _setup_timeline()
+        now = datetime.utcnow()
+        item = db.session.get(Item, item_ids[0])
+        item.status = 'borrowed'
+        record = Record(item_id=item.id, user_id=user_id, status='using', _utc_start_time=now - timedelta(hours=1))
+        db.session.add(record)
+        db.session.commit()
+        reservation_id = _reserve(user_id, item.id, now + timedelta(minutes=1))
+
+        tick(now + timedelta(minutes=2))
+        assert db.session.get(Reservation, reservation_id).status == 'conflicted'
+
+        record.status, record._utc_return_time = 'returned', datetime.utcnow()
+        item.status = 'available'
+        db.session.commit()
+        tick()
+        assert db.session.get(Reservation, reservation_id).status == 'active'
+        assert db.session.get(Item, item.id).status == 'reserved'
+
+
+def test_cancel_and_delete_remove_pending_events(app, fresh_db):
+    with app.app_context():
+        user_id, item_ids = _populate()
+        _setup_timeline()
+        now = datetime.utcnow()
+        cancelled = _reserve(user_id, item_ids[0], now + timedelta(hours=1))
+        deleted = _reserve(user_id, item_ids[1], now + timedelta(hours=1))
+        assert len(timeline) == 2
+
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'pw'})
+    client.post(f'/reservations/cancel/{cancelled}')
+    client.post(f'/reservations/delete/{deleted}')
+
+    with app.app_context():
+        assert len(timeline) == 0
+        assert run_due_events(now + timedelta(hours=2)) == 0
+        assert db.session.get(Reservation, cancelled).status == 'cancelled'
+
+
+def test_tick_is_one_transaction_with_bulk_updates(app, fresh_db, count_queries, join_mail_threads):
+    with app.app_context():
+        user_id, _ = _populate()
+        space = Space.query.first()
+        items = [Item(name=f'批量{i}', serial_number=f'B-{i}', space_id=space.id) for i in range(40)]
+        db.session.add_all(items)
+        db.session.commit()
+        _setup_timeline()
+        now = datetime.utcnow()
+        for item in items[:30]:
+            _reserve(user_id, item.id, now + timedelta(minutes=1))
+        # 10 件已借出：对应预约应进入冲突
+        for item in items[30:]:
+            item.status = 'borrowed'
+            db.session.add(Record(item_id=item.id, user_id=user_id, status='using', _utc_start_time=now))
+        db.session.commit()
+        for item in items[30:]:
+            _reserve(user_id, item.id, now + timedelta(minutes=1))
+
+        with count_queries() as statements, mail.record_messages() as outbox:
+            count_commit = lambda session: statements.append('COMMIT')
+            event.listen(db.session, 'after_commit', count_commit)
+            try:
+                run_due_events(now + timedelta(minutes=2))
+                join_mail_threads()
+            finally:
+                event.remove(db.session, 'after_commit', count_commit)
+
+        # 状态流转（预约、物品、空间计数器）全部在第一次提交之前完成；之后只有通知台账的登记与回写
+        first_commit = statements.index('COMMIT')
+        updates = [s for s in statements[:first_commit] if s.startswith('UPDATE')]
+        assert len(updates) <= 6, updates
+        assert not any(s.startswith(('UPDATE reservation', 'UPDATE item', 'UPDATE space'))
+                       for s in statements[first_commit:])
+        assert NotificationLog.query.filter_by(notification_type='conflict', status='sent').count() == 10
+        assert Reservation.query.filter_by(status='active').count() == 30
+        assert Reservation.query.filter_by(status='conflicted').count() == 10
+        assert len(outbox) == 10
+
+        # 批量 SQL 同步维护空间计数器
+        counts = (space.item_count, space.available_count, space.borrowed_count, space.reserved_count)
+        Space.rebuild_item_counts()
+        db.session.refresh(space)
+        assert counts == (space.item_count, space.available_count, space.borrowed_count, space.reserved_count)
+        assert space.reserved_count == 30
+
+
+def test_expired_reservation_hands_item_to_next_in_same_tick(app, fresh_db, tick):
+    with app.app_context():
+        user_id, item_ids = _populate()
+        _setup_timeline()
+        now = datetime.utcnow()
+        first = _reserve(user_id, item_ids[0], now + timedelta(minutes=1), hours=1)
+        tick(now + timedelta(minutes=2))
+        assert db.session.get(Reservation, first).status == 'active'
+
+        second = _reserve(user_id, item_ids[0], now + timedelta(hours=1, minutes=1), hours=1)
+        tick(now + timedelta(hours=1, minutes=2))
+        assert db.session.get(Reservation, first).status == 'expired'
+        assert db.session.get(Reservation, second).status == 'active'
+        assert db.session.get(Item, item_ids[0]).status == 'reserved'
+
+
+def _waiting_reservation(user_id, item_id, status):
+    now = datetime.utcnow()
+    return _reserve(user_id, item_id, now - timedelta(minutes=5), status=status)
+
+
+def test_return_hands_item_to_conflicted_reservation_immediately(app, fresh_db, join_mail_threads):
+    with app.app_context():
+        user_id, item_ids = _populate()
+        item = db.session.get(Item, item_ids[0])
+        item.status = 'borrowed'
+        record = Record(item_id=item.id, user_id=user_id, status='using',
+                        _utc_start_time=datetime.utcnow() - timedelta(days=1))
+        db.session.add(record)
+        db.session.commit()
+        record_id = record.id
+        waiting = _waiting_reservation(user_id, item.id, 'conflicted')
+
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'pw'})
+    with mail.record_messages() as outbox:
+        client.post(f'/records/return/{record_id}')
+        join_mail_threads()
+
+    with app.app_context():
+        # 无需等待调度器：归还的同一事务中预约生效、物品锁定
+        assert db.session.get(Reservation, waiting).status == 'active'
+        assert db.session.get(Item, item_ids[0]).status == 'reserved'
+        assert [msg.subject for msg in outbox] == [app.config['MAIL_SUBJECT_PREFIX'] + '预约物品已可借用']
+        assert NotificationLog.query.filter_by(subject_id=waiting, notification_type='handed_off').count() == 1
+
+
+def test_cancel_and_delete_hand_item_to_due_reservation(app, fresh_db, join_mail_threads):
+    with app.app_context():
+        user_id, item_ids = _populate()
+        now = datetime.utcnow()
+        holders, waiting = [], []
+        for item_id in item_ids[:2]:
+            holders.append(_reserve(user_id, item_id, now - timedelta(hours=1), hours=1, status='active'))
+            waiting.append(_waiting_reservation(user_id, item_id, 'scheduled'))
+            db.session.get(Item, item_id).status = 'reserved'
+        db.session.commit()
+
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'pw'})
+    client.post(f'/reservations/cancel/{holders[0]}')
+    client.post(f'/reservations/delete/{holders[1]}')
+    join_mail_threads()
+
+    with app.app_context():
+        assert [db.session.get(Reservation, rid).status for rid in waiting] == ['active', 'active']
+        assert [db.session.get(Item, item_id).status for item_id in item_ids[:2]] == ['reserved', 'reserved']
+
+
+def test_release_without_waiting_reservation_keeps_item_available(app, fresh_db):
+    with app.app_context():
+        user_id, item_ids = _populate()
+        holder = _reserve(user_id, item_ids[0], datetime.utcnow() - timedelta(minutes=5), status='active')
+        # 尚未开始的预约不能提前占用物品
+        _reserve(user_id, item_ids[0], datetime.utcnow() + timedelta(hours=3))
+        db.session.get(Item, item_ids[0]).status = 'reserved'
+        db.session.commit()
+
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'pw'})
+    client.post(f'/reservations/cancel/{holder}')
+
+    with app.app_context():
+        assert db.session.get(Item, item_ids[0]).status == 'available'
+        assert Reservation.query.filter_by(status='scheduled').count() == 1
+
+def test_tick_only_applies_and_notifies_rows_its_updates_changed(app, fresh_db, tick):
+    from app.reservation_timeline import _Tick
+
+    with app.app_context():
+        user_id, item_ids = _populate()
+        _setup_timeline()
+        now = datetime.utcnow()
+        cancelled = _reserve(user_id, item_ids[0], now + timedelta(hours=1))
+        blocked = _reserve(user_id, item_ids[1], now + timedelta(hours=1))
+
+        original = _Tick._rows
+
+        def rows_then_concurrent_change(self, where, order_by=None):
+            rows = original(self, where, order_by)
+            # 查询之后：一条预约被取消，另一件物品被借走（守卫条件不再成立）
+            db.session.execute(Reservation.__table__.update().where(Reservation.__table__.c.id == cancelled)
+                               .values(status='cancelled'))
+            db.session.execute(Item.__table__.update().where(Item.__table__.c.id == item_ids[1])
+                               .values(status='borrowed'))
+            return rows
+
+        _Tick._rows = rows_then_concurrent_change
+        try:
+            tick(now + timedelta(hours=1, seconds=1))
+        finally:
+            _Tick._rows = original
+
+        # 被取消的预约不会生效，为其锁定的物品已撤销；物品被借走的预约标记为冲突
+        assert db.session.get(Reservation, cancelled).status == 'cancelled'
+        assert db.session.get(Item, item_ids[0]).status == 'available'
+        assert db.session.get(Reservation, blocked).status == 'conflicted'
+        space = Space.query.one()
+        assert (space.available_count, space.reserved_count) == (3, 0)
+        # 只为实际发生的流转登记通知
+        assert [(log.subject_id, log.notification_type) for log in NotificationLog.query] == [(blocked, 'conflict')]
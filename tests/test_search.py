@@ -0,0 +1,201 @@
+from app import db
+from app.models import Space, Item
+from app.search import build_match_expression, filter_by_search, fts_available, rebuild_search_index
+
+
+def _search(query):
+    return [item.name for item in filter_by_search(Item.query, 'item', query, ranked=True).all()]
+
+
+def test_match_expression_segments_cjk_and_escapes_syntax():
+    assert build_match_expression('示波器') == '"示 波 器"*'
+    assert build_match_expression('IT-2025 投影') == '"IT 2025"* "投 影"*'
+    assert build_match_expression('" OR *') == '"OR"*'
+    assert build_match_expression('" * -') is None
+
+
+def test_fts_index_follows_orm_changes_and_ranks_by_bm25(app, fresh_db):
+    with app.app_context():
+        assert fts_available()
+        space = Space(name='实验室')
+        db.session.add(space)
+        db.session.commit()
+
+        scope = Item(name='数字示波器', serial_number='OSC-001', function='用于测量电压波形', space_id=space.id)
+        meter = Item(name='万用表', serial_number='DMM-002', function='可配合示波器使用', space_id=space.id)
+        db.session.add_all([scope, meter])
+        db.session.commit()
+
+        # 中文片段命中，名称匹配排在仅描述匹配之前
+        assert _search('示波') == ['数字示波器', '万用表']
+        assert _search('osc') == ['数字示波器']
+
+        meter.name = '台式万用表'
+        db.session.commit()
+        assert _search('台式') == ['台式万用表']
+
+        db.session.delete(scope)
+        db.session.commit()
+        assert _search('数字') == []
+
+        assert rebuild_search_index() == 2  # 1 个物品 + 1 个空间
+        db.session.commit()
+        assert _search('万用') == ['台式万用表']
+
+
+def _search_client(app, item_count=25):
+    from app.models import User
+
+    with app.app_context():
+        user = User(username='alice', email='alice@example.com')
+        user.set_password('pw')
+        space = Space(name='仓库')
+        db.session.add_all([user, space])
+        db.session.flush()
+        # 名称相同、相关度相同：翻页顺序完全由游标中的 ID 决定
+        db.session.add_all([Item(name='示波器', serial_number=f'OSC-{i:03d}', space_id=space.id)
+                            for i in range(item_count)])
+        db.session.commit()
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'alice', 'password': 'pw'})
+    return client
+
+
+def _serials(html):
+    import re
+    return re.findall(r'OSC-\d{3}', html)
+
+
+def test_global_search_caps_each_category_and_pages_with_cursor(app, fresh_db):
+    import html as html_lib
+    import re
+
+    original = {key: app.config[key] for key in ('GLOBAL_SEARCH_PER_CATEGORY', 'GLOBAL_SEARCH_COUNT_CAP')}
+    app.config.update(GLOBAL_SEARCH_PER_CATEGORY=10, GLOBAL_SEARCH_COUNT_CAP=20)
+    try:
+        client = _search_client(app)
+        page = client.get('/search?query=示波器').get_data(as_text=True)
+
+        seen = _serials(page)
+        assert len(seen) == 10
+        # 总数只统计到上限
+        assert '20+' in page
+        cursor = html_lib.unescape(re.search(r'data-cursor="([^"]+)"', page).group(1))
+        rank, last_id = cursor.rsplit(':', 1)
+        float(rank)
+        assert int(last_id) == 10
+
+        # 按游标翻页，直到没有下一页
+        requests = 0
+        while cursor:
+            response = client.get('/search/more/items', query_string={'query': '示波器', 'cursor': cursor})
+            assert response.status_code == 200 and 'X-Search-Timeout' not in response.headers
+            seen += _serials(response.get_data(as_text=True))
+            cursor = response.headers['X-Next-Cursor']
+            requests += 1
+        assert requests == 2
+        assert seen == [f'OSC-{i:03d}' for i in range(25)]
+    finally:
+        app.config.update(original)
+
+
+def test_global_search_rejects_short_queries_and_bad_categories(app, fresh_db):
+    client = _search_client(app, item_count=1)
+    assert '关键词过短' in client.get('/search?query=a').get_data(as_text=True)
+    assert client.get('/search/more/items?query=a').status_code == 400
+    assert client.get('/search/more/users?query=示波器').status_code == 404
+    # 无法解析的游标从第一页开始
+    response = client.get('/search/more/items', query_string={'query': '示波器', 'cursor': 'bogus'})
+    assert _serials(response.get_data(as_text=True)) == ['OSC-000']
+
+
+def test_query_time_budget_interrupts_slow_queries(app, fresh_db):
+    from app.search import query_time_budget, SearchTimeout
+
+    with app.app_context():
+        slow = db.text('WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT count(*) FROM n')
+        try:
+            with query_time_budget(0.01):
+                db.session.execute(slow).scalar()
+        except SearchTimeout:
+            pass
+        else:
+            raise AssertionError('应当抛出 SearchTimeout')
+        # 超时后进度回调已移除，后续查询不受影响
+        assert db.session.execute(db.text('SELECT 1')).scalar() == 1
+
+
+def test_global_search_reports_timeouts(app, fresh_db):
+    from contextlib import contextmanager
+    from app.routes import main
+    from app.search import SearchTimeout
+
+    @contextmanager
+    def exhausted_budget(seconds):
+        raise SearchTimeout()
+        yield
+
+    client = _search_client(app, item_count=15)
+    original = main.query_time_budget
+    main.query_time_budget = exhausted_budget
+    try:
+        page = client.get('/search?query=示波器').get_data(as_text=True)
+        assert '检索超时，未能完成对' in page and '未找到' not in page
+        assert page.count('检索超时，未能完成该分类的搜索') == 3
+
+        response = client.get('/search/more/items', query_string={'query': '示波器', 'cursor': '0.5:3'})
+        assert response.headers['X-Search-Timeout'] == '1'
+        # 原样返回游标，前端可重试
+        assert response.headers['X-Next-Cursor'] == '0.5:3'
+    finally:
+        main.query_time_budget = original
+
+
+def test_space_search_subtree_excludes_siblings_and_prefers_closer_spaces(app, fresh_db):
+    import re
+    from app.models import User
+
+    with app.app_context():
+        user = User(username='alice', email='alice@example.com')
+        user.set_password('pw')
+        building, other = Space(name='A栋'), Space(name='B栋')
+        db.session.add_all([user, building, other])
+        db.session.flush()
+        floor = Space(name='3楼', parent_id=building.id)
+        db.session.add(floor)
+        db.session.flush()
+        room = Space(name='301', parent_id=floor.id)
+        db.session.add(room)
+        db.session.flush()
+        # 同名物品相关度相同；ID 顺序与空间层级相反
+        db.session.add_all([
+            Item(name='示波器', serial_number='SN-ROOM', space_id=room.id),
+            Item(name='示波器', serial_number='SN-FLOOR', space_id=floor.id),
+            Item(name='示波器', serial_number='SN-BUILDING', space_id=building.id),
+            Item(name='示波器', serial_number='SN-OTHER', space_id=other.id),
+            Item(name='万用表', serial_number='SN-METER', space_id=room.id),
+        ])
+        db.session.commit()
+        building_id, floor_id = building.id, floor.id
+
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'alice', 'password': 'pw'})
+
+    def serials(response):
+        assert response.status_code == 200
+        return re.findall(r'SN-[A-Z]+', response.get_data(as_text=True))
+
+    # 子树搜索：包含所有子孙空间，不包含兄弟子树；同分时按层级（离本空间越近越靠前）
+    assert serials(client.get(f'/spaces/search/{building_id}?query=示波器&subtree=1')) == \
+        ['SN-BUILDING', 'SN-FLOOR', 'SN-ROOM']
+    assert serials(client.get(f'/spaces/search/{floor_id}?query=示波器&subtree=1')) == ['SN-FLOOR', 'SN-ROOM']
+    # 不带 subtree 只搜索直属物品
+    assert serials(client.get(f'/spaces/search/{building_id}?query=示波器')) == ['SN-BUILDING']
+
+    # 表单 POST 与 GET 参数一致
+    assert serials(client.post(f'/spaces/search/{building_id}', data={'query': '示波器', 'subtree': 'on'})) == \
+        ['SN-BUILDING', 'SN-FLOOR', 'SN-ROOM']
+    assert serials(client.post(f'/spaces/search/{building_id}', data={'query': '万用'})) == []
+    # 空关键词回到空间页
+    response = client.post(f'/spaces/search/{building_id}', data={'query': '  '})
+    assert response.status_code == 302 and response.location.endswith(f'/spaces/view/{building_id}')
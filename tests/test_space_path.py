@@ -0,0 +1,266 @@
+from app import db
+from app.models import Space, SPACE_COUNTER_COLUMNS
+
+
+def test_space_path_maintained_on_create_rename_and_move(app, fresh_db):
+    with app.app_context():
+        building = Space(name='A栋')
+        db.session.add(building)
+        db.session.commit()
+
+        floor = Space(name='3楼', parent_id=building.id)
+        db.session.add(floor)
+        db.session.commit()
+
+        room = Space(name='301', parent_id=floor.id)
+        db.session.add(room)
+        db.session.commit()
+
+        assert room.full_path == 'A栋/3楼/301'
+        assert room.level == 2
+        assert room.get_ancestor_ids() == [building.id, floor.id]
+        assert building.get_subtree_ids() == [building.id, floor.id, room.id]
+
+        # 重命名祖先：子孙路径同步更新
+        building.name = 'B栋'
+        db.session.commit()
+        assert room.get_path() == 'B栋/3楼/301'
+
+        # 移动到新的顶级空间下
+        other = Space(name='仓库')
+        db.session.add(other)
+        db.session.commit()
+        floor.parent_id = other.id
+        db.session.commit()
+
+        db.session.expire_all()
+        room = db.session.get(Space, room.id)
+        assert room.get_path() == '仓库/3楼/301'
+        assert room.get_level() == 2
+        assert room.get_ancestor_ids() == [other.id, floor.id]
+        assert building.get_subtree_ids() == [building.id]
+
+
+def test_rebuild_paths_repairs_drift(app, fresh_db):
+    with app.app_context():
+        root = Space(name='Root')
+        db.session.add(root)
+        db.session.commit()
+        child = Space(name='Child', parent_id=root.id)
+        db.session.add(child)
+        db.session.commit()
+
+        db.session.execute(db.text("UPDATE space SET full_path = NULL, ancestry = NULL"))
+        db.session.commit()
+        db.session.expire_all()
+
+        assert Space.rebuild_paths() == 2
+        db.session.commit()
+        child = db.session.get(Space, child.id)
+        assert child.full_path == 'Root/Child'
+        assert child.ancestry == f'/{root.id}/'
+
+
+def test_space_tree_cache_single_query_and_invalidation(app, fresh_db):
+    from app.space_tree import get_cached_hierarchy, bump_space_version
+    from sqlalchemy import event
+
+    with app.app_context():
+        root = Space(name='Root')
+        db.session.add(root)
+        db.session.commit()
+        db.session.add_all([Space(name=f'Room{i}', parent_id=root.id) for i in range(5)])
+        db.session.commit()
+        bump_space_version()
+
+        statements = []
+
+        def count(*args):
+            statements.append(args)
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            tree = get_cached_hierarchy()
+            assert len(tree) == 1 and len(tree[0]['children']) == 5
+            assert len(statements) == 1
+            get_cached_hierarchy()
+            assert len(statements) == 1
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+
+        db.session.add(Space(name='Room5', parent_id=root.id))
+        db.session.commit()
+        bump_space_version()
+        assert len(get_cached_hierarchy()[0]['children']) == 6
+
+
+def test_item_counters_follow_create_move_status_and_delete(app, fresh_db):
+    from app.models import Item
+
+    with app.app_context():
+        building = Space(name='A栋')
+        db.session.add(building)
+        db.session.commit()
+        room1 = Space(name='101', parent_id=building.id)
+        room2 = Space(name='102', parent_id=building.id)
+        db.session.add_all([room1, room2])
+        db.session.commit()
+
+        items = [Item(name=f'物品{i}', serial_number=f'SN{i}', space_id=room1.id) for i in range(3)]
+        db.session.add_all(items)
+        db.session.commit()
+        assert (room1.item_count, room1.available_count) == (3, 3)
+        assert building.subtree_item_count == 3 and building.item_count == 0
+
+        items[0].status = 'borrowed'
+        items[1].space_id = room2.id
+        db.session.commit()
+        assert (room1.item_count, room1.borrowed_count, room1.available_count) == (2, 1, 1)
+        assert room2.item_count == 1
+        assert (building.subtree_available_count, building.subtree_borrowed_count) == (2, 1)
+
+        db.session.delete(items[2])
+        db.session.commit()
+        assert building.subtree_item_count == 2
+
+        db.session.execute(db.text("UPDATE space SET subtree_item_count = 99"))
+        db.session.commit()
+        Space.rebuild_item_counts()
+        db.session.commit()
+        assert building.subtree_item_count == 2
+        assert room2.subtree_item_count == 1
+
+
+def test_moving_populated_space_moves_subtree_counts_between_ancestor_chains(app, fresh_db):
+    from app.models import Item
+
+    with app.app_context():
+        a, b = Space(name='A栋'), Space(name='B栋')
+        db.session.add_all([a, b])
+        db.session.commit()
+        a3, b1 = Space(name='3楼', parent_id=a.id), Space(name='1楼', parent_id=b.id)
+        db.session.add_all([a3, b1])
+        db.session.commit()
+        room = Space(name='301', parent_id=a3.id)
+        db.session.add(room)
+        db.session.commit()
+        shelf = Space(name='货架', parent_id=room.id)
+        db.session.add(shelf)
+        db.session.commit()
+        db.session.add_all([Item(name='物品1', serial_number='SN1', space_id=room.id),
+                            Item(name='物品2', serial_number='SN2', space_id=shelf.id, status='borrowed'),
+                            Item(name='物品3', serial_number='SN3', space_id=a3.id)])
+        db.session.commit()
+        assert (a.subtree_item_count, a3.subtree_item_count) == (3, 3)
+
+        # 移动 301（含子空间货架）到 B栋/1楼，同一次 flush 中再新增一个物品
+        room.parent_id = b1.id
+        db.session.add(Item(name='物品4', serial_number='SN4', space_id=shelf.id))
+        db.session.commit()
+        assert room.full_path == 'B栋/1楼/301'
+        assert (a.subtree_item_count, a3.subtree_item_count, a3.subtree_borrowed_count) == (1, 1, 0)
+        assert (b.subtree_item_count, b1.subtree_item_count) == (3, 3)
+        assert (b.subtree_available_count, b.subtree_borrowed_count) == (2, 1)
+        assert (room.subtree_item_count, shelf.subtree_item_count) == (3, 2)
+
+        # 移动到同一建筑内的另一层：公共祖先不变
+        room.parent_id = b.id
+        db.session.commit()
+        assert (b.subtree_item_count, b1.subtree_item_count) == (3, 0)
+
+        expected = {space.id: [getattr(space, column) for column in SPACE_COUNTER_COLUMNS]
+                    for space in Space.query}
+        Space.rebuild_item_counts()
+        db.session.commit()
+        assert expected == {space.id: [getattr(space, column) for column in SPACE_COUNTER_COLUMNS]
+                            for space in Space.query}
+
+
+def _path_tree():
+    from app.space_tree import bump_space_version
+
+    a, b = Space(name='A栋'), Space(name='B栋')
+    db.session.add_all([a, b])
+    db.session.flush()
+    floor3, floor4 = Space(name='3楼', parent_id=a.id), Space(name='4楼', parent_id=a.id)
+    db.session.add_all([floor3, floor4, Space(name='301', parent_id=b.id)])
+    db.session.flush()
+    db.session.add_all([Space(name='302', parent_id=floor3.id), Space(name='301', parent_id=floor3.id)])
+    db.session.commit()
+    bump_space_version()
+
+
+def test_search_space_paths_prefix_then_name_fallback(app, fresh_db):
+    from app.space_tree import search_space_paths
+
+    with app.app_context():
+        _path_tree()
+
+        def paths(query, limit=20):
+            return [path for _, path in search_space_paths(query, limit=limit)]
+
+        # 完整路径前缀：二分定位后按路径顺序连续读取
+        assert paths('A栋/3楼') == ['A栋/3楼', 'A栋/3楼/301', 'A栋/3楼/302']
+        assert paths('A栋/3楼/30', limit=1) == ['A栋/3楼/301']
+        # 没有路径前缀命中时按名称前缀补充
+        assert paths('30') == ['A栋/3楼/301', 'A栋/3楼/302', 'B栋/301']
+        # 路径前缀结果在前，名称前缀补足且不重复
+        assert paths('3') == ['A栋/3楼', 'A栋/3楼/301', 'A栋/3楼/302', 'B栋/301']
+        assert paths('A', limit=2) == ['A栋', 'A栋/3楼']
+        assert paths('  ') == [] and paths('C栋') == []
+
+
+def test_path_search_endpoint_shape_and_limit_cap(app, fresh_db):
+    from app.models import User
+    from app.space_tree import bump_space_version
+
+    with app.app_context():
+        _path_tree()
+        user = User(username='alice', email='alice@example.com')
+        user.set_password('pw')
+        db.session.add(user)
+        db.session.add_all([Space(name=f'R{i:02d}') for i in range(60)])
+        db.session.commit()
+        bump_space_version()
+        room_id = Space.query.filter_by(full_path='A栋/3楼/301').one().id
+
+    client = app.test_client()
+    assert client.get('/spaces/paths.json?q=A').status_code == 302
+    client.post('/auth/login', data={'username': 'alice', 'password': 'pw'})
+
+    data = client.get('/spaces/paths.json?q=A栋/3楼/301').get_json()
+    assert data == [{'id': room_id, 'path': 'A栋/3楼/301'}]
+    assert len(client.get('/spaces/paths.json?q=R&limit=5').get_json()) == 5
+    # limit 上限 50
+    assert len(client.get('/spaces/paths.json?q=R&limit=500').get_json()) == 50
+    assert client.get('/spaces/paths.json').get_json() == []
+
+
+def test_item_form_space_choices_come_from_cache_and_refresh_on_bump(app, fresh_db):
+    from app.forms.item_forms import ItemForm
+    from app.space_tree import bump_space_version, get_cached_space_choices
+
+    with app.app_context():
+        _path_tree()
+        with app.test_request_context():
+            form = ItemForm()
+            assert form.space_id.choices == get_cached_space_choices()
+            assert [path for _, path in form.space_id.choices][:3] == ['A栋', 'A栋/3楼', 'A栋/3楼/301']
+            assert not form.use_typeahead
+
+            # 未调用 bump_space_version 时仍使用缓存
+            db.session.add(Space(name='C栋'))
+            db.session.commit()
+            assert 'C栋' not in [path for _, path in ItemForm().space_id.choices]
+
+            bump_space_version()
+            assert 'C栋' in [path for _, path in ItemForm().space_id.choices]
+
+            # 空间过多时改用 typeahead，不内嵌选项
+            original = app.config.get('SPACE_CHOICES_MAX', 500)
+            app.config['SPACE_CHOICES_MAX'] = 3
+            try:
+                form = ItemForm()
+                assert form.use_typeahead and form.space_id.choices == []
+            finally:
+                app.config['SPACE_CHOICES_MAX'] = original